@@ -0,0 +1,200 @@
+import datetime, threading
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from utilities.logger import get_logger
+from utilities.ttl_cache import TTLCache
+from order_app.settings import DISTANCE_CACHE_BACKEND, DISTANCE_CACHE_TTL, DISTANCE_CACHE_MAX_SIZE, DISTANCE_CACHE_TOUCH_INTERVAL
+from order_app.models import get_session, utcnow, DistanceCache
+
+logger = get_logger('flask_order_app')
+
+
+def distance_cache_key(origin_lat, origin_lng, destination_lat, destination_lng, units):
+	"""
+	Normalize (origin, destination, units) into a cache key.
+	Coordinates are rounded to 6 decimals (~0.1 meter), so "59.4564" and "59.456400" share one key.
+	"""
+	return '%.6f,%.6f|%.6f,%.6f|%s' % (
+		float(origin_lat), float(origin_lng),
+		float(destination_lat), float(destination_lng), units.lower()
+	)
+
+
+class LocalDistanceCache():
+	"""
+	Distance cache in the memory of the uWSGI worker, with TTL and LRU eviction.
+	"""
+
+	def __init__(self, max_size=DISTANCE_CACHE_MAX_SIZE, ttl=DISTANCE_CACHE_TTL):
+		self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+	def get(self, key):
+		return self.cache.get(key)
+
+	def get_many(self, keys):
+		"""
+		Return dict of key -> distance of the keys found.
+		"""
+		distances = {}
+		for key in keys:
+			distance = self.cache.get(key)
+			if distance is not None:
+				distances[key] = distance
+		return distances
+
+	def set(self, key, distance):
+		self.cache.set(key, distance)
+
+	def set_many(self, distances):
+		for key, distance in distances.items():
+			self.cache.set(key, distance)
+
+	def stats(self):
+		return self.cache.stats()
+
+
+class DatabaseDistanceCache():
+	"""
+	Distance cache in the DistanceCache table, shared by all uWSGI workers, with TTL and LRU eviction.
+	updated_at is the last use of a row: written, or hit (touched at most once every touch_interval seconds,
+	so hot rows are not rewritten on every hit). Every prune_interval writes, expired rows are deleted,
+	and the least recently used rows beyond max_size are evicted.
+	Database errors are logged and count as misses, they never fail an order.
+	"""
+
+	def __init__(self, max_size=DISTANCE_CACHE_MAX_SIZE, ttl=DISTANCE_CACHE_TTL, prune_interval=100, touch_interval=DISTANCE_CACHE_TOUCH_INTERVAL):
+		self.max_size = max_size
+		self.ttl = ttl
+		self.touch_interval = touch_interval #seconds
+		self.prune_interval = prune_interval
+		self.hits = 0
+		self.misses = 0
+		self.writes = 0
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		return self.get_many([key]).get(key)
+
+	def get_many(self, keys):
+		"""
+		Return dict of key -> distance of the keys found, read with one query.
+		Rows not used for touch_interval seconds are touched with one more statement.
+		"""
+		distances = {}
+		keys = list(keys)
+		if not keys:
+			return distances
+		session = get_session()
+		try:
+			rows = session.query(
+				DistanceCache.key, DistanceCache.distance,
+				DistanceCache.updated_at < utcnow() - datetime.timedelta(seconds=self.touch_interval)
+			).filter(DistanceCache.key.in_(keys), DistanceCache.expires_at > utcnow()).all()
+			distances = dict((row[0], row[1]) for row in rows)
+			stale = sorted(row[0] for row in rows if row[2])
+			if stale:
+				self.touch(session, stale)
+		except Exception as e:
+			session.rollback()
+			logger.error("Distance cache lookup failed: %s." % (e,))
+		finally:
+			session.close()
+		with self._lock:
+			self.hits += len(distances)
+			self.misses += len(keys) - len(distances)
+		return distances
+
+	def set(self, key, distance):
+		self.set_many({key: distance})
+
+	def set_many(self, distances):
+		"""
+		Write dict of key -> distance with one multi-row upsert.
+		"""
+		if not distances:
+			return
+		session = get_session()
+		try:
+			expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl)
+			statement = insert(DistanceCache.__table__).values([
+				{'key': key, 'distance': distance, 'expires_at': expires_at} for key, distance in sorted(distances.items())
+			]) #sorted, so concurrent upserts lock rows in the same order
+			statement = statement.on_conflict_do_update(
+				index_elements=['key'],
+				set_={'distance': statement.excluded.distance, 'expires_at': statement.excluded.expires_at, 'updated_at': utcnow()}
+			)
+			session.execute(statement)
+			with self._lock:
+				prune = (self.writes + len(distances)) // self.prune_interval > self.writes // self.prune_interval
+				self.writes += len(distances)
+			if prune:
+				self.prune(session)
+			session.commit()
+		except Exception as e:
+			session.rollback()
+			logger.error("Distance cache write failed: %s." % (e,))
+		finally:
+			session.close()
+
+	def touch(self, session, keys):
+		"""
+		Mark rows of keys as used now, for LRU eviction.
+		"""
+		session.execute(update(DistanceCache.__table__).where(DistanceCache.key.in_(keys)).values(updated_at=utcnow()))
+		session.commit()
+
+	def prune(self, session):
+		"""
+		Delete expired rows, then the least recently used rows beyond max_size.
+		"""
+		session.query(DistanceCache).filter(DistanceCache.expires_at <= utcnow()).delete(synchronize_session=False)
+		overflow = session.query(DistanceCache.key).order_by(DistanceCache.updated_at.desc()).offset(self.max_size)
+		session.query(DistanceCache).filter(DistanceCache.key.in_(overflow.subquery())).delete(synchronize_session=False)
+		logger.info("Pruned distance cache table.")
+
+	def stats(self):
+		with self._lock:
+			return {'hits': self.hits, 'misses': self.misses, 'writes': self.writes}
+
+
+class NullDistanceCache():
+	"""
+	Distance cache that never hits, for DISTANCE_CACHE_BACKEND = 'none'.
+	"""
+
+	def get(self, key):
+		return None
+
+	def get_many(self, keys):
+		return {}
+
+	def set(self, key, distance):
+		pass
+
+	def set_many(self, distances):
+		pass
+
+	def stats(self):
+		return {}
+
+
+distance_cache_backends = {
+	'local': LocalDistanceCache,
+	'database': DatabaseDistanceCache,
+	'none': NullDistanceCache
+}
+
+_distance_cache = None
+_distance_cache_lock = threading.Lock()
+
+def get_distance_cache():
+	"""
+	Return the distance cache of this process, created on first use with DISTANCE_CACHE_BACKEND.
+	"""
+	global _distance_cache
+	if _distance_cache is None:
+		with _distance_cache_lock:
+			if _distance_cache is None:
+				_distance_cache = distance_cache_backends[DISTANCE_CACHE_BACKEND]()
+				logger.info("Created %s distance cache." % (DISTANCE_CACHE_BACKEND,))
+	return _distance_cache
@@ -0,0 +1,230 @@
+import random, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+from utilities.logger import get_logger
+from utilities.postfork import register_postfork
+from order_app import settings
+from order_app.metrics import GMAP_LATENCY, GMAP_ERRORS
+
+logger = get_logger('flask_order_app')
+
+
+class DistanceMatrixError(Exception):
+	"""Google Map Distance Matrix API answered, but without a distance."""
+
+
+class DistanceMatrixUnavailable(DistanceMatrixError):
+	"""Google Map Distance Matrix API timed out, failed, or the circuit breaker is open."""
+
+
+class CircuitBreaker():
+	"""
+	Fail fast while the upstream is degraded.
+	closed: requests pass, consecutive failures are counted.
+	open: after failure_threshold consecutive failures, requests are rejected for reset_timeout seconds.
+	half_open: after reset_timeout, one trial request passes, its success closes the breaker,
+		its failure opens it again.
+	"""
+
+	def __init__(self, failure_threshold, reset_timeout):
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.failures = 0
+		self.opened_at = None
+		self.trial_running = False
+		self._lock = threading.Lock()
+
+	@property
+	def state(self):
+		if self.opened_at is None:
+			return 'closed'
+		if time.monotonic() - self.opened_at >= self.reset_timeout:
+			return 'half_open'
+		return 'open'
+
+	def allow_request(self):
+		with self._lock:
+			state = self.state
+			if state == 'closed':
+				return True
+			if state == 'half_open' and not self.trial_running:
+				self.trial_running = True
+				return True
+			return False
+
+	def record_success(self):
+		with self._lock:
+			self.failures = 0
+			self.opened_at = None
+			self.trial_running = False
+
+	def record_failure(self):
+		with self._lock:
+			self.failures += 1
+			if self.trial_running or self.failures >= self.failure_threshold:
+				if self.opened_at is None:
+					logger.error("Circuit breaker opened after %s consecutive failures." % (self.failures,))
+				self.opened_at = time.monotonic()
+				self.trial_running = False
+
+
+class DistanceMatrixClient():
+	"""
+	Client of Google Map Distance Matrix API, one per uWSGI worker.
+	Keeps a pooled keep-alive requests.Session, with connect/read timeouts,
+	bounded retries with jittered exponential backoff, and a circuit breaker.
+	"""
+
+	#upstream answers worth retrying, the others fail immediately
+	retry_statuses = ('UNKNOWN_ERROR', 'OVER_QUERY_LIMIT')
+
+	def __init__(self, url=None, key=None,
+		connect_timeout=settings.GMAP_CONNECT_TIMEOUT, read_timeout=settings.GMAP_READ_TIMEOUT,
+		pool_maxsize=settings.GMAP_POOL_MAXSIZE, max_retries=settings.GMAP_MAX_RETRIES,
+		backoff_base=settings.GMAP_BACKOFF_BASE, backoff_max=settings.GMAP_BACKOFF_MAX,
+		breaker=None):
+		self.url = url or settings.GMAP_DISTANCE_MATRIX_API
+		self.key = key or settings.GMAP_TOKEN
+		self.timeout = (connect_timeout, read_timeout)
+		self.pool_maxsize = pool_maxsize
+		self.max_retries = max_retries
+		self.backoff_base = backoff_base
+		self.backoff_max = backoff_max
+		self.breaker = breaker or CircuitBreaker(
+			failure_threshold=settings.GMAP_BREAKER_FAILURE_THRESHOLD,
+			reset_timeout=settings.GMAP_BREAKER_RESET_TIMEOUT
+		)
+		self._session = None
+		self._session_lock = threading.Lock()
+
+	@property
+	def session(self):
+		"""
+		requests.Session created on first use, so it is never shared across fork.
+		"""
+		if self._session is None:
+			with self._session_lock:
+				if self._session is None:
+					session = requests.Session()
+					adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+					session.mount('https://', adapter)
+					session.mount('http://', adapter)
+					self._session = session
+		return self._session
+
+	@session.setter
+	def session(self, session):
+		self._session = session
+
+	def reset_session(self):
+		with self._session_lock:
+			if self._session is not None:
+				self._session.close()
+			self._session = None
+
+	def backoff(self, attempt):
+		"""
+		Seconds to sleep before retry number attempt (from 1), with full jitter.
+		"""
+		return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+	def _request(self, params):
+		"""
+		One request to the API, return the response json.
+		Raise DistanceMatrixUnavailable for failures worth retrying, DistanceMatrixError for the others.
+		"""
+		try:
+			with GMAP_LATENCY.time():
+				resp = self.session.get(self.url, params=params, timeout=self.timeout)
+		except requests.RequestException as e:
+			raise DistanceMatrixUnavailable("Request failed: %s" % (e,))
+		if resp.status_code >= 500 or resp.status_code == 429:
+			raise DistanceMatrixUnavailable("HTTP status %s." % (resp.status_code,))
+		try:
+			resp = resp.json()
+		except ValueError as e:
+			raise DistanceMatrixUnavailable("Invalid json response: %s" % (e,))
+		if resp.get('status') in self.retry_statuses:
+			raise DistanceMatrixUnavailable("Response status %s." % (resp['status'],))
+		if resp.get('status') != 'OK':
+			raise DistanceMatrixError("Response status %s: %s" % (resp.get('status'), resp.get('error_message')))
+		return resp
+
+	def get_matrix(self, origins, destinations, units='metric'):
+		"""
+		Request the distance matrix between origins and destinations, lists of (lat, lng).
+		Return the response json, retried up to max_retries times while the upstream is unavailable.
+		Raise DistanceMatrixUnavailable immediately while the circuit breaker is open.
+		"""
+		if not self.breaker.allow_request():
+			GMAP_ERRORS.labels('breaker_open').inc()
+			raise DistanceMatrixUnavailable("Circuit breaker is open.")
+		params = {
+			'origins': '|'.join('%s, %s' % (lat, lng) for lat, lng in origins),
+			'destinations': '|'.join('%s, %s' % (lat, lng) for lat, lng in destinations),
+			'units': units,
+			'key': self.key
+		}
+		attempt = 0
+		while True:
+			try:
+				resp = self._request(params)
+			except DistanceMatrixUnavailable as e:
+				GMAP_ERRORS.labels('unavailable').inc()
+				attempt += 1
+				if attempt > self.max_retries:
+					self.breaker.record_failure()
+					raise
+				logger.info("Distance Matrix API unavailable (%s), retry %s." % (e, attempt))
+				time.sleep(self.backoff(attempt))
+				continue
+			except DistanceMatrixError:
+				GMAP_ERRORS.labels('error').inc()
+				self.breaker.record_success() #upstream is healthy, the request is not
+				raise
+			except Exception:
+				GMAP_ERRORS.labels('exception').inc()
+				self.breaker.record_failure()
+				raise
+			self.breaker.record_success()
+			logger.info("Number of gmap API response rows returned: %s." % (len(resp['rows']),))
+			return resp
+
+	def get_distance(self, origin, destination, units='metric'):
+		"""
+		Return distance in meters (integer) between origin and destination, both (lat, lng).
+		"""
+		resp = self.get_matrix([origin], [destination], units)
+		return parse_element_distance(resp['rows'][0]['elements'][0])
+
+
+def parse_element_distance(element):
+	"""
+	Return distance in meters (integer) of one element of the matrix.
+	"""
+	if element.get('status') != 'OK':
+		raise DistanceMatrixError("Element status %s." % (element.get('status'),))
+	return int(element['distance']['value'])
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_distance_matrix_client():
+	"""
+	Return the Distance Matrix client of this process, created on first use.
+	"""
+	global _client
+	if _client is None:
+		with _client_lock:
+			if _client is None:
+				_client = DistanceMatrixClient()
+	return _client
+
+@register_postfork
+def reset_distance_matrix_client():
+	"""
+	Drop keep-alive connections inherited from the parent process after fork.
+	"""
+	if _client is not None:
+		_client.reset_session()
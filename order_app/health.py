@@ -0,0 +1,85 @@
+import threading, time
+from utilities.logger import get_logger
+from utilities.ttl_cache import TTLCache
+from order_app.settings import DB_POOL, HEALTH_CACHE_TTL, DISTANCE_STRATEGY
+from order_app.models import get_engine
+from order_app.gmap_client import get_distance_matrix_client
+
+logger = get_logger('flask_order_app')
+
+#Result of the database probe, shared by the threads of a uWSGI worker for HEALTH_CACHE_TTL seconds,
+#so load balancer polling does not become database load.
+probe_cache = TTLCache(max_size=1, ttl=HEALTH_CACHE_TTL)
+probe_lock = threading.Lock()
+
+
+class Readiness():
+
+	def check_pool(self):
+		"""
+		Return usage of the connection pool of this worker.
+		saturation is checked out connections over pool_size + max_overflow, 1 means exhausted.
+		"""
+		pool = get_engine().pool
+		capacity = DB_POOL['pool_size'] + DB_POOL['max_overflow']
+		checked_out = pool.checkedout()
+		return {
+			'checked_out': checked_out,
+			'capacity': capacity,
+			'saturation': round(float(checked_out) / capacity, 3) if capacity else None
+		}
+
+	def check_database(self):
+		"""
+		Run SELECT 1 on a pooled connection, cached for HEALTH_CACHE_TTL seconds.
+		Only one thread probes at a time, the others wait for its result.
+		"""
+		result = probe_cache.get('database')
+		if result is not None:
+			return dict(result, cached=True)
+		with probe_lock:
+			result = probe_cache.get('database')
+			if result is not None:
+				return dict(result, cached=True)
+			started = time.perf_counter()
+			try:
+				with get_engine().connect() as conn:
+					conn.execute("SELECT 1").scalar()
+				result = {'ok': True}
+			except Exception as e:
+				logger.error("Readiness database probe failed: %s." % (e,))
+				result = {'ok': False, 'error': e.__class__.__name__}
+			result['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+			probe_cache.set('database', result)
+		return dict(result, cached=False)
+
+	def check_distance_matrix(self):
+		"""
+		Return circuit breaker state of the Distance Matrix client of this worker.
+		"""
+		return {
+			'strategy': DISTANCE_STRATEGY,
+			'breaker': get_distance_matrix_client().breaker.state
+		}
+
+	def run_readiness(self):
+		"""
+		Run all class functions of Readiness.
+		Ready when the database answers and the pool is not exhausted.
+		An open breaker is reported, but does not make the worker unready,
+		since every worker shares the same upstream.
+		Return ready and the report of all checks.
+		"""
+		pool = self.check_pool()
+		if pool['saturation'] is not None and pool['saturation'] >= 1:
+			#a probe would wait up to pool_timeout for a connection
+			database = {'ok': False, 'error': 'PoolExhausted', 'cached': False}
+		else:
+			database = self.check_database()
+		report = {
+			'database': database,
+			'db_pool': pool,
+			'distance_matrix': self.check_distance_matrix()
+		}
+		ready = database['ok']
+		return ready, report
@@ -0,0 +1,192 @@
+import datetime, hashlib, json, re, threading, time
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from utilities.logger import get_logger
+from order_app.settings import IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_LOCK_TIMEOUT, IDEMPOTENCY_PURGE_INTERVAL, IDEMPOTENCY_POLL_INTERVAL, IDEMPOTENCY_PENDING_TIMEOUT
+from order_app.models import get_session, utcnow, IdempotencyKey
+
+logger = get_logger('flask_order_app')
+
+idempotency_key_header = 'Idempotency-Key'
+idempotency_key_regex = re.compile(r'^[\x21-\x7e]{1,255}$') #printable ASCII without spaces
+key_mismatch_err_msg = "Idempotency-Key was already used with a different request body."
+key_in_progress_err_msg = "A request with this Idempotency-Key is still in progress, retry later."
+key_unavailable_err_msg = "Idempotency-Key cannot be checked, retry later."
+retry_after = 1 #seconds, Retry-After of 503 when the database fails
+
+_next_purge = 0 #time.monotonic() of the next purge of expired keys in this worker
+_purge_lock = threading.Lock()
+
+
+def request_hash(body):
+	"""
+	Return sha256 hex digest of the request body in canonical JSON, so whitespace and key order do not matter.
+	"""
+	return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def purge_expired_keys():
+	"""
+	Delete keys older than IDEMPOTENCY_KEY_TTL seconds, at most once every IDEMPOTENCY_PURGE_INTERVAL seconds per worker.
+	"""
+	global _next_purge
+	if time.monotonic() < _next_purge or not _purge_lock.acquire(blocking=False):
+		return
+	session = get_session()
+	try:
+		_next_purge = time.monotonic() + IDEMPOTENCY_PURGE_INTERVAL
+		deleted = session.execute(delete(IdempotencyKey.__table__).where(
+			IdempotencyKey.created_at < utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_KEY_TTL))).rowcount
+		session.commit()
+		logger.info("Purged %s expired idempotency keys." % (deleted,))
+	except Exception as e:
+		session.rollback()
+		logger.error("Expired idempotency keys cannot be purged.: %s." % (e,))
+	finally:
+		session.close()
+		_purge_lock.release()
+
+
+class IdempotencyClaim():
+	"""
+	Claim of an Idempotency-Key by a request: its IdempotencyKey row is inserted PENDING (response_status NULL)
+	and committed at once, so no transaction nor connection is held while the request runs.
+	The response is stored in the transaction of the order (see complete()).
+	A concurrent request with the same key polls the row every IDEMPOTENCY_POLL_INTERVAL seconds,
+	up to IDEMPOTENCY_LOCK_TIMEOUT seconds, and gets the stored response.
+	If the request fails, the row is deleted and the next one runs again. A row left PENDING
+	for IDEMPOTENCY_PENDING_TIMEOUT seconds (the request died) is taken over by the next request.
+	"""
+
+	def __init__(self, key, body):
+		self.key = key
+		self.request_hash = request_hash(body)
+		self.claimed = False
+
+	def insert_key(self):
+		"""
+		Insert the PENDING row of the key in a short transaction. Return True if inserted.
+		"""
+		session = get_session()
+		try:
+			claimed = session.execute(
+				insert(IdempotencyKey.__table__)
+				.values(key=self.key, request_hash=self.request_hash)
+				.on_conflict_do_nothing(index_elements=['key'])
+				.returning(IdempotencyKey.key)
+			).fetchone()
+			session.commit()
+		except Exception:
+			session.rollback()
+			raise
+		finally:
+			session.close()
+		return claimed is not None
+
+	def read_key(self):
+		"""
+		Return (request_hash, response_status, response_body, stale) of the key, None if there is no row.
+		stale is True if the row is PENDING for longer than IDEMPOTENCY_PENDING_TIMEOUT.
+		"""
+		session = get_session()
+		try:
+			return session.execute(
+				select([IdempotencyKey.request_hash, IdempotencyKey.response_status, IdempotencyKey.response_body,
+					IdempotencyKey.updated_at < utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT)])
+				.where(IdempotencyKey.key == self.key)
+			).fetchone()
+		finally:
+			session.rollback()
+			session.close()
+
+	def take_over(self):
+		"""
+		Take over a stale PENDING row in a short transaction. Return True if taken over by this request.
+		"""
+		session = get_session()
+		try:
+			taken = session.execute(
+				IdempotencyKey.__table__.update()
+				.where(IdempotencyKey.key == self.key)
+				.where(IdempotencyKey.response_status.is_(None))
+				.where(IdempotencyKey.updated_at < utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT))
+				.values(request_hash=self.request_hash, updated_at=utcnow())
+				.returning(IdempotencyKey.key)
+			).fetchone()
+			session.commit()
+		except Exception:
+			session.rollback()
+			raise
+		finally:
+			session.close()
+		return taken is not None
+
+	def claim(self):
+		"""
+		Claim the key. Return response status code and body stored by an earlier request with the key
+		(None, None if the key is claimed by this request), and err_msg with its status code.
+		"""
+		purge_expired_keys()
+		deadline = time.monotonic() + IDEMPOTENCY_LOCK_TIMEOUT
+		try:
+			while True:
+				if self.insert_key():
+					self.claimed = True
+					logger.info("Claimed idempotency key %s." % (self.key,))
+					return None, None, None
+				stored = self.read_key()
+				if stored is None: #released or purged in between, claim again
+					continue
+				if stored[0] != self.request_hash:
+					return None, None, (key_mismatch_err_msg, 422)
+				if stored[1] is not None:
+					logger.info("Replay response of idempotency key %s." % (self.key,))
+					return stored[1], stored[2], None
+				if stored[3] and self.take_over():
+					self.claimed = True
+					logger.info("Took over stale idempotency key %s." % (self.key,))
+					return None, None, None
+				if time.monotonic() >= deadline:
+					logger.info("Idempotency key %s still in progress." % (self.key,))
+					return None, None, (key_in_progress_err_msg, 409)
+				time.sleep(IDEMPOTENCY_POLL_INTERVAL) #no connection is held while waiting
+		except Exception as e:
+			logger.error("Idempotency key cannot be claimed.: %s." % (e,))
+			return None, None, (key_unavailable_err_msg, 503)
+
+	def complete(self, session, response_status, response_body, order_id):
+		"""
+		Store the response of the request in the claimed row, in session of the order, committed with it by the caller.
+		Raise exception if the row is no longer PENDING (taken over and completed by another request),
+		so the order is rolled back rather than placed twice.
+		"""
+		stored = session.execute(
+			IdempotencyKey.__table__.update()
+			.where(IdempotencyKey.key == self.key)
+			.where(IdempotencyKey.request_hash == self.request_hash)
+			.where(IdempotencyKey.response_status.is_(None))
+			.values(order_id=order_id, response_status=response_status, response_body=response_body, updated_at=utcnow())
+		).rowcount
+		if stored != 1:
+			raise RuntimeError("Idempotency key %s is no longer claimed by this request." % (self.key,))
+
+	def release(self):
+		"""
+		Delete the PENDING row if the request did not store its response, so the key can be used again.
+		If this fails, the next request takes the row over after IDEMPOTENCY_PENDING_TIMEOUT.
+		"""
+		if not self.claimed:
+			return
+		self.claimed = False
+		session = get_session()
+		try:
+			session.execute(
+				delete(IdempotencyKey.__table__)
+				.where(IdempotencyKey.key == self.key)
+				.where(IdempotencyKey.response_status.is_(None))
+			)
+			session.commit()
+		except Exception as e:
+			session.rollback()
+			logger.error("Idempotency key %s cannot be released.: %s." % (self.key, e))
+		finally:
+			session.close()
@@ -0,0 +1,75 @@
+import datetime, json
+from flask import current_app, request
+from flask.json import JSONEncoder
+from order_app.settings import JSON_ENCODER
+
+try: #optional, stdlib json is used if orjson is not installed
+	import orjson
+except ImportError:
+	orjson = None
+
+#JSON responses of all views: compact (no indent, no sorted keys) by default, indented with ?pretty=1.
+#Dates and datetimes are ISO 8601 strings with every encoder (orjson encodes them so natively),
+#other types unknown to the encoders are converted like flask.jsonify does.
+flask_default = JSONEncoder().default
+
+def default(o):
+	if isinstance(o, (datetime.date, datetime.time)):
+		return o.isoformat()
+	return flask_default(o)
+
+def stdlib_dumps(data):
+	return json.dumps(data, separators=(',', ':'), default=default).encode('utf-8')
+
+def orjson_dumps(data):
+	return orjson.dumps(data, default=default) #no options, for orjson 3.0 of requirements.txt
+
+def get_dumps(encoder=JSON_ENCODER):
+	"""
+	Return name and function encoding data into compact JSON bytes, for encoder
+	'orjson', 'json' (stdlib) or 'auto' (orjson if installed, else stdlib).
+	"""
+	if encoder in ('auto', 'orjson') and orjson is not None:
+		return 'orjson', orjson_dumps
+	return 'json', stdlib_dumps
+
+encoder_name, dumps = get_dumps()
+
+def pretty_dumps(data):
+	return (json.dumps(data, indent=2, sort_keys=True, separators=(', ', ': '), default=default) + '\n').encode('utf-8')
+
+def wants_pretty():
+	return request.args.get('pretty') in ('1', 'true') or current_app.config['JSONIFY_PRETTYPRINT_REGULAR']
+
+def json_response(body):
+	return current_app.response_class(body, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+def jsonify(*args, **kwargs):
+	"""
+	Drop-in replacement of flask.jsonify, encoding with dumps.
+	"""
+	if args and kwargs:
+		raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+	data = args[0] if len(args) == 1 else (args or kwargs)
+	return json_response(pretty_dumps(data) if wants_pretty() else dumps(data))
+
+def jsonify_list(chunks):
+	"""
+	Stream the JSON array of the items of chunks, an iterable of lists of items (e.g. rows fetched
+	JSON_STREAM_CHUNK at a time from a server-side cursor), encoding each chunk as it comes,
+	so the body is never held in memory as a whole. ?pretty=1 is not streamed.
+	"""
+	if wants_pretty():
+		return jsonify([item for items in chunks for item in items])
+
+	def generate():
+		first = True
+		yield b'['
+		for items in chunks:
+			if items:
+				chunk = dumps(items)[1:-1] #without its brackets
+				yield chunk if first else b',' + chunk
+				first = False
+		yield b']'
+
+	return json_response(generate())
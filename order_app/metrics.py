@@ -0,0 +1,78 @@
+import atexit, os
+from sqlalchemy import event
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+
+#Prometheus metrics of GET /metrics.
+#With environment variable prometheus_multiproc_dir set (before prometheus_client is imported),
+#every uWSGI worker writes its metrics into mmaped files of that directory, and /metrics
+#aggregates the files of all workers, whichever worker serves it.
+
+multiproc_dir = os.getenv('prometheus_multiproc_dir')
+
+REQUESTS = Counter('order_api_requests_total', 'HTTP requests.', ['route', 'method', 'status'])
+REQUEST_LATENCY = Histogram('order_api_request_duration_seconds', 'HTTP request latency.', ['route'],
+	buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+
+GMAP_LATENCY = Histogram('order_api_gmap_request_duration_seconds', 'Google Map Distance Matrix API request latency.',
+	buckets=(.025, .05, .1, .25, .5, 1, 2, 4, 8))
+GMAP_ERRORS = Counter('order_api_gmap_errors_total', 'Google Map Distance Matrix API errors.', ['reason'])
+
+DB_POOL_CHECKED_OUT = Gauge('order_api_db_pool_checked_out', 'Database connections checked out of the pool.',
+	multiprocess_mode='livesum')
+DB_POOL_OVERFLOW = Gauge('order_api_db_pool_overflow', 'Database connections checked out beyond pool_size.',
+	multiprocess_mode='livesum')
+
+TAKE_ORDER_OUTCOMES = Counter('order_api_take_order_total', 'PATCH /orders/:id outcomes.', ['outcome'])
+
+ORDER_CACHE_REQUESTS = Counter('order_api_order_cache_requests_total', 'GET /orders/:id cache lookups.', ['result'])
+
+
+def observe_request(route, method, status, duration):
+	"""
+	Count the request and observe its latency in seconds under route, the Flask endpoint.
+	"""
+	route = route or 'not_found'
+	REQUESTS.labels(route, method, status).inc()
+	if duration is not None:
+		REQUEST_LATENCY.labels(route).observe(duration)
+
+def track_pool(engine):
+	"""
+	Keep the pool gauges of engine up to date on every connection checkout and checkin.
+	The checkin event fires before the connection is back in the pool, hence checked_out - 1.
+	"""
+	def update_pool_gauges(checked_out):
+		DB_POOL_CHECKED_OUT.set(checked_out)
+		if hasattr(engine.pool, 'size'):
+			DB_POOL_OVERFLOW.set(max(checked_out - engine.pool.size(), 0))
+
+	@event.listens_for(engine, 'checkout')
+	def on_checkout(dbapi_connection, connection_record, connection_proxy):
+		update_pool_gauges(engine.pool.checkedout())
+
+	@event.listens_for(engine, 'checkin')
+	def on_checkin(dbapi_connection, connection_record):
+		update_pool_gauges(engine.pool.checkedout() - 1)
+
+	return engine
+
+def render_metrics():
+	"""
+	Return the metrics in Prometheus text format, and its content type.
+	"""
+	if multiproc_dir:
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+	else:
+		registry = REGISTRY
+	return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead():
+	"""
+	Drop the live gauges of this worker once it exits.
+	"""
+	if multiproc_dir:
+		multiprocess.mark_process_dead(os.getpid())
+
+atexit.register(mark_process_dead)
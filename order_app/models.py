@@ -1,18 +1,20 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, VARCHAR
+from sqlalchemy import create_engine, inspect, select, func, and_, Column, Integer, String, DateTime, VARCHAR, Index
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
-from sqlalchemy.sql import expression
+from sqlalchemy.sql import expression, table, column
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.types import DateTime
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.engine.url import URL
-from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from flask_sqlalchemy import SQLAlchemy
 
-import datetime
+import datetime, os
 from order_app import settings
 from order_app.settings import app
 from utilities.logger import get_logger
+from utilities.postfork import register_postfork
+from order_app.metrics import track_pool
 
 DeclarativeBase = declarative_base() #For SQLAlchemy (can make use of SQLAlchemy sessions, row lock etc.)
 
@@ -20,7 +22,16 @@ logger = get_logger('database')
 
 global_db_config = settings.DATABASE
 
-db = SQLAlchemy(app) #For Flask
+class PoolMetricsSQLAlchemy(SQLAlchemy):
+	"""
+	Flask-SQLAlchemy whose engine reports its pool usage to the metrics (see metrics.track_pool).
+	"""
+	def create_engine(self, sa_url, engine_opts):
+		return track_pool(super().create_engine(sa_url, engine_opts))
+
+db = PoolMetricsSQLAlchemy(app) #For Flask, its engine is pooled with settings.DB_POOL
+
+Session = sessionmaker() #Bound to the pooled engine in get_session()
 
 def create_db_if_not_exists(db_config=None):
 	"""
@@ -50,14 +61,40 @@ def create_db_if_not_exists(db_config=None):
 		logger.info("Disposed engine of 'postgres' db, expects to no longer be connected to it.")
 	return
 
+def get_engine():
+	"""
+	Return the process-wide pooled engine.
+	It is the engine of Flask-SQLAlchemy db, so order_list, place_order and take_order
+	share one connection pool per uWSGI worker.
+	"""
+	return db.engine
+
+def get_session():
+	"""
+	Return a new sqlalchemy session bound to the process-wide pooled engine.
+	Closing the session returns its connection to the pool.
+	"""
+	return Session(bind=get_engine())
+
+@register_postfork
+def dispose_engine():
+	"""
+	Discard pooled connections inherited from the parent process after fork,
+	so every uWSGI worker opens its own connections instead of sharing sockets.
+	"""
+	if settings.DATABASE['host']:
+		get_engine().dispose()
+		logger.info("Disposed pooled engine after fork in process %s." % (os.getpid(),))
+
 def db_connect(db_config=None):
 	"""
 	Performs database connection using database settings from settings.py.
-	Returns sqlalchemy engine instance
+	Returns a new (not shared) sqlalchemy engine instance, for scripts and tests.
+	Request handlers should use get_session() instead.
 	"""
 	if not db_config:
 		db_config = global_db_config.copy()
-	engine = create_engine(URL(**db_config))
+	engine = create_engine(URL(**db_config), connect_args={'application_name': settings.DB_APPLICATION_NAME})
 	logger.info("Created db engine to database: %s." % db_config['database'])
 	return engine
 
@@ -65,9 +102,52 @@ def db_connect(db_config=None):
 def create_tables(engine):
     """
 	Take the meta data of the table to create the tables. 
+	Indexes added to tables that already exist are created too (create_all skips existing tables),
+	CONCURRENTLY on an autocommit connection so the table is not locked against writes while building.
+	An index left INVALID by a failed concurrent build is dropped and built again.
+	The triggers of order_changes_ddl are (re)created every time.
     """
-    DeclarativeBase.metadata.create_all(engine)
-    logger.info('Created tables if not exist.')
+    with engine.execution_options(isolation_level='AUTOCOMMIT').connect() as conn: #CONCURRENTLY cannot run in a transaction
+        conn.execute("SET application_name = '%s_create_tables';" % (settings.DB_APPLICATION_NAME,)) #index builds do not hold back the change feed
+        try:
+            DeclarativeBase.metadata.create_all(conn)
+            logger.info('Created tables if not exist.')
+            invalid_indexes = set(row[0] for row in conn.execute(invalid_indexes_query))
+            inspector = inspect(conn)
+            for table in DeclarativeBase.metadata.sorted_tables:
+                existing_indexes = set(index['name'] for index in inspector.get_indexes(table.name)) - invalid_indexes
+                for index in table.indexes:
+                    if index.name in invalid_indexes:
+                        conn.execute('DROP INDEX CONCURRENTLY IF EXISTS "%s";' % (index.name,))
+                        logger.info('Dropped invalid index %s on table %s.' % (index.name, table.name))
+                    if index.name not in existing_indexes:
+                        index.create(conn)
+                        logger.info('Created index %s on table %s.' % (index.name, table.name))
+        finally:
+            conn.execute("RESET application_name;") #back to DB_APPLICATION_NAME before the connection returns to the pool
+    with engine.begin() as conn:
+        for statement in order_changes_ddl:
+            conn.execute(statement)
+    logger.info('Created trigger notifying %s on table Order.' % (order_changes_channel,))
+
+invalid_indexes_query = """SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid;"""
+
+order_changes_channel = 'order_changes'
+
+#NOTIFY order_changes (GET /orders/changes) once a transaction inserting or updating orders commits,
+#whichever code path changes them. One notification per changed row, so statements changing no row
+#notify nothing, and Postgres folds the identical notifications of one transaction into one.
+order_changes_ddl = (
+	"""CREATE OR REPLACE FUNCTION notify_order_changes() RETURNS trigger AS $$
+	BEGIN
+		PERFORM pg_notify('%s', '');
+		RETURN NULL;
+	END;
+	$$ LANGUAGE plpgsql;""" % (order_changes_channel,),
+	"""DROP TRIGGER IF EXISTS "Order_notify_changes" ON "Order";""",
+	"""CREATE TRIGGER "Order_notify_changes" AFTER INSERT OR UPDATE ON "Order"
+	FOR EACH ROW EXECUTE PROCEDURE notify_order_changes();""",
+)
 
 class utcnow(expression.FunctionElement):
 	type = DateTime()
@@ -76,6 +156,29 @@ class utcnow(expression.FunctionElement):
 def pg_utcnow(element, compiler, **kw):
 	return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
 
+pg_stat_activity = table('pg_stat_activity', column('pid'), column('datname'), column('backend_type'), column('application_name'),
+	column('xact_start'), column('backend_xid'))
+
+def oldest_writer_start():
+	"""
+	UTC start of the oldest transaction of another connection of this app (DB_APPLICATION_NAME) having written
+	(holding an xid), the updated_at of its rows, or utcnow() if none. Autovacuum, index builds of create_tables
+	and other clients of the database do not write orders, and hold neither the change feed nor the list validators back.
+	Rows of transactions still running may commit later with an updated_at older than this.
+	"""
+	return func.coalesce(
+		select([func.min(func.timezone('utc', pg_stat_activity.c.xact_start))])
+		.where(and_(
+			pg_stat_activity.c.datname == func.current_database(),
+			pg_stat_activity.c.pid != func.pg_backend_pid(),
+			pg_stat_activity.c.backend_type == 'client backend',
+			pg_stat_activity.c.application_name == settings.DB_APPLICATION_NAME,
+			pg_stat_activity.c.backend_xid.isnot(None)
+		))
+		.as_scalar(),
+		utcnow()
+	)
+
 
 class BaseModel(object):
 	"""
@@ -95,4 +198,57 @@ class Order(BaseModel, DeclarativeBase, db.Model):
 	id = Column(Integer, primary_key=True)
 	distance = Column('distance', Integer, nullable=False)
 	status = Column('status', VARCHAR(32), server_default="UNASSIGNED", nullable=False)
-	
\ No newline at end of file
+
+	__table_args__ = (
+		#GET /orders?status=: seek on status, ordered by id descending.
+		#distance is a trailing key column so the listing (id, distance, status) is an index-only scan.
+		Index('ix_Order_status_id_distance', status, id.desc(), distance, postgresql_concurrently=True),
+		#ETag/Last-Modified of GET /orders: max(updated_at) is read from the end of this index.
+		Index('ix_Order_updated_at_id', 'updated_at', id, postgresql_concurrently=True),
+	)
+
+
+class DistanceCache(BaseModel, DeclarativeBase):
+	"""
+	Schema logic for DistanceCache table, the distance cache shared by all uWSGI workers.
+	Unlogged, since the rows can always be rebuilt from Google Map Distance Matrix API.
+	"""
+	__table_args__ = {'prefixes': ['UNLOGGED']}
+
+	key = Column('key', VARCHAR(128), primary_key=True)
+	distance = Column('distance', Integer, nullable=False)
+	expires_at = Column('expires_at', DateTime, nullable=False)
+
+
+class OrderIngestQueue(BaseModel, DeclarativeBase):
+	"""
+	Schema logic for OrderIngestQueue table, orders placed with ORDER_INGEST_MODE 'async'
+	waiting for their distance. id is reserved from the sequence of Order,
+	the row is deleted once the order is inserted into Order with the same id.
+	"""
+	id = Column(Integer, primary_key=True, autoincrement=False)
+	payload = Column('payload', JSONB, nullable=False) #{'origin': [lat, lng], 'destination': [lat, lng]}
+	status = Column('status', VARCHAR(32), server_default="PENDING", nullable=False) #PENDING, PROCESSING (claimed by a worker) or FAILED
+	attempts = Column('attempts', Integer, server_default="0", nullable=False)
+	last_error = Column('last_error', VARCHAR(256), nullable=True)
+
+	__table_args__ = (
+		Index('ix_OrderIngestQueue_status_id', status, id, postgresql_concurrently=True),
+	)
+
+
+class IdempotencyKey(BaseModel, DeclarativeBase):
+	"""
+	Schema logic for IdempotencyKey table, the Idempotency-Key headers of POST /orders.
+	The row is committed PENDING (response_status NULL) when the first request with the key starts,
+	its response is stored with its order, repeats get the stored response (see order_app/idempotency.py).
+	"""
+	key = Column('key', VARCHAR(255), primary_key=True)
+	request_hash = Column('request_hash', VARCHAR(64), nullable=False) #sha256 of the canonical request body
+	order_id = Column('order_id', Integer, nullable=True)
+	response_status = Column('response_status', Integer, nullable=True)
+	response_body = Column('response_body', JSONB, nullable=True)
+
+	__table_args__ = (
+		Index('ix_IdempotencyKey_created_at', 'created_at', postgresql_concurrently=True), #purge of expired keys
+	)
@@ -0,0 +1,194 @@
+import datetime, select, threading, time
+from sqlalchemy import select as select_query, tuple_
+from utilities.logger import get_logger
+from utilities.postfork import register_postfork
+from order_app import settings
+from order_app.models import get_session, db_connect, utcnow, oldest_writer_start, Order, order_changes_channel
+from order_app.order_list import encode_cursor, decode_cursor
+from order_app.order_export import parse_since
+from order_app.request_context import phase_timer
+
+logger = get_logger('flask_order_app')
+
+
+def encode_change_cursor(updated_at, order_id):
+	return encode_cursor({'updated_at': updated_at.isoformat(), 'id': order_id})
+
+def decode_change_cursor(token):
+	"""
+	Decode cursor token from encode_change_cursor into (updated_at, id).
+	Raise ValueError if the token is invalid.
+	"""
+	values = decode_cursor(token)
+	try:
+		return parse_since(values['updated_at']), int(values['id'])
+	except (AttributeError, KeyError, TypeError, ValueError):
+		raise ValueError("Invalid cursor: %s." % (token,))
+
+
+class OrderChangeNotifier():
+	"""
+	Thread of a uWSGI worker LISTENing to order_changes on its own connection, outside of the pool,
+	waking the long-polling requests of the worker up on every notification.
+	Requests read generation before querying and wait for a newer one, so no notification is missed in between.
+	"""
+
+	def __init__(self, reconnect_interval=settings.ORDER_CHANGES_POLL_INTERVAL, max_waiters=settings.ORDER_CHANGES_MAX_WAITERS):
+		self.reconnect_interval = reconnect_interval #seconds
+		self.generation = 0
+		self.waiters = threading.BoundedSemaphore(max_waiters)
+		self.engine = None
+		self._condition = threading.Condition()
+		self._stop = threading.Event()
+		self._thread = None
+		self._thread_lock = threading.Lock()
+
+	def notify_all(self):
+		with self._condition:
+			self.generation += 1
+			self._condition.notify_all()
+
+	def wait(self, generation, timeout):
+		"""
+		Wait up to timeout seconds for a notification newer than generation. Return True if notified.
+		"""
+		with self._condition:
+			return self._condition.wait_for(lambda: self.generation != generation, timeout)
+
+	def listen(self):
+		"""
+		LISTEN until stopped or the connection fails.
+		"""
+		if self.engine is None:
+			self.engine = db_connect()
+		connection = self.engine.raw_connection()
+		try:
+			dbapi_connection = connection.connection
+			dbapi_connection.autocommit = True
+			dbapi_connection.cursor().execute('LISTEN %s;' % (order_changes_channel,))
+			logger.info("Listening to %s." % (order_changes_channel,))
+			while not self._stop.is_set():
+				if select.select([dbapi_connection], [], [], self.reconnect_interval)[0]:
+					dbapi_connection.poll()
+					if dbapi_connection.notifies:
+						del dbapi_connection.notifies[:]
+						self.notify_all()
+		except Exception:
+			connection.invalidate()
+			raise
+		finally:
+			connection.close()
+
+	def run(self):
+		while not self._stop.is_set():
+			try:
+				self.listen()
+			except Exception as e:
+				logger.error("Listening to %s failed, reconnecting in %s seconds.: %s." % (order_changes_channel, self.reconnect_interval, e))
+				self.notify_all() #waiting requests query again rather than miss changes
+				self._stop.wait(self.reconnect_interval)
+
+	def start(self):
+		"""
+		Run in a daemon thread of this process, if not running yet.
+		"""
+		with self._thread_lock:
+			if self._thread is None or not self._thread.is_alive():
+				self._stop.clear()
+				self._thread = threading.Thread(target=self.run, name='order-changes', daemon=True)
+				self._thread.start()
+
+	def stop(self, timeout=None):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout)
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_order_change_notifier():
+	"""
+	Return the running notifier of this process, started on first use.
+	"""
+	global _notifier
+	if _notifier is None:
+		with _notifier_lock:
+			if _notifier is None:
+				_notifier = OrderChangeNotifier()
+	_notifier.start()
+	return _notifier
+
+@register_postfork
+def reset_order_change_notifier():
+	global _notifier
+	_notifier = None #threads and connections do not survive fork
+
+
+class OrderChanges():
+	"""
+	Change feed of orders: orders inserted or updated after cursor (updated_at, id), oldest first,
+	read on index ix_Order_updated_at_id.
+	"""
+
+	def __init__(self, after=None, limit=settings.ORDER_CHANGES_LIMIT, wait=0):
+		self.after = after #(updated_at, id), or (since, 0)
+		self.limit = limit
+		self.wait = wait #seconds
+
+	def query_changes(self):
+		"""
+		Return changed order items, the cursor of the next request, and err_msg.
+		updated_at is the start of the changing transaction, so changes are only read up to the start of the oldest
+		transaction still writing, which may commit rows older than the cursor later. Changes younger than
+		ORDER_CHANGES_SETTLE seconds are left to the next request too, for transactions which have not written yet.
+		"""
+		order_items = None
+		next_cursor = encode_change_cursor(*self.after) if self.after else None
+		err_msg = None
+		session = get_session()
+		try:
+			changes_query = (
+				select_query([Order.id, Order.distance, Order.status, Order.updated_at])
+				.where(Order.updated_at < utcnow() - datetime.timedelta(seconds=settings.ORDER_CHANGES_SETTLE))
+				.where(Order.updated_at < oldest_writer_start())
+				.order_by(Order.updated_at, Order.id)
+				.limit(self.limit)
+			)
+			if self.after is not None:
+				changes_query = changes_query.where(tuple_(Order.updated_at, Order.id) > tuple_(*self.after))
+			with phase_timer('db'):
+				orders = session.execute(changes_query).fetchall()
+			order_items = [{'id': order[0], 'distance': order[1], 'status': order[2], 'updated_at': order[3].isoformat()} for order in orders]
+			if orders:
+				next_cursor = encode_change_cursor(orders[-1][3], orders[-1][0])
+		except Exception as e:
+			err_msg = "Order changes cannot be queried."
+			logger.error("Order changes cannot be queried.: %s." % (e,))
+		finally:
+			session.close() #no connection is held while waiting
+		return order_items, next_cursor, err_msg
+
+	def run_order_changes(self):
+		"""
+		Return the changes after cursor. If there are none, wait up to wait seconds for a change:
+		query again on every notification of order_changes, and every ORDER_CHANGES_POLL_INTERVAL seconds.
+		Only ORDER_CHANGES_MAX_WAITERS requests of a worker wait at the same time, the others return immediately.
+		"""
+		deadline = time.monotonic() + self.wait
+		notifier = get_order_change_notifier() if self.wait > 0 else None
+		if notifier is not None and not notifier.waiters.acquire(blocking=False):
+			logger.info("Too many order changes long-polls waiting, return without waiting.")
+			notifier = None
+		try:
+			while True:
+				generation = notifier.generation if notifier else None
+				order_items, next_cursor, err_msg = self.query_changes()
+				remaining = deadline - time.monotonic()
+				if order_items or err_msg or notifier is None or remaining <= 0:
+					return order_items, next_cursor, err_msg
+				if notifier.wait(generation, min(remaining, settings.ORDER_CHANGES_POLL_INTERVAL)):
+					time.sleep(min(settings.ORDER_CHANGES_SETTLE, max(deadline - time.monotonic(), 0)))
+		finally:
+			if notifier is not None:
+				notifier.waiters.release()
@@ -0,0 +1,77 @@
+from sqlalchemy import select, union_all, literal, cast, null, case, Integer
+from utilities.logger import get_logger
+from utilities.ttl_cache import TTLCache
+from order_app.settings import ORDER_CACHE_TTL, ORDER_CACHE_MAX_SIZE
+from order_app.models import get_session, Order, OrderIngestQueue
+from order_app.request_context import phase_timer
+from order_app.metrics import ORDER_CACHE_REQUESTS
+
+logger = get_logger('flask_order_app')
+
+order_cache = TTLCache(max_size=ORDER_CACHE_MAX_SIZE, ttl=ORDER_CACHE_TTL) #order id -> order item
+
+def invalidate_order(order_id):
+	"""
+	Drop the cached order of this worker after changing it.
+	"""
+	order_cache.delete(order_id)
+
+
+class OrderDetail():
+
+	def __init__(self, order_id):
+		self.order_id = order_id
+
+	def order_query(self):
+		"""
+		The order from Order, or else from OrderIngestQueue, in one statement: one snapshot sees the order
+		either queued or inserted, even if the ingest worker commits the move in between.
+		Columns id, distance, status, last_error.
+		"""
+		orders = select([Order.id, Order.distance, Order.status, cast(null(), OrderIngestQueue.last_error.type).label('last_error'), literal(0).label('source')]) \
+			.where(Order.id == self.order_id)
+		queued_status = case([(OrderIngestQueue.status == 'PROCESSING', 'PENDING')], else_=OrderIngestQueue.status) #claimed by an ingest worker
+		queued = select([OrderIngestQueue.id, cast(null(), Integer), queued_status, OrderIngestQueue.last_error, literal(1)]) \
+			.where(OrderIngestQueue.id == self.order_id)
+		found = union_all(orders, queued).alias('found')
+		return select([found.c.id, found.c.distance, found.c.status, found.c.last_error]).order_by(found.c.source).limit(1)
+
+	def query_order(self):
+		"""
+		Query the order by id. Orders still queued in OrderIngestQueue (ORDER_INGEST_MODE 'async')
+		are returned with their queue status PENDING or FAILED, and distance None.
+		Return order item, None if the order does not exist.
+		"""
+		order_item = None
+		err_msg = None
+		session = get_session()
+		try:
+			order = session.execute(self.order_query()).fetchone()
+			if order:
+				order_item = {'id': order[0], 'distance': order[1], 'status': order[2]}
+				if order[2] == 'FAILED':
+					order_item['error'] = order[3]
+			logger.info("Queried order with id %s: %s." % (self.order_id, order_item))
+		except Exception as e:
+			err_msg = "Order cannot be queried."
+			logger.error("Order cannot be queried.: %s." % (e,))
+		finally:
+			session.close()
+		return order_item, err_msg
+
+	def run_order_detail(self):
+		"""
+		Run all class functions of OrderDetail, reading through order_cache.
+		Orders that do not exist are not cached.
+		"""
+		order_item = order_cache.get(self.order_id)
+		if order_item is not None:
+			ORDER_CACHE_REQUESTS.labels('hit').inc()
+			logger.info("Order cache hit: %s, cache stats: %s." % (self.order_id, order_cache.stats()))
+			return dict(order_item), None
+		ORDER_CACHE_REQUESTS.labels('miss').inc()
+		with phase_timer('db'):
+			order_item, err_msg = self.query_order()
+		if order_item:
+			order_cache.set(self.order_id, dict(order_item))
+		return order_item, err_msg
@@ -0,0 +1,100 @@
+import csv, datetime, io, json
+from sqlalchemy import select
+from utilities.logger import get_logger
+from order_app.settings import ORDER_EXPORT_CHUNK
+from order_app.models import get_session, Order
+from order_app.request_context import phase_timer
+
+logger = get_logger('flask_order_app')
+
+export_formats = {
+	'ndjson': 'application/x-ndjson',
+	'csv': 'text/csv',
+}
+export_columns = ('id', 'distance', 'status', 'created_at', 'updated_at')
+since_formats = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+def parse_since(since):
+	"""
+	Parse since, an ISO 8601 UTC date or datetime without timezone (e.g. 2020-03-01 or 2020-03-01T12:00:00).
+	Raise ValueError if invalid.
+	"""
+	for since_format in since_formats:
+		try:
+			return datetime.datetime.strptime(since.rstrip('Z'), since_format)
+		except ValueError:
+			pass
+	raise ValueError("Invalid since: %s." % (since,))
+
+
+class OrderExport():
+	"""
+	Export all orders (filtered by status, and updated_at >= since) without pagination.
+	Rows are read from a server-side (named) cursor ORDER_EXPORT_CHUNK at a time and encoded as they come,
+	so memory stays constant whatever the number of orders.
+	"""
+
+	def __init__(self, export_format='ndjson', status=None, since=None):
+		self.export_format = export_format
+		self.status = status
+		self.since = since
+
+	def export_query(self):
+		"""
+		Orders ordered by id, or by (updated_at, id) with since (index ix_Order_updated_at_id),
+		so an export can be resumed from the updated_at of its last row.
+		"""
+		export_query = select([getattr(Order, column) for column in export_columns])
+		if self.status is not None:
+			export_query = export_query.where(Order.status == self.status)
+		if self.since is not None:
+			export_query = export_query.where(Order.updated_at >= self.since).order_by(Order.updated_at, Order.id)
+		else:
+			export_query = export_query.order_by(Order.id)
+		return export_query
+
+	def encode_ndjson(self, rows):
+		return ''.join(json.dumps({
+			'id': row[0], 'distance': row[1], 'status': row[2],
+			'created_at': row[3].isoformat(), 'updated_at': row[4].isoformat()
+		}, separators=(',', ':')) + '\n' for row in rows)
+
+	def encode_csv(self, rows):
+		lines = io.StringIO()
+		csv.writer(lines, lineterminator='\n').writerows(
+			(row[0], row[1], row[2], row[3].isoformat(), row[4].isoformat()) for row in rows)
+		return lines.getvalue()
+
+	def generate(self, result):
+		"""
+		Yield the encoded export, one chunk of ORDER_EXPORT_CHUNK orders at a time.
+		"""
+		encode = self.encode_csv if self.export_format == 'csv' else self.encode_ndjson
+		if self.export_format == 'csv':
+			yield (','.join(export_columns) + '\n').encode('utf-8')
+		exported = 0
+		try:
+			while True:
+				rows = result.fetchmany(ORDER_EXPORT_CHUNK)
+				if not rows:
+					break
+				exported += len(rows)
+				yield encode(rows).encode('utf-8')
+			logger.info("Exported %s orders as %s." % (exported, self.export_format))
+		except Exception as e: #headers are sent already, the export is truncated
+			logger.error("Order export failed after %s orders.: %s." % (exported, e))
+
+	def run_order_export(self):
+		"""
+		Start the export query on a server-side cursor.
+		Return the generator of the export and the session to close once it is sent, and err_msg.
+		"""
+		session = get_session()
+		try:
+			with phase_timer('db'):
+				result = session.connection(execution_options={'stream_results': True}).execute(self.export_query())
+		except Exception as e:
+			session.close()
+			logger.error("Orders cannot be exported.: %s." % (e,))
+			return None, None, "Orders cannot be exported."
+		return self.generate(result), session, None
@@ -0,0 +1,218 @@
+import datetime, threading
+from sqlalchemy import select, update, delete, case, and_, or_
+from sqlalchemy.dialects.postgresql import insert
+from utilities.logger import get_logger
+from utilities.postfork import register_postfork
+from order_app import settings
+from order_app.models import get_session, utcnow, Order, OrderIngestQueue
+from order_app.place_order import distance_err_msg
+from order_app.place_bulk_orders import PlaceBulkOrders
+from order_app.order_detail import invalidate_order
+
+logger = get_logger('flask_order_app')
+
+ingest_err_msg = "Order cannot be ingested."
+
+
+class OrderIngestWorker():
+	"""
+	Insert the orders queued in OrderIngestQueue (ORDER_INGEST_MODE 'async') in batches.
+	No transaction is held while distances are requested:
+	1. claim up to batch_size PENDING rows with FOR UPDATE SKIP LOCKED, set them PROCESSING
+		with one more attempt and commit, so the workers of all processes share the queue.
+	2. get their distances like POST /orders/bulk (distance cache, then as few Distance Matrix requests as possible).
+	3. insert the orders with their reserved ids with one multi-row INSERT, and delete their rows.
+	4. release the others back to PENDING, FAILED after max_attempts.
+	Orders left PROCESSING by a worker that died are claimed again once their lease expired.
+	"""
+
+	def __init__(self, batch_size=settings.ORDER_INGEST_BATCH_SIZE, poll_interval=settings.ORDER_INGEST_POLL_INTERVAL,
+		max_attempts=settings.ORDER_INGEST_MAX_ATTEMPTS, lease=settings.ORDER_INGEST_LEASE):
+		self.batch_size = batch_size
+		self.poll_interval = poll_interval #seconds
+		self.max_attempts = max_attempts
+		self.lease = lease #seconds
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._thread = None
+		self._thread_lock = threading.Lock()
+
+	def claim_batch(self):
+		"""
+		Claim a batch of queued orders in one short transaction. Return list of (id, payload).
+		Expired claims that used up max_attempts become FAILED instead of being claimed.
+		Raise exception if the claim fails.
+		"""
+		lease_expired = and_(OrderIngestQueue.status == 'PROCESSING',
+			OrderIngestQueue.updated_at < utcnow() - datetime.timedelta(seconds=self.lease))
+		session = get_session()
+		try:
+			session.execute(
+				update(OrderIngestQueue.__table__)
+				.where(lease_expired)
+				.where(OrderIngestQueue.attempts >= self.max_attempts)
+				.values(status='FAILED', last_error=ingest_err_msg, updated_at=utcnow())
+			)
+			claimable = (
+				select([OrderIngestQueue.id])
+				.where(or_(OrderIngestQueue.status == 'PENDING', lease_expired))
+				.order_by(OrderIngestQueue.id)
+				.limit(self.batch_size)
+				.with_for_update(skip_locked=True)
+			)
+			rows = session.execute(
+				update(OrderIngestQueue.__table__)
+				.where(OrderIngestQueue.id.in_(claimable))
+				.values(status='PROCESSING', attempts=OrderIngestQueue.attempts + 1, updated_at=utcnow())
+				.returning(OrderIngestQueue.id, OrderIngestQueue.payload)
+			).fetchall()
+			session.commit()
+		except Exception:
+			session.rollback()
+			raise
+		finally:
+			session.close()
+		return sorted(rows, key=lambda row: row[0])
+
+	def release_statement(self, order_ids, err_msg):
+		"""
+		Statement releasing claimed orders not ingested: back to PENDING, or FAILED after max_attempts.
+		"""
+		return (
+			update(OrderIngestQueue.__table__)
+			.where(OrderIngestQueue.id.in_(order_ids))
+			.where(OrderIngestQueue.status == 'PROCESSING')
+			.values(
+				status=case([(OrderIngestQueue.attempts >= self.max_attempts, 'FAILED')], else_='PENDING'),
+				last_error=err_msg[:256],
+				updated_at=utcnow()
+			)
+		)
+
+	def release_orders(self, order_ids, err_msg):
+		"""
+		Release claimed orders after a failed batch. If this fails too, they are claimed again when their lease expires.
+		"""
+		session = get_session()
+		try:
+			session.execute(self.release_statement(order_ids, err_msg))
+			session.commit()
+		except Exception as e:
+			session.rollback()
+			logger.error("Claimed orders cannot be released, retried after their lease.: %s." % (e,))
+		finally:
+			session.close()
+
+	def process_batch(self):
+		"""
+		Process one batch of queued orders. Return number of orders inserted.
+		If the batch fails after the claim, its orders are released with one attempt counted.
+		"""
+		try:
+			rows = self.claim_batch()
+		except Exception as e:
+			logger.error("Queued orders cannot be claimed.: %s." % (e,))
+			return 0
+		if not rows:
+			return 0
+		orders = [(row[0], tuple(row[1]['origin']), tuple(row[1]['destination'])) for row in rows]
+		inserted = 0
+		session = None
+		try:
+			pairs = list(dict.fromkeys((origin, destination) for order_id, origin, destination in orders))
+			distances = PlaceBulkOrders(request=None).get_distances(pairs) #outside of any transaction
+			ready = [(order_id, distances[(origin, destination)]) for order_id, origin, destination in orders
+				if (origin, destination) in distances]
+			missing = [order_id for order_id, origin, destination in orders if (origin, destination) not in distances]
+			session = get_session()
+			if ready:
+				session.execute(insert(Order.__table__)
+					.values([{'id': order_id, 'distance': distance} for order_id, distance in ready])
+					.on_conflict_do_nothing(index_elements=['id'])) #inserted already by a worker claiming after an expired lease
+				session.execute(delete(OrderIngestQueue.__table__).where(OrderIngestQueue.id.in_([order_id for order_id, distance in ready])))
+			if missing:
+				session.execute(self.release_statement(missing, distance_err_msg))
+			session.commit()
+			inserted = len(ready)
+			logger.info("Ingested %s queued orders, %s without distance." % (inserted, len(missing)))
+		except Exception as e:
+			if session is not None:
+				session.rollback()
+			logger.error("Roll back ingest queued orders.: %s." % (e,))
+			self.release_orders([order_id for order_id, origin, destination in orders], "%s %s" % (ingest_err_msg, e))
+		finally:
+			if session is not None:
+				session.close()
+		for order_id, origin, destination in orders:
+			invalidate_order(order_id) #PENDING in the cache of GET /orders/<id>
+		return inserted
+
+	def run(self):
+		"""
+		Process batches until stopped, waiting poll_interval seconds (or a wake-up) once the queue is drained.
+		"""
+		logger.info("Order ingest worker started.")
+		while not self._stop.is_set():
+			inserted = self.process_batch()
+			if inserted < self.batch_size:
+				self._wake.wait(self.poll_interval)
+				self._wake.clear()
+		logger.info("Order ingest worker stopped.")
+
+	def start(self):
+		"""
+		Run in a daemon thread of this process, if not running yet.
+		"""
+		with self._thread_lock:
+			if self._thread is None or not self._thread.is_alive():
+				self._stop.clear()
+				self._thread = threading.Thread(target=self.run, name='order-ingest', daemon=True)
+				self._thread.start()
+
+	def wake(self):
+		self._wake.set()
+
+	def stop(self, timeout=None):
+		self._stop.set()
+		self._wake.set()
+		if self._thread is not None:
+			self._thread.join(timeout)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_order_ingest_worker():
+	"""
+	Return the order ingest worker of this process, created on first use.
+	"""
+	global _worker
+	if _worker is None:
+		with _worker_lock:
+			if _worker is None:
+				_worker = OrderIngestWorker()
+	return _worker
+
+def notify_order_queued():
+	"""
+	Wake the in-process worker up after an order is queued, starting it if needed.
+	"""
+	if settings.ORDER_INGEST_IN_PROCESS:
+		worker = get_order_ingest_worker()
+		worker.start()
+		worker.wake()
+
+@register_postfork
+def start_order_ingest_worker():
+	"""
+	Start a worker thread in every uWSGI worker, so queued orders are ingested without waiting for a request.
+	"""
+	global _worker
+	_worker = None #threads do not survive fork
+	if settings.ORDER_INGEST_MODE == 'async' and settings.ORDER_INGEST_IN_PROCESS:
+		get_order_ingest_worker().start()
+
+
+if __name__ == '__main__':
+	#separate process, with ORDER_INGEST_IN_PROCESS=false for the uWSGI workers
+	OrderIngestWorker().run()
@@ -1,30 +1,205 @@
-import json, requests
+import json, base64, datetime
 from flask import request
+from sqlalchemy import func, text
 from utilities.logger import get_logger
-from werkzeug import exceptions
-from order_app.models import Order
+from utilities.ttl_cache import TTLCache
+from order_app.settings import ORDER_COUNT_TTL, ORDER_COUNT_ESTIMATE_MIN, ORDER_CHANGES_SETTLE, JSON_STREAM_CHUNK
+from order_app.models import Order, db, get_session, utcnow, oldest_writer_start
+from order_app.request_context import phase_timer
 
 logger = get_logger('flask_order_app')
 
+#Total count of orders per status (key None for all statuses), shared by the threads of a uWSGI worker
+#for ORDER_COUNT_TTL seconds, so paging through GET /orders does not count the table on every page.
+order_count_cache = TTLCache(max_size=3, ttl=ORDER_COUNT_TTL)
+
+
+def encode_cursor(values):
+	"""
+	Encode dict of keyset values (e.g. {'id': 123}) into an opaque url-safe cursor token.
+	"""
+	token = base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8'))
+	return token.decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+	"""
+	Decode cursor token from encode_cursor back into dict of keyset values.
+	Raise ValueError if the token is invalid.
+	"""
+	try:
+		values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+	except Exception:
+		raise ValueError("Invalid cursor: %s." % (token,))
+	if not isinstance(values, dict):
+		raise ValueError("Invalid cursor: %s." % (token,))
+	return values
+
+
+def to_order_items(orders):
+	"""
+	Convert rows (id, distance, status) into order items.
+	"""
+	return [{'id': order[0], 'distance': order[1], 'status': order[2]} for order in orders]
+
+
+order_statuses = ('UNASSIGNED', 'TAKEN')
+
+epoch = datetime.datetime(1970, 1, 1)
+
 class OrderList():
 
-	def __init__(self, page, limit):
+	def __init__(self, page=None, limit=None, after_id=None, status=None):
 		self.page = page
 		self.limit = limit
+		self.after_id = after_id
+		self.status = status #None for orders of all statuses
+
+	def order_query(self):
+		"""
+		Query columns id, distance, status, filtered by status if given
+		(served by index ix_Order_status_id_distance).
+		"""
+		order_query = Order.query.with_entities(Order.id, Order.distance, Order.status)
+		if self.status is not None:
+			order_query = order_query.filter(Order.status == self.status)
+		return order_query
 
 	def query_paginated_orders(self):
+		"""
+		Page (OFFSET) pagination, ordered by id descending.
+		Unlike Flask-SQLAlchemy paginate(), the total is not counted on every page (see total_count),
+		one extra row is fetched to know if there is a next page.
+		"""
 		order_items = None
 		err_msg = None
 		try:
+			if self.page < 1 or self.limit < 1:
+				logger.info("Number of pages exceeded.")
+				return [], err_msg
 			#only get columns: id, distance, status, and order by id descending.
-			order_paged = Order.query.with_entities(Order.id, Order.distance, Order.status).order_by(Order.id.desc()).paginate(self.page, self.limit)
-			order_items = [{'id': order[0], 'distance': order[1], 'status': order[2]} for order in order_paged.items]
-			logger.info("Successfully retrieved orders with pagination %s on page %s." % (self.limit, self.page))
-			logger.info("Has previous page: %s, and has next page: %s." % (order_paged.has_prev, order_paged.has_next))
-		except exceptions.NotFound:
-			order_items = []
+			with phase_timer('db'):
+				orders = self.order_query().order_by(Order.id.desc()).limit(self.limit + 1).offset((self.page - 1) * self.limit).all()
+			order_items = to_order_items(orders[:self.limit])
+			logger.info("Successfully retrieved orders with status %s with pagination %s on page %s." % (self.status, self.limit, self.page))
+			logger.info("Has previous page: %s, and has next page: %s." % (self.page > 1, len(orders) > self.limit))
+		except Exception as e:
+			err_msg = "Orders cannot be queried."
+			logger.error("Orders cannot be queried.: %s." % (e,))
+		return order_items, err_msg
+
+	def generate_order_items(self, result):
+		"""
+		Yield lists of order items of result, JSON_STREAM_CHUNK rows at a time.
+		"""
+		streamed = 0
+		try:
+			while True:
+				rows = result.fetchmany(JSON_STREAM_CHUNK)
+				if not rows:
+					break
+				streamed += len(rows)
+				yield to_order_items(rows)
+			logger.info("Streamed %s orders with status %s with pagination %s on page %s." % (streamed, self.status, self.limit, self.page))
+		except Exception as e: #headers are sent already, the page is truncated
+			logger.error("Orders streaming failed after %s orders.: %s." % (streamed, e))
+
+	def stream_paginated_orders(self):
+		"""
+		Page pagination like query_paginated_orders, for large pages: start the query on a server-side cursor
+		of its own session, and return the generator of lists of order items, the session to close once
+		the page is sent (None if there is none), and err_msg.
+		"""
+		if self.page < 1 or self.limit < 1:
 			logger.info("Number of pages exceeded.")
-		except Exception as e: 
+			return [], None, None
+		session = get_session()
+		try:
+			page_query = self.order_query().with_session(session).order_by(Order.id.desc()).limit(self.limit).offset((self.page - 1) * self.limit)
+			with phase_timer('db'):
+				result = session.connection(execution_options={'stream_results': True}).execute(page_query.statement)
+		except Exception as e:
+			session.close()
+			logger.error("Orders cannot be queried.: %s." % (e,))
+			return None, None, "Orders cannot be queried."
+		return self.generate_order_items(result), session, None
+
+	def query_keyset_orders(self):
+		"""
+		Cursor (keyset) pagination: seek orders with id below after_id on the primary key index,
+		ordered by id descending, without OFFSET nor COUNT(*).
+		One extra row is fetched to know if there is a next page.
+		Return order items and the cursor token of the next page (None on the last page).
+		"""
+		order_items = None
+		next_cursor = None
+		err_msg = None
+		try:
+			order_query = self.order_query()
+			if self.after_id is not None:
+				order_query = order_query.filter(Order.id < self.after_id)
+			with phase_timer('db'):
+				orders = order_query.order_by(Order.id.desc()).limit(self.limit + 1).all()
+			order_items = to_order_items(orders[:self.limit])
+			if len(orders) > self.limit:
+				next_cursor = encode_cursor({'id': order_items[-1]['id']})
+			logger.info("Successfully retrieved %s orders with status %s after id %s." % (len(order_items), self.status, self.after_id))
+		except Exception as e:
 			err_msg = "Orders cannot be queried."
 			logger.error("Orders cannot be queried.: %s." % (e,))
-		return order_items, err_msg
\ No newline at end of file
+		return order_items, next_cursor, err_msg
+
+	def count_orders(self):
+		"""
+		Return number of orders with status.
+		Without status, the planner estimate pg_class.reltuples (kept up to date by autovacuum) is returned
+		once it reaches ORDER_COUNT_ESTIMATE_MIN, instead of a sequential scan of the whole table.
+		"""
+		if self.status is None:
+			estimate = db.session.execute(text("""SELECT reltuples::bigint FROM pg_class WHERE oid = '"Order"'::regclass""")).scalar()
+			if estimate is not None and estimate >= ORDER_COUNT_ESTIMATE_MIN:
+				return int(estimate)
+		return self.order_query().order_by(None).count()
+
+	def total_count(self):
+		"""
+		Return total count of orders with status, cached for ORDER_COUNT_TTL seconds, and err_msg.
+		"""
+		total = order_count_cache.get(self.status)
+		if total is not None:
+			return total, None
+		try:
+			with phase_timer('db'):
+				total = self.count_orders()
+			order_count_cache.set(self.status, total)
+		except Exception as e:
+			logger.error("Orders cannot be counted.: %s." % (e,))
+			return None, "Orders cannot be counted."
+		return total, None
+
+	def list_validators(self):
+		"""
+		Return validators of the order listing for conditional requests: ETag and Last-Modified (datetime),
+		and err_msg. They are read over orders of all statuses, since taking an order changes both listings.
+		Every insert raises max(id) and every update sets updated_at, so both are read from the end of
+		the primary key and ix_Order_updated_at_id indexes, without scanning orders.
+		updated_at is the start of the changing transaction, so a transaction still running may commit an order
+		without moving them. Like the change feed, they are only returned once max(updated_at) is older than
+		the oldest transaction of the app still writing and ORDER_CHANGES_SETTLE seconds old. Before that,
+		validators are None and the listing is served without them.
+		"""
+		try:
+			with phase_timer('db'):
+				last_modified, last_id, settled = db.session.query(
+					func.max(Order.updated_at), func.max(Order.id),
+					func.max(Order.updated_at) < func.least(utcnow() - datetime.timedelta(seconds=ORDER_CHANGES_SETTLE), oldest_writer_start())
+				).one()
+		except Exception as e:
+			logger.error("Orders validators cannot be queried.: %s." % (e,))
+			return None, None, "Orders cannot be queried."
+		if last_modified is None:
+			return 'empty', None, None
+		if not settled:
+			logger.info("Orders are being changed, no validators.")
+			return None, None, None
+		etag = '%x-%x' % (last_id, int((last_modified - epoch).total_seconds() * 1000000))
+		return etag, last_modified, None
@@ -0,0 +1,193 @@
+from sqlalchemy.dialects.postgresql import insert
+from utilities.logger import get_logger
+from order_app.settings import BULK_ORDER_MAX_ITEMS, DISTANCE_STRATEGY
+from order_app.models import get_session, Order
+from order_app.distance_cache import get_distance_cache, distance_cache_key
+from order_app.gmap_client import get_distance_matrix_client, parse_element_distance, DistanceMatrixUnavailable
+from order_app.place_order import estimate_distance, distance_err_msg
+from order_app.validators import validate_coordinates
+from order_app.request_context import phase_timer
+
+logger = get_logger('flask_order_app')
+
+#Google Map Distance Matrix API limits per request
+MATRIX_MAX_ORIGINS = 25
+MATRIX_MAX_DESTINATIONS = 25
+MATRIX_MAX_ELEMENTS = 100
+
+
+def plan_matrix_requests(pairs, max_origins=MATRIX_MAX_ORIGINS,
+	max_destinations=MATRIX_MAX_DESTINATIONS, max_elements=MATRIX_MAX_ELEMENTS):
+	"""
+	Group distinct (origin, destination) pairs into as few Distance Matrix requests as possible.
+	Destinations are split into blocks, and the origins needing a block are split into requests
+	within the API limits. Every block size is tried, the plan with the fewest requests wins.
+	Each request only asks for the destinations of the block needed by its origins.
+	Return list of (origins, destinations) of each request.
+	"""
+	needed = {}
+	destinations = []
+	for origin, destination in pairs:
+		if destination not in destinations:
+			destinations.append(destination)
+		needed.setdefault(origin, set()).add(destination)
+	origins = list(needed)
+	best_plan = []
+	for block_size in range(1, min(max_destinations, len(destinations)) + 1):
+		origins_per_request = min(max_origins, max_elements // block_size)
+		plan = []
+		for i in range(0, len(destinations), block_size):
+			block = set(destinations[i:i + block_size])
+			block_origins = [origin for origin in origins if needed[origin] & block]
+			for j in range(0, len(block_origins), origins_per_request):
+				request_origins = block_origins[j:j + origins_per_request]
+				request_destinations = [destination for destination in destinations[i:i + block_size]
+					if any(destination in needed[origin] for origin in request_origins)]
+				plan.append((request_origins, request_destinations))
+		if not best_plan or len(plan) < len(best_plan):
+			best_plan = plan
+	return best_plan
+
+
+class PlaceBulkOrders():
+
+	def __init__(self, request):
+		self.request = request
+		self.items = [] #per order: {'origin': (lat, lng), 'destination': (lat, lng), 'error': err_msg}
+		self.gmap_unit = 'metric'
+
+	def validate_items(self):
+		"""
+		Validate that request json is a list of at most BULK_ORDER_MAX_ITEMS orders,
+		then validate each order like PlaceOrder does (jsonschema and lat/lng range).
+		Per order errors are kept in self.items, only an invalid list fails the request.
+		"""
+		orders = self.request.json
+		if not isinstance(orders, list) or not orders:
+			return False, "Request body must be a non-empty list of orders."
+		if len(orders) > BULK_ORDER_MAX_ITEMS:
+			return False, "At most %s orders can be placed in one request." % (BULK_ORDER_MAX_ITEMS,)
+		for order in orders:
+			item = {'origin': None, 'destination': None, 'error': None}
+			coordinates, item['error'] = validate_coordinates(order)
+			if coordinates:
+				item['origin'] = coordinates[:2]
+				item['destination'] = coordinates[2:]
+			self.items.append(item)
+		logger.info("Validated %s orders, %s invalid." % (len(self.items), len([i for i in self.items if i['error']])))
+		return True, None
+
+	def get_distances(self, pairs):
+		"""
+		Get distances of distinct (origin, destination) pairs.
+		Cached distances are used first, read with one get_many, the others are requested with as few
+		Distance Matrix requests as possible (see plan_matrix_requests), and cached with one set_many.
+		DISTANCE_STRATEGY applies as in PlaceOrder.get_distance.
+		Return dict of pair -> distance in meters, pairs without distance are left out.
+		"""
+		distances = {}
+		if DISTANCE_STRATEGY == 'haversine':
+			return dict((pair, estimate_distance(*(pair[0] + pair[1]))) for pair in pairs)
+		distance_cache = get_distance_cache()
+		cache_key = lambda origin, destination: distance_cache_key(*(origin + destination + (self.gmap_unit,)))
+		cached = distance_cache.get_many([cache_key(origin, destination) for origin, destination in pairs])
+		missing = []
+		for origin, destination in pairs:
+			distance = cached.get(cache_key(origin, destination))
+			if distance is not None:
+				distances[(origin, destination)] = distance
+			else:
+				missing.append((origin, destination))
+		logger.info("Distance cache hits: %s, misses: %s." % (len(distances), len(missing)))
+		needed = set(missing)
+		client = get_distance_matrix_client()
+		plan = plan_matrix_requests(missing)
+		requested = {} #cache key -> distance of every element returned, cached at once
+		for origins, destinations in plan:
+			try:
+				resp = client.get_matrix(origins, destinations, self.gmap_unit)
+			except DistanceMatrixUnavailable as e:
+				logger.error(e)
+				if DISTANCE_STRATEGY == 'gmap_with_fallback':
+					for origin in origins:
+						for destination in destinations:
+							if (origin, destination) in needed:
+								distances[(origin, destination)] = estimate_distance(*(origin + destination))
+					logger.info("Estimated fallback distances for %s origins." % (len(origins),))
+				continue
+			except Exception as e:
+				logger.error(e)
+				continue
+			for i, origin in enumerate(origins):
+				for j, destination in enumerate(destinations):
+					try:
+						distance = parse_element_distance(resp['rows'][i]['elements'][j])
+					except Exception as e:
+						logger.info("No distance from %s to %s: %s." % (origin, destination, e))
+						continue
+					requested[cache_key(origin, destination)] = distance
+					if (origin, destination) in needed:
+						distances[(origin, destination)] = distance
+		distance_cache.set_many(requested)
+		logger.info("Requested %s distances with %s Distance Matrix requests." % (len(missing), len(plan)))
+		return distances
+
+	def insert_new_orders(self, distances):
+		"""
+		Insert new orders into Order table with one multi-row INSERT ... RETURNING.
+		Return list of dicts of the newly inserted orders, in the order of distances.
+		Roll back if exception caught.
+		"""
+		new_order_items = []
+		err_msg = None
+		session = get_session()
+		try:
+			statement = insert(Order.__table__).values([{'distance': distance} for distance in distances])
+			statement = statement.returning(Order.id, Order.distance, Order.status)
+			#ids are drawn from the sequence in VALUES order, sort by id to match distances
+			rows = sorted(session.execute(statement).fetchall(), key=lambda row: row[0])
+			session.commit()
+			new_order_items = [{'id': row[0], 'distance': row[1], 'status': row[2]} for row in rows]
+			logger.info("Inserted %s new orders." % (len(new_order_items),))
+		except Exception as e:
+			session.rollback()
+			logger.error("Roll back insert new orders.")
+			logger.error(e)
+			err_msg = "New orders cannot be created."
+		finally:
+			session.close()
+		return new_order_items, err_msg
+
+	def run_place_bulk_orders(self):
+		"""
+		Run all class functions of PlaceBulkOrders.
+		Return list of results in the order of the request, each being the newly inserted order
+		or {'error': err_msg} of that order, with None error message.
+		Return None results with error message if the request itself is invalid.
+		"""
+		with phase_timer('validate'):
+			validated, err_msg = self.validate_items()
+		if not validated:
+			return None, err_msg
+		pairs = list(dict.fromkeys((item['origin'], item['destination']) for item in self.items if not item['error']))
+		with phase_timer('distance'):
+			distances = self.get_distances(pairs)
+		to_insert = []
+		for item in self.items:
+			if item['error']:
+				continue
+			item['distance'] = distances.get((item['origin'], item['destination']))
+			if item['distance'] is None:
+				item['error'] = distance_err_msg
+			else:
+				to_insert.append(item)
+		if to_insert:
+			with phase_timer('db'):
+				new_order_items, insert_err_msg = self.insert_new_orders([item['distance'] for item in to_insert])
+			for item, new_order_item in zip(to_insert, new_order_items):
+				item['order'] = new_order_item
+			if insert_err_msg:
+				for item in to_insert:
+					item['error'] = insert_err_msg
+		results = [{'error': item['error']} if item['error'] else item['order'] for item in self.items]
+		return results, None
@@ -1,11 +1,14 @@
-import json, requests
+import json
 from flask import request
-from flask_inputs import Inputs
-from flask_inputs.validators import JsonSchema
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 from utilities.logger import get_logger
-from order_app.settings import GMAP_TOKEN, GMAP_DISTANCE_MATRIX_API
-from order_app.models import db_connect, Order
+from utilities.geo import haversine_distance
+from order_app.settings import DISTANCE_STRATEGY, HAVERSINE_ROAD_FACTOR, ORDER_INGEST_MODE
+from order_app.models import get_session, Order, OrderIngestQueue
+from order_app.distance_cache import get_distance_cache, distance_cache_key
+from order_app.gmap_client import get_distance_matrix_client, DistanceMatrixUnavailable
+from order_app.validators import FastInputs, validate_coordinates, latlng_range_error
+from order_app.request_context import phase_timer
 
 logger = get_logger('flask_order_app')
 
@@ -47,100 +50,109 @@ coorindate_schema = {
 	'additionalProperties': False
 }
 
-class CoordinateInputs(Inputs):
-   json = [JsonSchema(schema=coorindate_schema)]
+class CoordinateInputs(FastInputs):
+   #coorindate_schema and lat/lng range, precompiled (see order_app/validators.py)
+   validator = staticmethod(validate_coordinates)
+
+distance_err_msg = "Distance cannot be retrieved with Google Maps Distance Matrix."
+
+def validate_latlng_range(origin_lat, origin_lng, destination_lat, destination_lng):
+	"""
+	Validate the origins' and destinations' (lat, lng), see validators.latlng_range_error().
+	"""
+	err_msg = latlng_range_error(origin_lat, origin_lng, destination_lat, destination_lng)
+	return err_msg is None, err_msg
+
+def estimate_distance(origin_lat, origin_lng, destination_lat, destination_lng):
+	"""
+	Estimate distance in meters (integer) locally, without Google Map Distance Matrix API:
+	great-circle distance multiplied by HAVERSINE_ROAD_FACTOR.
+	"""
+	return int(round(haversine_distance(origin_lat, origin_lng, destination_lat, destination_lng) * HAVERSINE_ROAD_FACTOR))
 
 class PlaceOrder():
 
-	def __init__(self, request):
+	def __init__(self, request, idempotency=None):
 		self.request = request
 		self.inputs = CoordinateInputs(self.request)
+		self.idempotency = idempotency #IdempotencyClaim of the Idempotency-Key header, None without
 		self.origin_lat = None
 		self.origin_lng = None
 		self.destination_lat = None
 		self.destination_lng = None
 		self.gmap_unit = 'metric'
-		self.gmap_key = GMAP_TOKEN
-		self.gmap_url = GMAP_DISTANCE_MATRIX_API
 
 
 	def validate_latlng_range(self):
 		"""
-		Validate the origins' and destinations' (lat, lng). 
-		-90 <= lat <= 90
-		-180 <= lng <= 180
-		Return error message if any lat or lng validation fails 
-		and display all lat and lng values that do not fall within the range.
+		Validate the origins' and destinations' (lat, lng), see validate_latlng_range().
 		"""
-		validated = True
-		errors = []
-		err_msg = None
-		if self.origin_lat >= 90 or self.origin_lat <= -90:
-			validated = False
-			errors.append('origin latitude: %s' % (self.origin_lat,))
-		if self.destination_lat >= 90 or self.destination_lat <= -90:
-			validated = False
-			errors.append('destination latitude: %s' % (self.destination_lat,))
-		if self.origin_lng >= 180 or self.origin_lng <= -180:
-			validated = False
-			errors.append('origin longitude: %s' % (self.origin_lng,))
-		if self.destination_lng >= 180 or self.destination_lng <= -180:
-			validated = False
-			errors.append('destination longitude: %s' % (self.destination_lng,))
-		if not validated:
-			logger.info("Validation fail, %s not withint range." % (', '.join(errors),))
-			err_msg = "Wrong input, %s must be within range. -90<=latitude<=90, -180<=longitude<= 180." % (', '.join(errors),)
-		return validated, err_msg
+		return validate_latlng_range(self.origin_lat, self.origin_lng, self.destination_lat, self.destination_lng)
 
 	def get_distance(self):
 		"""
 		Get distance between the origins and destions using Google Map Distance Matrix API.
 		Return distance in meters (integer).
-		Catch exception during requestiong Google Map Distance Matrix API, 
-		return distance = None for failure to retrieve distance from API.
+		With DISTANCE_STRATEGY 'haversine', return the local estimate instead (see estimate_distance).
+		The distance cache is looked up first, and updated after a successful API request.
+		Catch exception during requestiong Google Map Distance Matrix API 
+		(including timeouts after retries and open circuit breaker, see DistanceMatrixClient), 
+		return distance = None for failure to retrieve distance from API,
+		or the local estimate for these unavailable cases with DISTANCE_STRATEGY 'gmap_with_fallback'.
 		"""
 		distance = None
 		err_msg = None
-		gmap_params = {
-			'origins': '%s, %s' % (self.origin_lat, self.origin_lng),
-			'destinations': '%s, %s' % (self.destination_lat, self. destination_lng),
-			'units': self.gmap_unit,
-			'key': self.gmap_key
-		}
+		if DISTANCE_STRATEGY == 'haversine':
+			distance = estimate_distance(self.origin_lat, self.origin_lng, self.destination_lat, self.destination_lng)
+			logger.info("Estimated distance: %s." % (distance,))
+			return distance, err_msg
+		distance_cache = get_distance_cache()
+		cache_key = distance_cache_key(self.origin_lat, self.origin_lng, self.destination_lat, self.destination_lng, self.gmap_unit)
+		distance = distance_cache.get(cache_key)
+		if distance is not None:
+			logger.info("Distance cache hit: %s, cache stats: %s." % (distance, distance_cache.stats()))
+			return distance, err_msg
 		try:
-			resp = requests.get(
-					self.gmap_url, params=gmap_params
-				)
-			resp = resp.json()
-			logger.info("Number of gmap API response rows returned: %s." % (len(resp['rows'], )))
-			distance = int(resp['rows'][0]['elements'][0]['distance']['value']) #in meters
+			distance = get_distance_matrix_client().get_distance(
+					(self.origin_lat, self.origin_lng), (self.destination_lat, self.destination_lng), self.gmap_unit
+				) #in meters
 			logger.info("Distance: %s." % (distance,))
+			distance_cache.set(cache_key, distance)
+		except DistanceMatrixUnavailable as e:
+			logger.error(e)
+			if DISTANCE_STRATEGY == 'gmap_with_fallback':
+				distance = estimate_distance(self.origin_lat, self.origin_lng, self.destination_lat, self.destination_lng)
+				logger.info("Estimated fallback distance: %s." % (distance,))
+			else:
+				err_msg = distance_err_msg
 		except Exception as e: 
 			logger.error(e)
-			err_msg = "Distance cannot be retrieved with Google Maps Distance Matrix."
+			err_msg = distance_err_msg
 		return distance, err_msg
 
 	def insert_new_order(self, distance):
 		"""
 		Insert new order into Order table. Return dict of the newly inserted order.
+		With an idempotency claim, the response is stored in its key in the same short transaction.
 		Roll back if exception caught.
 		"""
-		engine = db_connect()
-		Session = sessionmaker(bind=engine)
 		item = {
 			'distance': distance
 		}
-		session = Session() # invokes sessionmaker.__call__()
+		session = get_session() # connection checked out from the pooled engine
 		logger.info("Created database session.")
 		new_order = Order(**item)
 		new_order_item = {}
 		err_msg = None
 		try:
 			session.add(new_order)
-			session.commit()
+			session.flush()
 			new_order_item['id'] = new_order.id
 			new_order_item['distance'] = new_order.distance
 			new_order_item['status'] = new_order.status
+			if self.idempotency:
+				self.idempotency.complete(session, 200, new_order_item, new_order.id)
+			session.commit()
 			logger.info("Inserted new order with id %s, distance %s and status %s." % (new_order.id, new_order.distance, new_order.status))
 		except Exception as e:
 			session.rollback()
@@ -148,9 +160,39 @@ class PlaceOrder():
 			logger.error(e)
 			err_msg = "New order cannot be created."
 		finally: 
-			session.close()
+			session.close() # return connection to the pool
 			logger.info("Closed database session.")
-		engine.dispose() # Prevent OperationalError: (psycopg2.OperationalError) FATAL:  sorry, too many clients already
+		return new_order_item, err_msg
+
+	def enqueue_new_order(self):
+		"""
+		Reserve the id of the new order from the sequence of Order, and queue the order
+		in OrderIngestQueue for order_ingest.OrderIngestWorker, in one transaction.
+		Return dict of the pending order, its distance is None until ingested.
+		With an idempotency claim, the response is stored in its key in the same transaction.
+		Roll back if exception caught.
+		"""
+		new_order_item = {}
+		err_msg = None
+		session = get_session()
+		try:
+			order_id = session.execute(text("""SELECT nextval(pg_get_serial_sequence('"Order"', 'id'))""")).scalar()
+			session.add(OrderIngestQueue(id=order_id, payload={
+				'origin': [self.origin_lat, self.origin_lng],
+				'destination': [self.destination_lat, self.destination_lng]
+			}))
+			new_order_item = {'id': order_id, 'distance': None, 'status': 'PENDING'}
+			if self.idempotency:
+				self.idempotency.complete(session, 202, new_order_item, order_id)
+			session.commit()
+			logger.info("Queued new order with id %s." % (order_id,))
+		except Exception as e:
+			session.rollback()
+			logger.error("Roll back queue new order.")
+			logger.error(e)
+			err_msg = "New order cannot be created."
+		finally:
+			session.close()
 		return new_order_item, err_msg
 
 	def run_place_order(self):
@@ -159,18 +201,21 @@ class PlaceOrder():
 		Return error message immediately if any error message been returned from any class functions,
 		with newly inserted order being None.
 		otherwise returns newly inserted order with None error message.
+		With ORDER_INGEST_MODE 'async', the order is queued instead, and returned with status PENDING.
 		"""
 		new_order_item = None
 		err_msg = None
-		if self.inputs.validate():
-			self.origin_lat = float(self.request.json['origin'][0])
-			self.origin_lng = float(self.request.json['origin'][1])
-			self.destination_lat = float(self.request.json['destination'][0])
-			self.destination_lng = float(self.request.json['destination'][1])
-			validated, err_msg = self.validate_latlng_range()
-			if validated:
+		with phase_timer('validate'):
+			validated = self.inputs.validate() #jsonschema, float conversion and lat/lng range in one pass
+		if validated:
+			self.origin_lat, self.origin_lng, self.destination_lat, self.destination_lng = self.inputs.value
+			if ORDER_INGEST_MODE == 'async':
+				with phase_timer('db'):
+					return self.enqueue_new_order()
+			with phase_timer('distance'):
 				distance, err_msg = self.get_distance()
-				if distance:
+			if distance is not None:
+				with phase_timer('db'):
 					new_order_item, err_msg = self.insert_new_order(distance)
 		else:
 			err_msg = '. '.join(self.inputs.errors)
@@ -0,0 +1,87 @@
+import json, logging, re, time, uuid
+from flask import g, request, has_request_context
+
+#Request scoped context kept in flask.g: request id and phase timings.
+#This module must not import order_app.settings nor utilities.logger,
+#logger.json refers to RequestIdFilter while logging is being configured.
+
+request_id_header = 'X-Request-ID'
+request_id_regex = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+
+
+def start_request():
+	"""
+	Set up the context of the current request: request id from nginx's X-Request-ID header
+	(generated if missing or malformed), start time and phase timings in milliseconds.
+	"""
+	request_id = request.headers.get(request_id_header)
+	if not request_id or not request_id_regex.match(request_id):
+		request_id = uuid.uuid4().hex
+	g.request_id = request_id
+	g.request_started = time.perf_counter()
+	g.timings = {}
+
+def current_request_id():
+	"""
+	Return request id of the current request, '-' outside of a request context.
+	"""
+	if has_request_context():
+		return getattr(g, 'request_id', '-')
+	return '-'
+
+def request_duration():
+	"""
+	Return seconds elapsed since the current request started, None if unknown.
+	"""
+	started = getattr(g, 'request_started', None)
+	if started is None:
+		return None
+	return time.perf_counter() - started
+
+def request_log_line(response, duration=None):
+	"""
+	Return one json line describing the current request and its response,
+	with total duration (seconds, measured now if not given) and phase timings in milliseconds.
+	"""
+	if duration is None:
+		duration = request_duration()
+	return json.dumps({
+		'request_id': current_request_id(),
+		'method': request.method,
+		'path': request.path,
+		'status': response.status_code,
+		'duration_ms': round(duration * 1000, 3) if duration is not None else None,
+		'timings_ms': dict((phase, round(ms, 3)) for phase, ms in getattr(g, 'timings', {}).items()),
+	}, separators=(',', ':'))
+
+
+class phase_timer():
+	"""
+	Context manager adding the time spent in its block to phase (e.g. 'validate', 'distance', 'db')
+	of the current request. Outside of a request context the time is measured but not recorded.
+	"""
+
+	def __init__(self, phase):
+		self.phase = phase
+		self.started = None
+		self.elapsed_ms = None
+
+	def __enter__(self):
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+		if has_request_context() and hasattr(g, 'timings'):
+			g.timings[self.phase] = g.timings.get(self.phase, 0) + self.elapsed_ms
+		return False
+
+
+class RequestIdFilter(logging.Filter):
+	"""
+	Add request_id of the current request to every log record (see logger.json).
+	"""
+
+	def filter(self, record):
+		record.request_id = current_request_id()
+		return True
@@ -10,8 +10,11 @@ DATABASE = {
     'database': os.getenv('DB_NAME')
 }
 
+#threads (uwsgi.ini) or gevent (uwsgi-gevent.ini): cooperative requests, see wsgi.py.
+CONCURRENCY = os.getenv("CONCURRENCY", "threads")
+
 app = Flask(__name__)
-app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False #compact JSON, indented with ?pretty=1
 app.config['SQLALCHEMY_DATABASE_URI'] = "%s://%s:%s@%s:%s/%s" % (
 	DATABASE['drivername'], DATABASE['username'], 
 	DATABASE['password'], DATABASE['host'], 
@@ -19,7 +22,97 @@ app.config['SQLALCHEMY_DATABASE_URI'] = "%s://%s:%s@%s:%s/%s" % (
 	)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "order_app") #application_name of the connections of the app, in pg_stat_activity
+
+#Connection pool of the process-wide engine, shared by all threads of a uWSGI worker.
+#Keep processes * (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1 LISTEN connection of order changes) below Postgres max_connections.
+DB_POOL = {
+	'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+	'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+	'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)), #seconds to wait for a free connection
+	'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)), #seconds before a connection is replaced
+	'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+	'connect_args': {'application_name': DB_APPLICATION_NAME}
+}
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = DB_POOL
+
+#JSON responses (order_app/json_response.py).
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto") #orjson, json (stdlib) or auto: orjson if installed
+JSON_STREAM_MIN_ITEMS = int(os.getenv("JSON_STREAM_MIN_ITEMS", 500)) #GET /orders pages of this many orders are streamed from the query
+JSON_STREAM_CHUNK = int(os.getenv("JSON_STREAM_CHUNK", 100)) #orders fetched and encoded per streamed chunk
+
 GMAP_TOKEN = os.getenv("GMAP_TOKEN")
 GMAP_DISTANCE_MATRIX_API = os.getenv("GMAP_DISTANCE_MATRIX_API")
 
+#Google Map Distance Matrix API client, one per uWSGI worker.
+GMAP_CONNECT_TIMEOUT = float(os.getenv("GMAP_CONNECT_TIMEOUT", 3.05)) #seconds
+GMAP_READ_TIMEOUT = float(os.getenv("GMAP_READ_TIMEOUT", 5)) #seconds
+GMAP_POOL_MAXSIZE = int(os.getenv("GMAP_POOL_MAXSIZE", 10)) #keep-alive connections, one per uWSGI thread
+GMAP_MAX_RETRIES = int(os.getenv("GMAP_MAX_RETRIES", 2)) #retries after the first attempt
+GMAP_BACKOFF_BASE = float(os.getenv("GMAP_BACKOFF_BASE", 0.1)) #seconds, doubled on every retry
+GMAP_BACKOFF_MAX = float(os.getenv("GMAP_BACKOFF_MAX", 1)) #seconds
+GMAP_BREAKER_FAILURE_THRESHOLD = int(os.getenv("GMAP_BREAKER_FAILURE_THRESHOLD", 5)) #consecutive failures to open the breaker
+GMAP_BREAKER_RESET_TIMEOUT = float(os.getenv("GMAP_BREAKER_RESET_TIMEOUT", 30)) #seconds before a trial request
+
+#How PlaceOrder gets distances:
+#'gmap': Google Map Distance Matrix API.
+#'haversine': local great-circle distance multiplied by HAVERSINE_ROAD_FACTOR, no network.
+#'gmap_with_fallback': Google Map Distance Matrix API, haversine estimate when it times out or the breaker is open.
+DISTANCE_STRATEGY = os.getenv("DISTANCE_STRATEGY", "gmap")
+HAVERSINE_ROAD_FACTOR = float(os.getenv("HAVERSINE_ROAD_FACTOR", 1)) #roads are longer than great circles, e.g. 1.3
+
+#Distance cache in front of Google Map Distance Matrix API.
+#Backend: 'local' (per uWSGI worker), 'database' (DistanceCache table shared by all workers) or 'none'.
+DISTANCE_CACHE_BACKEND = os.getenv("DISTANCE_CACHE_BACKEND", "local")
+DISTANCE_CACHE_TTL = int(os.getenv("DISTANCE_CACHE_TTL", 86400)) #seconds
+DISTANCE_CACHE_MAX_SIZE = int(os.getenv("DISTANCE_CACHE_MAX_SIZE", 10000))
+DISTANCE_CACHE_TOUCH_INTERVAL = int(os.getenv("DISTANCE_CACHE_TOUCH_INTERVAL", 60)) #seconds, database backend: a hit moves its row up the LRU at most this often
+
+TAKE_ORDER_LOCK_TIMEOUT_MS = int(os.getenv("TAKE_ORDER_LOCK_TIMEOUT_MS", 2000)) #max wait for the row lock of a concurrent take
+
+BULK_ORDER_MAX_ITEMS = int(os.getenv("BULK_ORDER_MAX_ITEMS", 500)) #orders per POST /orders/bulk request
+
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", 5)) #seconds a readiness database probe is reused
+
+#How POST /orders inserts orders:
+#'sync': get the distance and insert the order before responding.
+#'async': reserve the order id, queue the order in OrderIngestQueue and respond with status PENDING,
+#background workers get the distances in batches and insert the orders (poll GET /orders/<id>).
+ORDER_INGEST_MODE = os.getenv("ORDER_INGEST_MODE", "sync")
+ORDER_INGEST_IN_PROCESS = os.getenv("ORDER_INGEST_IN_PROCESS", "true").lower() == "true" #a worker thread per uWSGI worker, else run order_app/order_ingest.py
+ORDER_INGEST_BATCH_SIZE = int(os.getenv("ORDER_INGEST_BATCH_SIZE", 100)) #queued orders per batch
+ORDER_INGEST_POLL_INTERVAL = float(os.getenv("ORDER_INGEST_POLL_INTERVAL", 1)) #seconds between polls of an empty queue
+ORDER_INGEST_MAX_ATTEMPTS = int(os.getenv("ORDER_INGEST_MAX_ATTEMPTS", 5)) #attempts to ingest an order before FAILED
+ORDER_INGEST_LEASE = int(os.getenv("ORDER_INGEST_LEASE", 120)) #seconds a claimed order stays PROCESSING before it can be claimed again
+
+#Read-through cache of GET /orders/<id>, per uWSGI worker.
+#A worker invalidates the orders it changes, the other workers may serve them stale for up to ORDER_CACHE_TTL.
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", 2)) #seconds
+ORDER_CACHE_MAX_SIZE = int(os.getenv("ORDER_CACHE_MAX_SIZE", 10000))
+
+#Total count of GET /orders?page=&limit= (X-Total-Count), cached per uWSGI worker and status.
+#Without status, pg_class.reltuples estimates the count once it reaches ORDER_COUNT_ESTIMATE_MIN rows.
+ORDER_COUNT_TTL = float(os.getenv("ORDER_COUNT_TTL", 10)) #seconds
+ORDER_COUNT_ESTIMATE_MIN = int(os.getenv("ORDER_COUNT_ESTIMATE_MIN", 100000))
+
+#GET /orders/export: orders fetched from the server-side cursor and sent per chunk.
+ORDER_EXPORT_CHUNK = int(os.getenv("ORDER_EXPORT_CHUNK", 1000))
+
+#GET /orders/changes: change feed ordered by (updated_at, id), long-polled up to wait seconds.
+ORDER_CHANGES_LIMIT = int(os.getenv("ORDER_CHANGES_LIMIT", 100)) #default limit
+ORDER_CHANGES_MAX_LIMIT = int(os.getenv("ORDER_CHANGES_MAX_LIMIT", 1000))
+ORDER_CHANGES_MAX_WAIT = float(os.getenv("ORDER_CHANGES_MAX_WAIT", 25)) #seconds, below nginx uwsgi_read_timeout (60s)
+ORDER_CHANGES_POLL_INTERVAL = float(os.getenv("ORDER_CHANGES_POLL_INTERVAL", 5)) #seconds, re-query even without NOTIFY
+#Changes are returned once updated_at is this old: updated_at is the start of the changing transaction,
+#so a transaction committing later than that could otherwise be skipped by a cursor already past it.
+ORDER_CHANGES_SETTLE = float(os.getenv("ORDER_CHANGES_SETTLE", 1)) #seconds
+ORDER_CHANGES_MAX_WAITERS = int(os.getenv("ORDER_CHANGES_MAX_WAITERS", 5)) #long-polls held per uWSGI worker (threads = 10)
+
+#Idempotency-Key of POST /orders.
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 86400)) #seconds a key is kept, then purged
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 30)) #seconds a repeat waits for the first request, then 409
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv("IDEMPOTENCY_POLL_INTERVAL", 0.2)) #seconds between checks of a key in progress
+IDEMPOTENCY_PENDING_TIMEOUT = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", 120)) #seconds a key stays in progress before the next request takes it over
+IDEMPOTENCY_PURGE_INTERVAL = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", 300)) #seconds between purges per uWSGI worker
+
 TEST_DIR = os.path.join(os.getenv("BASEDIR"), "tests")
\ No newline at end of file
@@ -1,11 +1,13 @@
-import json
 from flask import request
-from flask_inputs import Inputs
-from flask_inputs.validators import JsonSchema
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import update
 from sqlalchemy.exc import OperationalError
 from utilities.logger import get_logger
-from order_app.models import db_connect, Order
+from order_app.settings import TAKE_ORDER_LOCK_TIMEOUT_MS
+from order_app.models import get_session, utcnow, Order
+from order_app.validators import FastInputs, validate_status
+from order_app.request_context import phase_timer
+from order_app.metrics import TAKE_ORDER_OUTCOMES
+from order_app.order_detail import invalidate_order
 
 logger = get_logger('flask_order_app')
 
@@ -21,8 +23,9 @@ status_schema = {
 	'additionalProperties': False
 }
 
-class StatusSchema(Inputs):
-   json = [JsonSchema(schema=status_schema)]
+class StatusSchema(FastInputs):
+   #status_schema, precompiled (see order_app/validators.py)
+   validator = staticmethod(validate_status)
 
 class TakeOrder():
 
@@ -31,12 +34,11 @@ class TakeOrder():
 		self.request = request
 		self.inputs = StatusSchema(self.request)
 		self.new_status = None
-		self.engine = db_connect()
-		self.Session = sessionmaker(bind=self.engine)
+		self.outcome = None #success, already_taken, not_found, lock_contention, error or invalid
 
 	def validate_json(self):
 		"""
-		Validate json input with jsonschema.
+		Validate json input against status_schema.
 		Json should contain one field 'status' with value 'TAKEN'
 		"""
 		err_msg = None
@@ -50,51 +52,59 @@ class TakeOrder():
 
 	def update_order_status(self):
 		"""
-		1. query order
-		2. check if order exists (.scalar() is not None), but if order locked --> OperationalError. 
-			else obtain a lock on the row.
-		3. take one, and does the update operation.
+		Take the order with one conditional statement:
+		UPDATE "Order" SET status = 'TAKEN' WHERE id = :id AND status <> 'TAKEN' RETURNING id, status
+		1. a returned row means the order is taken by this request, commit.
+		2. no returned row means the order is already taken or does not exist,
+			only then a cheap primary key lookup tells them apart.
+		3. concurrent requests on the same order wait for the row lock of the first one
+			(at most TAKE_ORDER_LOCK_TIMEOUT_MS, else OperationalError), then find it already taken.
 		4. if update or commit has errors occur, rollback and fail.
 		"""
 		success = False
 		err_msg = None
-		engine = db_connect()
-		Session = sessionmaker(bind=engine)
-		session = Session()
+		session = get_session() # connection checked out from the pooled engine
 		logger.info("Created database session.")
 		try:
-			#Row level lock (FOR UPDATE clause: 
-			#other transactions that attempt UPDATE, DELETE, or SELECT FOR UPDATE of these rows will be blocked until the current transaction ends.
-			#With nowait=True, the statement reports an error, rather than waiting, if a selected row cannot be locked immediately.
-			order_query = session.query(Order).filter(Order.id==self.order_id).with_for_update(nowait=True, of=Order)
-			#row lock is only obatain when query executes.
-			if order_query.scalar(): #check if exists and obtain lock 
-				order = order_query.one()
-				if not order.status == 'TAKEN':
-					order.status = self.request.json['status']
-					session.commit() #commit update, release row lock
-					logger.info("Order (id: %s) status is sucessfully updated to %s." % (order.id, order.status))
-					success = True
-				else:
+			session.execute("SET LOCAL lock_timeout = %d" % (TAKE_ORDER_LOCK_TIMEOUT_MS,))
+			taken_order = session.execute(
+				update(Order.__table__)
+				.where(Order.id == self.order_id)
+				.where(Order.status != 'TAKEN')
+				.values(status=self.request.json['status'], updated_at=utcnow())
+				.returning(Order.id, Order.status)
+			).fetchone()
+			if taken_order:
+				session.commit() #commit update, release row lock
+				logger.info("Order (id: %s) status is sucessfully updated to %s." % (taken_order[0], taken_order[1]))
+				success = True
+				self.outcome = 'success'
+			else:
+				session.rollback()
+				if session.query(Order.id).filter(Order.id == self.order_id).scalar() is not None:
 					err_msg = "Order is already taken."
+					self.outcome = 'already_taken'
 					logger.info("Order is already taken.")
-			else:
-				err_msg = "Order does not exist."
-				logger.info("Order with id %s does not exist." % (self.order_id,))
-		except OperationalError as e: #catch exception of psycopg2.errors.LockNotAvailable
+				else:
+					err_msg = "Order does not exist."
+					self.outcome = 'not_found'
+					logger.info("Order with id %s does not exist." % (self.order_id,))
+		except OperationalError as e: #catch exception of psycopg2.errors.LockNotAvailable (lock_timeout)
 			session.rollback()
 			err_msg = "Order is currently occupied. Update status to TAKEN fail."
+			self.outcome = 'lock_contention'
 			logger.info("Roll back update order with id %s." % (self.order_id,))
 			logger.info("OperationalError caught: %s." % (e,))
 		except Exception as e:
 			session.rollback()
 			err_msg = "Cannot update order status with id %s. " % (self.order_id,)
+			self.outcome = 'error'
 			logger.info("Roll back update order with id %s." % (self.order_id,))
 			logger.error(e)
 		finally:
-			session.close() #release row lock
+			session.close() #release row lock, return connection to the pool
 			logger.info("Closed database session.")
-		engine.dispose() # Prevent OperationalError: (psycopg2.OperationalError) FATAL:  sorry, too many clients already
+			invalidate_order(self.order_id) #the cached status is stale, whatever the outcome
 		return success, err_msg
 
 	def run_take_order(self):
@@ -103,9 +113,14 @@ class TakeOrder():
 		"""
 		order_item = None
 		err_msg = None
-		validated, err_msg = self.validate_json()
+		with phase_timer('validate'):
+			validated, err_msg = self.validate_json()
 		if validated:
-			order_item, err_msg = self.update_order_status()
+			with phase_timer('db'):
+				order_item, err_msg = self.update_order_status()
+		else:
+			self.outcome = 'invalid'
+		TAKE_ORDER_OUTCOMES.labels(self.outcome).inc()
 		return order_item, err_msg
 		
 
@@ -0,0 +1,133 @@
+import re
+from utilities.logger import get_logger
+
+logger = get_logger('flask_order_app')
+
+#Request json validators compiled once at import time.
+#They replace per request jsonschema validation of coorindate_schema (place_order.py)
+#and status_schema (take_order.py), and return the same error message jsonschema.validate
+#would raise: its best match, the first error at the shallowest path of the json.
+
+number_string_pattern = r'^\d+(?:\.\d+)?$'
+number_string_regex = re.compile(number_string_pattern)
+coordinate_properties = ('origin', 'destination')
+
+taken_status_pattern = '^TAKEN$'
+taken_status_regex = re.compile(taken_status_pattern)
+
+
+def _object_error(data, properties, required):
+	"""
+	Error at the top level of the json object, in jsonschema order:
+	type, then required properties, then additional properties.
+	"""
+	if not isinstance(data, dict):
+		return "%r is not of type 'object'" % (data,)
+	for name in required:
+		if name not in data:
+			return "%r is a required property" % (name,)
+	extras = set(name for name in data if name not in properties)
+	if extras:
+		return "Additional properties are not allowed (%s %s unexpected)" % (
+			", ".join(repr(extra) for extra in extras), 'was' if len(extras) == 1 else 'were')
+	return None
+
+def _coordinate_error(coordinate):
+	"""
+	Error of one coordinate (array of 2 number strings) at the level of the array itself.
+	"""
+	if not isinstance(coordinate, list):
+		return "%r is not of type 'array'" % (coordinate,)
+	if len(coordinate) < 2:
+		return "%r is too short" % (coordinate,)
+	if len(coordinate) > 2:
+		return "Additional items are not allowed (%s %s unexpected)" % (
+			", ".join(repr(extra) for extra in coordinate[2:]), 'was' if len(coordinate) == 3 else 'were')
+	return None
+
+def _string_error(value, regex, pattern):
+	if not isinstance(value, str):
+		return "%r is not of type 'string'" % (value,)
+	if not regex.search(value):
+		return "%r does not match %r" % (value, pattern)
+	return None
+
+def validate_coordinates(data):
+	"""
+	Validate request json of an order against coorindate_schema, convert the coordinates into floats
+	and check their range (see place_order.validate_latlng_range), in one pass.
+	Return ((origin_lat, origin_lng, destination_lat, destination_lng), None) if valid,
+	else (None, err_msg).
+	"""
+	err_msg = _object_error(data, coordinate_properties, coordinate_properties)
+	if err_msg:
+		return None, err_msg
+	origin = data['origin']
+	destination = data['destination']
+	err_msg = _coordinate_error(origin) or _coordinate_error(destination)
+	if err_msg:
+		return None, err_msg
+	for value in (origin[0], origin[1], destination[0], destination[1]):
+		err_msg = _string_error(value, number_string_regex, number_string_pattern)
+		if err_msg:
+			return None, err_msg
+	coordinates = (float(origin[0]), float(origin[1]), float(destination[0]), float(destination[1]))
+	err_msg = latlng_range_error(*coordinates)
+	if err_msg:
+		return None, err_msg
+	return coordinates, None
+
+def latlng_range_error(origin_lat, origin_lng, destination_lat, destination_lng):
+	"""
+	Validate the origins' and destinations' (lat, lng).
+	-90 <= lat <= 90
+	-180 <= lng <= 180
+	Return error message if any lat or lng validation fails
+	and display all lat and lng values that do not fall within the range, else None.
+	"""
+	errors = []
+	if origin_lat >= 90 or origin_lat <= -90:
+		errors.append('origin latitude: %s' % (origin_lat,))
+	if destination_lat >= 90 or destination_lat <= -90:
+		errors.append('destination latitude: %s' % (destination_lat,))
+	if origin_lng >= 180 or origin_lng <= -180:
+		errors.append('origin longitude: %s' % (origin_lng,))
+	if destination_lng >= 180 or destination_lng <= -180:
+		errors.append('destination longitude: %s' % (destination_lng,))
+	if errors:
+		logger.info("Validation fail, %s not withint range." % (', '.join(errors),))
+		return "Wrong input, %s must be within range. -90<=latitude<=90, -180<=longitude<= 180." % (', '.join(errors),)
+	return None
+
+def validate_status(data):
+	"""
+	Validate request json of taking an order against status_schema.
+	Return (status, None) if valid, else (None, err_msg).
+	"""
+	err_msg = _object_error(data, ('status',), ('status',)) or \
+		_string_error(data['status'], taken_status_regex, taken_status_pattern)
+	if err_msg:
+		return None, err_msg
+	return data['status'], None
+
+
+class FastInputs():
+	"""
+	Drop-in for flask_inputs.Inputs subclasses: validate() returns True if request.json is valid,
+	otherwise adds the error message to errors.
+	Subclasses set validator = staticmethod(<one of the validators above>),
+	the value it parses is kept in value.
+	"""
+	validator = None
+
+	def __init__(self, request):
+		self.errors = []
+		self.value = None
+		self._request = request
+
+	def validate(self):
+		self.value, err_msg = self.validator(self._request.json)
+		if err_msg:
+			self.errors.append(err_msg)
+			return False
+		return True
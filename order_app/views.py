@@ -1,28 +1,114 @@
-from flask import escape, request, jsonify
+from flask import request, Response
 from order_app.place_order import PlaceOrder
+from order_app.place_bulk_orders import PlaceBulkOrders
 from order_app.take_order import TakeOrder
-from order_app.order_list import OrderList
+from order_app.order_list import OrderList, decode_cursor, order_statuses
+from order_app.health import Readiness
+from order_app.order_detail import OrderDetail
+from order_app.order_export import OrderExport, export_formats, parse_since
+from order_app.order_changes import OrderChanges, decode_change_cursor
+from order_app.idempotency import IdempotencyClaim, idempotency_key_header, idempotency_key_regex, retry_after
+from order_app.order_ingest import notify_order_queued
+from order_app import request_context, metrics
+from order_app.json_response import jsonify, jsonify_list
 from utilities.logger import get_logger
-from order_app.settings import app
+from order_app.settings import app, ORDER_CHANGES_LIMIT, ORDER_CHANGES_MAX_LIMIT, ORDER_CHANGES_MAX_WAIT, JSON_STREAM_MIN_ITEMS
 
 logger = get_logger('flask_order_app')
+access_logger = get_logger('access')
+
+@app.before_request
+def start_request_context():
+	request_context.start_request()
+
+@app.after_request
+def log_request(response):
+	"""
+	Echo the request id, log one json line per request with its phase timings,
+	and record its count and latency in the metrics of its route.
+	"""
+	duration = request_context.request_duration()
+	response.headers[request_context.request_id_header] = request_context.current_request_id()
+	access_logger.info(request_context.request_log_line(response, duration))
+	metrics.observe_request(request.endpoint, request.method, response.status_code, duration)
+	return response
 
 # Healthcheck
 @app.route('/healthcheck')
 def healthcheck():
 	return jsonify({'data': 'hello world.'})
 
+# Liveness: the worker answers, dependencies are not checked
+@app.route('/healthcheck/live')
+def liveness_view():
+	return jsonify({'status': 'alive'})
+
+# Readiness: the worker can serve orders (database, connection pool, Distance Matrix breaker)
+@app.route('/healthcheck/ready')
+def readiness_view():
+	ready, report = Readiness().run_readiness()
+	response = jsonify({'status': 'ready' if ready else 'unready', 'checks': report})
+	response.status_code = 200 if ready else 503
+	return response
+
+# Prometheus metrics, aggregated over all uWSGI workers
+@app.route('/metrics')
+def metrics_view():
+	data, content_type = metrics.render_metrics()
+	return Response(data, content_type=content_type)
+
 @app.route('/orders', methods=['POST'])
 def place_order_view():
 	logger.info('Requested json data: (%s, %s).' % (request.json['origin'], request.json['destination']))
-	order = PlaceOrder(request=request)
+	idempotency_key = request.headers.get(idempotency_key_header)
+	if idempotency_key is None:
+		return place_order(PlaceOrder(request=request))
+	if not idempotency_key_regex.match(idempotency_key):
+		response = jsonify({'error': 'Header %s must be 1 to 255 printable ASCII characters without spaces.' % (idempotency_key_header,)})
+		response.status_code = 400
+		return response
+	claim = IdempotencyClaim(idempotency_key, request.json)
+	response_status, response_body, err = claim.claim()
+	if err:
+		response = jsonify({'error': err[0]})
+		response.status_code = err[1]
+		if err[1] == 503: #the database failed, not the request
+			response.headers['Retry-After'] = str(retry_after)
+		return response
+	if response_body is not None: #repeat, without placing the order again
+		response = jsonify(response_body)
+		response.status_code = response_status
+		response.headers['Idempotent-Replayed'] = 'true'
+		return response
+	try:
+		return place_order(PlaceOrder(request=request, idempotency=claim))
+	finally:
+		claim.release()
+
+def place_order(order):
 	new_order_item, err_msg = order.run_place_order()
+	if new_order_item and new_order_item['status'] == 'PENDING':
+		notify_order_queued()
+		response = jsonify(new_order_item)
+		response.status_code = 202 #poll GET /orders/<id> until ingested
+		return response
 	if new_order_item:
 		return jsonify(new_order_item)
 	response = jsonify({'error': err_msg})
 	response.status_code = 400
 	return response
 
+@app.route('/orders/bulk', methods=['POST'])
+def place_bulk_orders_view():
+	logger.info('Requested bulk orders.')
+	orders = PlaceBulkOrders(request=request)
+	results, err_msg = orders.run_place_bulk_orders()
+	if results is not None:
+		return jsonify(results)
+	response = jsonify({'error': err_msg})
+	response.status_code = 400
+	return response
+
 
 @app.route('/orders/<order_id>', methods=['PATCH'])
 def take_order_view(order_id):
@@ -42,8 +128,89 @@ def take_order_view(order_id):
 	response.status_code = 400
 	return response
 
+@app.route('/orders/export', methods=['GET'])
+def order_export_view():
+	"""
+	GET /orders/export?format=ndjson|csv&status=&since=, all orders streamed in one response.
+	X-Accel-Buffering tells nginx to pass the chunks on as they come, instead of buffering the response.
+	"""
+	export_format = request.args.get('format', 'ndjson')
+	status = request.args.get('status')
+	try:
+		if export_format not in export_formats or (status is not None and status not in order_statuses):
+			raise ValueError(export_format)
+		since = request.args.get('since')
+		if since is not None:
+			since = parse_since(since)
+	except ValueError:
+		response = jsonify({'error': 'Argument format must be one of %s, status one of %s, and since an ISO 8601 date or datetime (UTC).' % (
+			', '.join(export_formats), ', '.join(order_statuses))})
+		response.status_code = 400
+		return response
+	export, session, err_msg = OrderExport(export_format=export_format, status=status, since=since).run_order_export()
+	if err_msg:
+		response = jsonify({'error': err_msg})
+		response.status_code = 400
+		return response
+	response = Response(export, mimetype=export_formats[export_format])
+	response.call_on_close(session.close) #returns the connection to the pool once sent, or the client is gone
+	response.headers['Content-Disposition'] = 'attachment; filename=orders.%s' % (export_format,)
+	response.headers['X-Accel-Buffering'] = 'no'
+	return response
+
+@app.route('/orders/changes', methods=['GET'])
+def order_changes_view():
+	"""
+	GET /orders/changes?cursor=&since=&limit=&wait=, orders changed after cursor (or since), oldest first.
+	With wait, the request is held up to wait seconds until there are changes.
+	"""
+	try:
+		after = None
+		if request.args.get('cursor'):
+			after = decode_change_cursor(request.args.get('cursor'))
+		elif request.args.get('since'):
+			after = (parse_since(request.args.get('since')), 0)
+		limit = int(request.args.get('limit', ORDER_CHANGES_LIMIT))
+		wait = float(request.args.get('wait', 0))
+		if not 1 <= limit <= ORDER_CHANGES_MAX_LIMIT or not 0 <= wait <= ORDER_CHANGES_MAX_WAIT:
+			raise ValueError(limit, wait)
+	except ValueError:
+		response = jsonify({'error': 'Argument cursor must be a next_cursor returned by GET /orders/changes, since an ISO 8601 date or datetime (UTC), limit an integer from 1 to %s and wait seconds from 0 to %s.' % (
+			ORDER_CHANGES_MAX_LIMIT, ORDER_CHANGES_MAX_WAIT)})
+		response.status_code = 400
+		return response
+	order_items, next_cursor, err_msg = OrderChanges(after=after, limit=limit, wait=wait).run_order_changes()
+	if order_items is not None:
+		return jsonify({'orders': order_items, 'next_cursor': next_cursor})
+	response = jsonify({'error': err_msg})
+	response.status_code = 400
+	return response
+
+@app.route('/orders/<order_id>', methods=['GET'])
+def order_detail_view(order_id):
+	try:
+		order_id = int(order_id)
+	except:
+		response = jsonify({'error': 'id of order must be integer or string that contains only one integer.'})
+		response.status_code = 400
+		return response
+	order = OrderDetail(order_id=order_id)
+	order_item, err_msg = order.run_order_detail()
+	if order_item:
+		return jsonify(order_item)
+	response = jsonify({'error': err_msg or 'Order does not exist.'})
+	response.status_code = 400 if err_msg else 404
+	return response
+
 @app.route('/orders', methods=['GET'])
 def order_list_view():
+	status = request.args.get('status')
+	if status is not None and status not in order_statuses:
+		response = jsonify({'error': 'Argument status must be one of %s.' % (', '.join(order_statuses),)})
+		response.status_code = 400
+		return response
+	if request.args.get('page') is None and request.args.get('limit') is not None:
+		return order_keyset_list_view(status)
 	page = request.args.get('page')
 	limit = request.args.get('limit')
 	try:
@@ -53,13 +220,82 @@ def order_list_view():
 		response = jsonify({'error': 'Both arguments page and limit are required, and must be integer or string of integers only.'})
 		response.status_code = 400
 		return response
-	order_list = OrderList(page=page, limit=limit)
-	order_items, err_msg = order_list.query_paginated_orders()
-	if order_items is not None: #order_items can be []
-		return jsonify(order_items)
+	order_list = OrderList(page=page, limit=limit, status=status)
+	validators, response = conditional_list_response(order_list)
+	if response is not None:
+		return response
+	if limit >= JSON_STREAM_MIN_ITEMS: #streamed from the query, JSON_STREAM_CHUNK orders at a time
+		order_items, session, err_msg = order_list.stream_paginated_orders()
+		if order_items is not None:
+			response = jsonify_list(order_items)
+			if session is not None:
+				response.call_on_close(session.close) #returns the connection to the pool once sent, or the client is gone
+	else:
+		order_items, err_msg = order_list.query_paginated_orders()
+		if order_items is not None: #order_items can be []
+			response = jsonify(order_items)
+	if order_items is not None:
+		set_list_validators(response, validators)
+		total, count_err_msg = order_list.total_count()
+		if total is not None:
+			response.headers['X-Total-Count'] = str(total)
+		return response
 	response = jsonify({'error': err_msg})
 	response.status_code = 400
 	return response
 
+def order_keyset_list_view(status):
+	"""
+	GET /orders?limit=&cursor= (or after_id=), cursor (keyset) pagination without page.
+	Responds with the orders and the cursor of the next page.
+	"""
+	try:
+		limit = int(request.args.get('limit'))
+		if limit < 1:
+			raise ValueError(limit)
+		after_id = request.args.get('after_id')
+		if request.args.get('cursor'):
+			after_id = decode_cursor(request.args.get('cursor'))['id']
+		if after_id is not None:
+			after_id = int(after_id)
+	except:
+		response = jsonify({'error': 'Argument limit must be a positive integer, after_id must be integer and cursor must be a next_cursor returned by GET /orders.'})
+		response.status_code = 400
+		return response
+	order_list = OrderList(limit=limit, after_id=after_id, status=status)
+	validators, response = conditional_list_response(order_list)
+	if response is not None:
+		return response
+	order_items, next_cursor, err_msg = order_list.query_keyset_orders()
+	if order_items is not None:
+		return set_list_validators(jsonify({'orders': order_items, 'next_cursor': next_cursor}), validators)
+	response = jsonify({'error': err_msg})
+	response.status_code = 400
+	return response
 
+def conditional_list_response(order_list):
+	"""
+	Evaluate If-None-Match (or else If-Modified-Since) of GET /orders against the validators of the listing.
+	Return the validators (None if they cannot be queried, the listing is then served unconditionally),
+	and a 304 response without body if the client's copy is still current, else None.
+	"""
+	etag, last_modified, err_msg = order_list.list_validators()
+	if err_msg or etag is None:
+		return None, None
+	if request.if_none_match:
+		fresh = request.if_none_match.contains_weak(etag)
+	elif request.if_modified_since and last_modified:
+		fresh = last_modified.replace(microsecond=0) <= request.if_modified_since #HTTP dates have no microseconds
+	else:
+		fresh = False
+	if not fresh:
+		return (etag, last_modified), None
+	return (etag, last_modified), set_list_validators(Response(status=304), (etag, last_modified))
 
+def set_list_validators(response, validators):
+	if validators is not None:
+		etag, last_modified = validators
+		response.set_etag(etag)
+		if last_modified is not None:
+			response.last_modified = last_modified
+	return response
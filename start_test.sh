@@ -1,5 +1,6 @@
+rm -rf $prometheus_multiproc_dir && mkdir -p $prometheus_multiproc_dir && chown www-data:www-data $prometheus_multiproc_dir
 cd /home && python order_app/create_tables.py
-touch error_rotate.log && touch info_rotate.log
-chmod 666 error_rotate.log && chmod 666 info_rotate.log
+touch error_rotate.log && touch info_rotate.log && touch access_rotate.log
+chmod 666 error_rotate.log && chmod 666 info_rotate.log && chmod 666 access_rotate.log
 make test-unit
 make test-integration
\ No newline at end of file
@@ -0,0 +1,109 @@
+import argparse, json, os, random, subprocess, sys, tempfile, threading, time
+import urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from tests.support.fake_distance_matrix import Faults, make_server, matrix_path
+
+#POST /orders under injected Google Map Distance Matrix API latency, one uWSGI worker
+#with threads (uwsgi.ini) and with the gevent loop (uwsgi-gevent.ini).
+#Runs uWSGI from the app container (needs the database environment variables of docker-compose.yml):
+#   docker exec -it order-api-app make benchmark-concurrency
+
+BASEDIR = os.getenv('BASEDIR', os.getcwd())
+
+
+def uwsgi_ini(ini, port, processes):
+	"""
+	Copy of ini serving HTTP on port with processes workers, instead of the socket of nginx,
+	running as the current user.
+	"""
+	lines = []
+	with open(os.path.join(BASEDIR, ini)) as f:
+		for line in f.read().splitlines():
+			if line.startswith(('socket', 'chmod-sock', 'processes', 'chdir', 'uid', 'gid')):
+				continue
+			lines.append(line)
+	lines += ['http-socket = 127.0.0.1:%s' % (port,), 'processes = %s' % (processes,), 'chdir = %s' % (BASEDIR,)]
+	ini_file = tempfile.NamedTemporaryFile('w', suffix='.ini', delete=False)
+	ini_file.write('\n'.join(lines) + '\n')
+	ini_file.close()
+	return ini_file.name
+
+def wait_until_live(url, timeout=30):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			urllib.request.urlopen(url + '/healthcheck/live', timeout=1).read()
+			return
+		except Exception:
+			time.sleep(0.2)
+	raise RuntimeError("uWSGI did not start at %s." % (url,))
+
+def place_order(url, timeout):
+	"""
+	POST /orders with random coordinates (distance cache misses). Return seconds, and whether it succeeded.
+	"""
+	body = json.dumps({
+		'origin': ['%.6f' % (random.uniform(22.2, 22.5),), '%.6f' % (random.uniform(114.0, 114.3),)],
+		'destination': ['%.6f' % (random.uniform(22.2, 22.5),), '%.6f' % (random.uniform(114.0, 114.3),)]
+	}).encode('utf-8')
+	request = urllib.request.Request(url + '/orders', data=body, headers={'Content-Type': 'application/json'})
+	started = time.monotonic()
+	try:
+		ok = urllib.request.urlopen(request, timeout=timeout).status == 200
+	except (urllib.error.URLError, OSError):
+		ok = False
+	return time.monotonic() - started, ok
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] if values else None
+
+def run_mode(ini, args, upstream):
+	env = dict(os.environ,
+		GMAP_DISTANCE_MATRIX_API=upstream, GMAP_TOKEN='benchmark', DISTANCE_STRATEGY='gmap', ORDER_INGEST_MODE='sync',
+		GMAP_MAX_RETRIES='0', GMAP_READ_TIMEOUT=str(args.latency * 4 + 5),
+		prometheus_multiproc_dir=tempfile.mkdtemp())
+	url = 'http://127.0.0.1:%s' % (args.port,)
+	ini_file = uwsgi_ini(ini, args.port, args.processes)
+	uwsgi = subprocess.Popen(['uwsgi', '--ini', ini_file], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	try:
+		wait_until_live(url)
+		with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+			started = time.monotonic()
+			results = list(executor.map(lambda i: place_order(url, args.latency * 10 + 30), range(args.requests)))
+			elapsed = time.monotonic() - started
+	finally:
+		uwsgi.terminate()
+		uwsgi.wait()
+		os.unlink(ini_file)
+	latencies = [seconds * 1000 for seconds, ok in results if ok]
+	return {
+		'requests': args.requests, 'errors': len(results) - len(latencies),
+		'throughput': len(latencies) / elapsed,
+		'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99)
+	}
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--latency', type=float, default=0.5, help='seconds injected per Distance Matrix request')
+	parser.add_argument('--concurrency', type=int, default=200, help='concurrent clients')
+	parser.add_argument('--requests', type=int, default=1000)
+	parser.add_argument('--processes', type=int, default=1, help='uWSGI workers')
+	parser.add_argument('--port', type=int, default=9090)
+	parser.add_argument('--modes', default='uwsgi.ini,uwsgi-gevent.ini')
+	args = parser.parse_args()
+
+	server = make_server(faults=Faults(latency='constant:%s' % (args.latency,)))
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	upstream = 'http://127.0.0.1:%s%s' % (server.server_port, matrix_path)
+
+	print('latency %.3fs, %s clients, %s requests, %s uWSGI worker(s)' % (args.latency, args.concurrency, args.requests, args.processes))
+	print('%-18s %8s %8s %12s %10s %10s %10s' % ('mode', 'requests', 'errors', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+	for ini in args.modes.split(','):
+		result = run_mode(ini, args, upstream)
+		print('%-18s %8s %8s %12.1f %10s %10s %10s' % ((ini, result['requests'], result['errors'], result['throughput']) +
+			tuple('%.1f' % (result[p],) if result[p] is not None else '-' for p in ('p50', 'p95', 'p99'))))
+	server.shutdown()
+
+if __name__ == '__main__':
+	sys.exit(main())
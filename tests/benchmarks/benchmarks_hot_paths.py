@@ -0,0 +1,95 @@
+import datetime, json, os
+import pytest
+from unittest.mock import Mock, patch
+from order_app.settings import app, TEST_DIR
+from order_app.place_order import PlaceOrder, validate_latlng_range
+from order_app.gmap_client import DistanceMatrixClient, CircuitBreaker
+from order_app.order_list import to_order_items
+import order_app.views
+
+#Microbenchmarks of the hot paths of order_app, with pytest-benchmark. The database and
+#Google Map Distance Matrix API are mocked, so they run anywhere without network:
+#   make benchmark-save      #on the base commit, saved under .benchmarks/
+#   make benchmark-compare   #on the change, fails if a median is BENCHMARK_FAIL slower than the saved run
+
+with open(os.path.join(TEST_DIR, 'support', 'gmap_distance_matrix_api_resp.json')) as f:
+	predefined_gmap_resp = json.loads(f.read())
+
+coordinate_bodies = {
+	'valid': {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']},
+	'invalid': {'origin': ['22.3', 'a'], 'destination': ['22.4', '114.2']},
+	'out_of_range': {'origin': ['95.0', '114.1'], 'destination': ['22.4', '200.0']},
+}
+orders = [(order_id, order_id * 7, 'UNASSIGNED' if order_id % 2 else 'TAKEN') for order_id in range(1000, 0, -1)]
+
+
+@pytest.mark.parametrize('kind', sorted(coordinate_bodies))
+def test_place_order_validate(benchmark, kind):
+	"""
+	PlaceOrder creation and validation of its request json.
+	"""
+	request = Mock(json=coordinate_bodies[kind])
+	validated = benchmark(lambda: PlaceOrder(request=request).inputs.validate())
+	assert validated == (kind == 'valid')
+
+def test_validate_latlng_range(benchmark):
+	assert benchmark(validate_latlng_range, 22.3, 114.1, 22.4, 114.2) == (True, None)
+
+def test_get_distance(benchmark):
+	"""
+	DistanceMatrixClient.get_distance on the recorded response, without network.
+	"""
+	resp = Mock(status_code=200)
+	resp.json.return_value = predefined_gmap_resp['success']['response_body']
+	client = DistanceMatrixClient(url='https://gmap.test/distancematrix/json', key='test',
+		max_retries=0, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30))
+	client.session = Mock()
+	client.session.get.return_value = resp
+	origin = tuple(predefined_gmap_resp['success']['request_body']['origins'])
+	destination = tuple(predefined_gmap_resp['success']['request_body']['destinations'])
+	distance = benchmark(client.get_distance, origin, destination)
+	assert distance == predefined_gmap_resp['success']['response_body']['rows'][0]['elements'][0]['distance']['value']
+
+@pytest.mark.parametrize('limit', [20, 1000])
+def test_to_order_items(benchmark, limit):
+	"""
+	Conversion of a page of rows (tuples, as returned by the query) into order items.
+	"""
+	order_items = benchmark(to_order_items, orders[:limit])
+	assert len(order_items) == limit
+
+@pytest.fixture
+def client():
+	with app.test_client() as client:
+		yield client
+
+def test_view_order_detail(benchmark, client):
+	"""
+	GET /orders/:id through the Flask test client: routing, request hooks, metrics and JSON response.
+	"""
+	with patch('order_app.views.OrderDetail') as mock_order_detail:
+		mock_order_detail.return_value.run_order_detail.return_value = ({'id': 1, 'distance': 7, 'status': 'UNASSIGNED'}, None)
+		response = benchmark(client.get, '/orders/1')
+	assert response.status_code == 200
+
+def test_view_order_list(benchmark, client):
+	"""
+	GET /orders?page=&limit= through the Flask test client, with validators and count.
+	"""
+	with patch('order_app.views.OrderList') as mock_order_list:
+		order_list = mock_order_list.return_value
+		order_list.list_validators.return_value = ('3e8-5a1c2e3f4b5d6', datetime.datetime(2020, 3, 1), None)
+		order_list.query_paginated_orders.return_value = (to_order_items(orders[:20]), None)
+		order_list.total_count.return_value = (len(orders), None)
+		response = benchmark(client.get, '/orders?page=1&limit=20')
+	assert response.status_code == 200
+
+def test_view_place_order(benchmark, client):
+	"""
+	POST /orders through the Flask test client, with validation, and the distance and insert mocked.
+	"""
+	with patch.object(PlaceOrder, 'get_distance', return_value=(1000, None)), \
+		patch.object(PlaceOrder, 'insert_new_order', return_value=({'id': 1, 'distance': 1000, 'status': 'UNASSIGNED'}, None)), \
+		patch('order_app.place_order.ORDER_INGEST_MODE', 'sync'):
+		response = benchmark(client.post, '/orders', json=coordinate_bodies['valid'])
+	assert response.status_code == 200
@@ -0,0 +1,46 @@
+import timeit, gzip
+import flask
+from order_app.settings import app
+from order_app import json_response
+from order_app.json_response import jsonify
+
+#Per response cost of GET /orders pages, before (flask.jsonify with JSONIFY_PRETTYPRINT_REGULAR:
+#indented stdlib JSON with sorted keys) and after (compact JSON, with orjson if installed).
+
+NUMBER = 200
+
+pages = dict((size, [{'id': order_id, 'distance': order_id * 7, 'status': 'UNASSIGNED'} for order_id in range(size, 0, -1)])
+	for size in (20, 100, 1000))
+
+
+def before(orders):
+	app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+	try:
+		return flask.jsonify(orders).get_data()
+	finally:
+		app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+
+def after(orders):
+	return jsonify(orders).get_data()
+
+def bench(func, orders):
+	"""
+	Return microseconds per response.
+	"""
+	return min(timeit.repeat(lambda: func(orders), number=NUMBER, repeat=3)) / NUMBER * 1e6
+
+def main():
+	print('encoder: %s' % (json_response.encoder_name,))
+	print('%-8s %12s %12s %8s %14s %14s %14s %14s' % ('orders', 'before (us)', 'after (us)', 'speedup',
+		'before (B)', 'after (B)', 'before gz (B)', 'after gz (B)'))
+	with app.test_request_context('/orders'):
+		for size, orders in pages.items():
+			before_us = bench(before, orders)
+			after_us = bench(after, orders)
+			before_body = before(orders)
+			after_body = after(orders)
+			print('%-8s %12.2f %12.2f %7.1fx %14s %14s %14s %14s' % (size, before_us, after_us, before_us / after_us,
+				len(before_body), len(after_body), len(gzip.compress(before_body)), len(gzip.compress(after_body))))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,55 @@
+import timeit
+import jsonschema
+from order_app.place_order import coorindate_schema
+from order_app.take_order import status_schema
+from order_app.validators import validate_coordinates, validate_status, latlng_range_error
+
+#Per request validation cost, before (Flask-Inputs JsonSchema: jsonschema.validate on every request,
+#then float conversion and lat/lng range check) and after (precompiled validators).
+
+NUMBER = 2000
+
+coordinate_bodies = {
+	'valid': {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']},
+	'invalid': {'origin': ['22.3', 'a'], 'destination': ['22.4', '114.2']},
+}
+status_bodies = {
+	'valid': {'status': 'TAKEN'},
+	'invalid': {'status': 'UNASSIGNED'},
+}
+
+
+def jsonschema_coordinates(body):
+	try:
+		jsonschema.validate(body, coorindate_schema)
+	except jsonschema.ValidationError as e:
+		return None, e.message
+	coordinates = (float(body['origin'][0]), float(body['origin'][1]),
+		float(body['destination'][0]), float(body['destination'][1]))
+	return coordinates, latlng_range_error(*coordinates)
+
+def jsonschema_status(body):
+	try:
+		jsonschema.validate(body, status_schema)
+	except jsonschema.ValidationError as e:
+		return None, e.message
+	return body['status'], None
+
+def bench(func, body):
+	"""
+	Return microseconds per call.
+	"""
+	return min(timeit.repeat(lambda: func(body), number=NUMBER, repeat=3)) / NUMBER * 1e6
+
+def main():
+	print('%-24s %-8s %12s %12s %8s' % ('validator', 'body', 'before (us)', 'after (us)', 'speedup'))
+	for name, before, after, bodies in (
+		('coordinates', jsonschema_coordinates, validate_coordinates, coordinate_bodies),
+		('status', jsonschema_status, validate_status, status_bodies)):
+		for kind, body in bodies.items():
+			before_us = bench(before, body)
+			after_us = bench(after, body)
+			print('%-24s %-8s %12.2f %12.2f %7.1fx' % (name, kind, before_us, after_us, before_us / after_us))
+
+if __name__ == '__main__':
+	main()
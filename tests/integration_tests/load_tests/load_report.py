@@ -0,0 +1,136 @@
+import argparse, csv, json, os, sys
+
+#Summary of a headless locust run (files of --csv=PREFIX) as JSON: requests, failures, throughput and
+#p50/p95/p99 (ms) per endpoint and in total, compared with a baseline summary of an earlier run:
+#   python tests/integration_tests/load_tests/load_report.py load_results/orders --baseline tests/integration_tests/load_tests/baseline.json
+#Exits with 1 if the run regressed, or if there is no baseline to compare with (store one with --update-baseline),
+#so make test-load-headless fails.
+
+total_names = ('Total', 'Aggregated') #name of the total row, by locust version
+percentiles = {'p50': '50%', 'p95': '95%', 'p99': '99%'}
+
+
+def to_number(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return None #N/A of endpoints without requests
+
+def row_name(row):
+	"""
+	'METHOD name' of the row, as in the _distribution.csv of locust, or the total name.
+	"""
+	method = row.get('Method', row.get('Type')) or ''
+	name = row.get('Name') or ''
+	if name in total_names or method in ('', 'None'):
+		return 'Total' if name in total_names else name
+	if name.startswith(method + ' '):
+		return name
+	return '%s %s' % (method, name)
+
+def read_locust_csv(prefix):
+	"""
+	Return stats of the rows of PREFIX_stats.csv (and PREFIX_distribution.csv if any) by row_name.
+	"""
+	stats = {}
+	for suffix in ('_stats.csv', '_distribution.csv'):
+		path = prefix + suffix
+		if not os.path.exists(path):
+			continue
+		with open(path) as f:
+			for row in csv.DictReader(f):
+				stats.setdefault(row_name(row), {}).update(row)
+	if not stats:
+		raise ValueError("No locust stats in %s_stats.csv." % (prefix,))
+	return stats
+
+def summarize_row(row):
+	requests = int(to_number(row.get('# requests', row.get('Request Count'))) or 0)
+	failures = int(to_number(row.get('# failures', row.get('Failure Count'))) or 0)
+	summary = {
+		'requests': requests,
+		'failures': failures,
+		'failure_ratio': failures / float(requests) if requests else 0.0,
+		'throughput': to_number(row.get('Requests/s')),
+	}
+	for name, column in percentiles.items():
+		summary[name] = to_number(row.get(column))
+	return summary
+
+def summarize(prefix, workload=None):
+	stats = read_locust_csv(prefix)
+	summary = {
+		'total': summarize_row(stats.pop('Total', {})),
+		'endpoints': dict((name, summarize_row(row)) for name, row in sorted(stats.items())),
+	}
+	if workload:
+		summary['workload'] = workload
+	return summary
+
+def compare(summary, baseline, tolerance=0.2, failure_tolerance=0.01, slack=5.0):
+	"""
+	Return the regressions of summary from baseline: p95 or p99 slower than baseline by more than tolerance
+	(and slack ms, against the noise of fast endpoints), total throughput lower by more than tolerance,
+	failure ratio higher by more than failure_tolerance. Endpoints missing from one of them are not compared.
+	"""
+	regressions = []
+	rows = [('Total', summary['total'], baseline.get('total', {}))]
+	rows += [(name, stats, baseline.get('endpoints', {}).get(name)) for name, stats in sorted(summary['endpoints'].items())]
+	for name, stats, base in rows:
+		if not base:
+			continue
+		for p in ('p95', 'p99'):
+			if stats.get(p) is not None and base.get(p) is not None and stats[p] > base[p] * (1 + tolerance) + slack:
+				regressions.append("%s %s %.0f ms > baseline %.0f ms." % (name, p, stats[p], base[p]))
+		if stats['failure_ratio'] > base.get('failure_ratio', 0) + failure_tolerance:
+			regressions.append("%s failure ratio %.3f > baseline %.3f." % (name, stats['failure_ratio'], base.get('failure_ratio', 0)))
+	total, base = summary['total'], baseline.get('total', {})
+	if total.get('throughput') is not None and base.get('throughput') and total['throughput'] < base['throughput'] * (1 - tolerance):
+		regressions.append("Total throughput %.1f req/s < baseline %.1f req/s." % (total['throughput'], base['throughput']))
+	return regressions
+
+def workload_env():
+	return dict((name, value) for name, value in sorted(os.environ.items()) if name.startswith('LOAD_'))
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser()
+	parser.add_argument('prefix', help='--csv prefix of the locust run')
+	parser.add_argument('--output', help='summary json, PREFIX.json by default')
+	parser.add_argument('--baseline', help='summary json of the baseline run')
+	parser.add_argument('--update-baseline', action='store_true', help='store this run as the baseline instead of comparing')
+	parser.add_argument('--tolerance', type=float, default=float(os.getenv('LOAD_TOLERANCE', 0.2)), help='allowed slowdown of p95/p99 and throughput')
+	parser.add_argument('--failure-tolerance', type=float, default=float(os.getenv('LOAD_FAILURE_TOLERANCE', 0.01)), help='allowed increase of failure ratio')
+	args = parser.parse_args(argv)
+
+	summary = summarize(args.prefix, workload_env())
+	output = args.output or args.prefix + '.json'
+	with open(output, 'w') as f:
+		json.dump(summary, f, indent=2, sort_keys=True)
+	print(json.dumps({'total': summary['total']}, sort_keys=True))
+	print("Summary written to %s." % (output,))
+
+	if not args.baseline:
+		return 0
+	if args.update_baseline:
+		with open(args.baseline, 'w') as f:
+			json.dump(summary, f, indent=2, sort_keys=True)
+		print("Baseline written to %s." % (args.baseline,))
+		return 0
+	if not os.path.exists(args.baseline):
+		print("No baseline at %s to compare with. Store one from a known good build with make test-load-baseline." % (args.baseline,))
+		return 1
+	with open(args.baseline) as f:
+		baseline = json.load(f)
+	if baseline.get('workload') != summary.get('workload'):
+		print("Warning: workload differs from the baseline: %s." % (json.dumps(baseline.get('workload')),))
+	regressions = compare(summary, baseline, args.tolerance, args.failure_tolerance)
+	for regression in regressions:
+		print("Regression: %s" % (regression,))
+	if regressions:
+		return 1
+	print("No regression from baseline %s." % (args.baseline,))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,18 +1,112 @@
-from locust import HttpLocust, TaskSet, task, between
-import os, json
+from locust import HttpLocust, TaskSet, between
+from collections import deque
+import os, random
 
-class OrderBehavior(TaskSet):
+#Workload of the order API, configured with environment variables (see make test-load-headless):
+#places orders on a pool of routes, takes orders with a share of the takes contending for a few hot orders,
+#reads orders, and scans pages of the list, in the ratio of LOAD_WEIGHTS.
+
+LOAD_HOST = os.getenv('LOAD_HOST', 'http://localhost:8080')
+LOAD_SEED = os.getenv('LOAD_SEED') #same routes and choices for the same seed
+LOAD_WEIGHTS = os.getenv('LOAD_WEIGHTS', 'place=2,take=2,detail=3,list=2,scan=1') #task ratio, 0 to disable a task
+LOAD_BBOX = os.getenv('LOAD_BBOX', '59.38,24.60,59.48,24.85') #min lat, min lng, max lat, max lng of coordinates
+LOAD_ROUTE_POOL = int(os.getenv('LOAD_ROUTE_POOL', 1000)) #distinct (origin, destination), fewer means more distance cache hits
+LOAD_HOT_ORDERS = int(os.getenv('LOAD_HOT_ORDERS', 10)) #orders all contending takes go to
+LOAD_TAKE_CONTENTION = float(os.getenv('LOAD_TAKE_CONTENTION', 0.1)) #share of takes on the hot orders
+LOAD_ORDER_IDS = int(os.getenv('LOAD_ORDER_IDS', 1000)) #ids of unassigned orders known to the takes and reads
+LOAD_LIST_LIMIT = int(os.getenv('LOAD_LIST_LIMIT', 20)) #orders per page of list and scan
+LOAD_LIST_MAX_PAGE = int(os.getenv('LOAD_LIST_MAX_PAGE', 50)) #list reads a random page up to this one
+LOAD_SCAN_PAGES = int(os.getenv('LOAD_SCAN_PAGES', 5)) #scan follows next_cursor for this many pages
+LOAD_WAIT_MIN = float(os.getenv('LOAD_WAIT_MIN', 1)) #seconds between the tasks of a user
+LOAD_WAIT_MAX = float(os.getenv('LOAD_WAIT_MAX', 3))
+
+#answers of PATCH /orders/:id expected under contention, not failures of the service
+take_conflicts = ("Order is already taken.", "Order is currently occupied. Update status to TAKEN fail.")
+
+rng = random.Random(LOAD_SEED)
+
+def make_routes(count, bbox):
+	min_lat, min_lng, max_lat, max_lng = [float(value) for value in bbox.split(',')]
+	point = lambda: ['%.6f' % (rng.uniform(min_lat, max_lat),), '%.6f' % (rng.uniform(min_lng, max_lng),)]
+	return [(point(), point()) for i in range(count)]
+
+routes = make_routes(LOAD_ROUTE_POOL, LOAD_BBOX)
+hot_order_ids = []
+order_ids = deque(maxlen=LOAD_ORDER_IDS) #shared by all users of this locust process
+
+
+def parse_weights(weights):
+	return dict((name.strip(), int(weight)) for name, weight in (item.split('=') for item in weights.split(',')))
+
+def remember_orders(orders):
+	for order in orders:
+		if order.get('status') == 'UNASSIGNED':
+			if len(hot_order_ids) < LOAD_HOT_ORDERS:
+				hot_order_ids.append(order['id'])
+			else:
+				order_ids.append(order['id'])
 
-	@task(2)
-	def place_order(self):
-		origins = ["59.456399", "24.707580"]
-		destinations = ["59.436487", "24.747193"]
-		self.client.post("http://localhost:8080/orders", json={"origin": origins, "destination": destinations})
 
-	@task(1)
-	def take_order(self):
-		self.client.patch("http://localhost:8080/orders/1", json={"status":"TAKEN"})
+def place_order(l):
+	origin, destination = rng.choice(routes)
+	with l.client.post('/orders', json={'origin': origin, 'destination': destination}, catch_response=True) as response:
+		if response.status_code in (200, 202):
+			remember_orders([response.json()])
+		else:
+			response.failure('HTTP %s: %s' % (response.status_code, response.text))
+
+def take_order(l):
+	if hot_order_ids and rng.random() < LOAD_TAKE_CONTENTION:
+		order_id, name = rng.choice(hot_order_ids), '/orders/[hot id]'
+	elif order_ids:
+		order_id, name = order_ids.popleft(), '/orders/[id]'
+	else:
+		return
+	with l.client.patch('/orders/%s' % (order_id,), json={'status': 'TAKEN'}, name=name, catch_response=True) as response:
+		if response.status_code == 200:
+			response.success()
+		elif response.status_code == 400 and response.json().get('error') in take_conflicts:
+			response.success()
+		else:
+			response.failure('HTTP %s: %s' % (response.status_code, response.text))
+
+def order_detail(l):
+	if order_ids:
+		l.client.get('/orders/%s' % (rng.choice(order_ids),), name='/orders/[id]')
+
+def order_list(l):
+	l.client.get('/orders?page=%s&limit=%s' % (rng.randint(1, LOAD_LIST_MAX_PAGE), LOAD_LIST_LIMIT), name='/orders?page=[page]')
+
+def order_scan(l):
+	"""
+	Keyset scan from the newest order, LOAD_SCAN_PAGES pages.
+	"""
+	cursor = None
+	for page in range(LOAD_SCAN_PAGES):
+		url = '/orders?limit=%s' % (LOAD_LIST_LIMIT,) + ('&cursor=%s' % (cursor,) if cursor else '')
+		response = l.client.get(url, name='/orders?cursor=[cursor]')
+		if response.status_code != 200:
+			return
+		cursor = response.json().get('next_cursor')
+		if not cursor:
+			return
+
+task_functions = {'place': place_order, 'take': take_order, 'detail': order_detail, 'list': order_list, 'scan': order_scan}
+
+
+class OrderBehavior(TaskSet):
+	tasks = dict((task_functions[name], weight) for name, weight in parse_weights(LOAD_WEIGHTS).items() if weight > 0)
+
+	def on_start(self):
+		"""
+		Learn unassigned orders placed before the test, for the takes and reads.
+		"""
+		if not order_ids:
+			response = self.client.get('/orders?page=1&limit=%s&status=UNASSIGNED' % (LOAD_ORDER_IDS,), name='/orders?page=[page]')
+			if response.status_code == 200:
+				remember_orders(response.json())
 
 class WebsiteUser(HttpLocust):
-    task_set = OrderBehavior
-    wait_time = between(5, 9)
\ No newline at end of file
+	host = LOAD_HOST
+	task_set = OrderBehavior
+	wait_time = between(LOAD_WAIT_MIN, LOAD_WAIT_MAX)
@@ -99,6 +99,21 @@ class DataBaseInitilizationTestCase(unittest.TestCase):
 			self.assertCountEqual(schema, self.test_db_schema[table_name])
 		conn.close()
 
+	def test_create_missing_indexes(self):
+		"""
+		Test if indexes missing on existing tables, or left INVALID by a failed concurrent build, are created again.
+		"""
+		engine = db_connect(db_config=self.global_db_config)
+		create_tables(engine)
+		engine.execute("""DROP INDEX "ix_Order_updated_at_id";""")
+		engine.execute("""UPDATE pg_index SET indisvalid = false WHERE indexrelid = '"ix_Order_status_id_distance"'::regclass;""")
+		create_tables(engine)
+		indexes = dict(engine.execute("""SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid \
+			WHERE i.indrelid = '"Order"'::regclass;""").fetchall())
+		self.assertEqual(indexes.get('ix_Order_updated_at_id'), True)
+		self.assertEqual(indexes.get('ix_Order_status_id_distance'), True)
+		engine.dispose()
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,135 @@
+import unittest, os, threading, time
+from unittest.mock import Mock, patch
+from sqlalchemy.orm import sessionmaker
+from utilities.logger import get_logger
+from order_app.place_order import PlaceOrder
+from order_app.idempotency import IdempotencyClaim, key_mismatch_err_msg
+from order_app.models import create_db_if_not_exists, db_connect, create_tables
+
+logger = get_logger('test')
+
+class IdempotencyDBTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Define integration test DB connection string, and the databaes for test,
+		followed by creating the TestDB and the related tables.
+		Start all mocking necessary for testing.
+		"""
+		cls.db_test_name = 'TestDB'
+		cls.global_db_config = {
+		    'drivername': 'postgresql',
+		    'host': os.getenv('DB_HOST'),
+		    'port': os.getenv('DB_PORT'),
+		    'username': os.getenv('DB_USERNAME'),
+		    'password': os.getenv('DB_PASSWORD'),
+		    'database': cls.db_test_name
+		}
+
+		create_db_if_not_exists(db_config=cls.global_db_config)
+		cls.engine = db_connect(db_config=cls.global_db_config)
+		create_tables(cls.engine)
+
+		#start mocking get_session bahavior to connect to TestDB, and the distance of the orders
+		cls.patchers = [patch('order_app.%s.get_session' % (module,), sessionmaker(bind=cls.engine))
+			for module in ('place_order', 'idempotency')]
+		cls.patchers.append(patch('order_app.place_order.PlaceOrder.get_distance', return_value=(1000, None)))
+		cls.mock_get_distance = [patcher.start() for patcher in cls.patchers][-1]
+
+	@classmethod
+	def tearDownClass(cls):
+		"""
+		Stop all mocking.
+		Tear down database after testcase finish.
+		"""
+		for patcher in cls.patchers:
+			patcher.stop()
+
+		db_config = cls.global_db_config.copy()
+		#connect to postgres DB to drop DB TestDB.
+		db_config['database'] = 'postgres'
+		engine = db_connect(db_config=db_config)
+		conn = engine.connect()
+		#prevent fulture connection to TestDB
+		conn.execute("""REVOKE CONNECT ON DATABASE "%s" FROM public;""" % (cls.db_test_name,))
+		#terminal all connections to TestDB
+		conn.execute("""SELECT pid, pg_terminate_backend(pid) FROM pg_stat_activity \
+			WHERE datname = '%s' AND pid <> pg_backend_pid();""" % (cls.db_test_name,))
+		conn.execute("commit")
+		conn.execute("""DROP DATABASE IF EXISTS "%s";""" % (cls.db_test_name,)) #run outside of transaction block
+		conn.close()
+		engine.dispose()
+		logger.info('End of %s , database: %s has been torn down.' % (cls.__name__, cls.db_test_name))
+
+	def place_order(self, key, body, results):
+		"""
+		POST /orders with Idempotency-Key key, append (status code, body, err) to results.
+		"""
+		claim = IdempotencyClaim(key, body)
+		response_status, response_body, err = claim.claim()
+		if err is None and response_body is None:
+			request = Mock()
+			request.json = body
+			try:
+				response_body, err_msg = PlaceOrder(request=request, idempotency=claim).run_place_order()
+				time.sleep(0.5) #concurrent repeats wait for the commit
+				results.append(('idle in transaction', self.engine.execute("""SELECT count(*) FROM pg_stat_activity \
+					WHERE datname = current_database() AND state = 'idle in transaction' AND state_change < now() - interval '0.2 seconds';""").scalar()))
+				response_status = 200 if response_body else 400
+			finally:
+				claim.release()
+		results.append((response_status, response_body, err))
+
+	def test_concurrent_repeats(self):
+		"""
+		Test if concurrent requests with one key place one order, and get the same response.
+		"""
+		body = {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']}
+		results = []
+		threads = [threading.Thread(target=self.place_order, args=('key-1', body, results)) for i in range(3)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual([result for result in results if result[0] == 'idle in transaction'], [('idle in transaction', 0)] * 3) #nobody holds a transaction while waiting
+		results = [result for result in results if result[0] != 'idle in transaction']
+		self.assertEqual(len(set(str(result) for result in results)), 1)
+		self.assertEqual(results[0][1]['distance'], 1000)
+		self.assertEqual(self.engine.execute("""SELECT count(*) FROM "Order";""").scalar(), 1)
+		self.assertEqual(self.engine.execute("""SELECT order_id FROM "IdempotencyKey" WHERE key = 'key-1';""").scalar(), results[0][1]['id'])
+
+		results = []
+		self.place_order('key-1', {'origin': ['22.3', '114.1'], 'destination': ['22.5', '114.2']}, results)
+		self.assertEqual(results, [(None, None, (key_mismatch_err_msg, 422))])
+
+	def test_failed_request_released(self):
+		"""
+		Test if the key of a request failing before its order is inserted can be used again.
+		"""
+		results = []
+		self.mock_get_distance.return_value = (None, 'Distance cannot be retrieved.')
+		try:
+			self.place_order('key-2', {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']}, results)
+		finally:
+			self.mock_get_distance.return_value = (1000, None)
+		self.assertEqual(results[0][0], 400)
+		self.assertEqual(self.engine.execute("""SELECT count(*) FROM "IdempotencyKey" WHERE key = 'key-2';""").scalar(), 0)
+
+	def test_stale_key_taken_over(self):
+		"""
+		Test if a key left PENDING by a request that died is taken over after IDEMPOTENCY_PENDING_TIMEOUT.
+		"""
+		body = {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']}
+		self.assertEqual(IdempotencyClaim('key-3', body).claim(), (None, None, None)) #never completed nor released
+		with patch('order_app.idempotency.IDEMPOTENCY_LOCK_TIMEOUT', 0):
+			self.assertEqual(IdempotencyClaim('key-3', body).claim()[2][1], 409)
+		results = []
+		with patch('order_app.idempotency.IDEMPOTENCY_PENDING_TIMEOUT', 0):
+			self.place_order('key-3', body, results)
+		results = [result for result in results if result[0] != 'idle in transaction']
+		self.assertEqual(results[0][0], 200)
+		self.assertEqual(self.engine.execute("""SELECT order_id FROM "IdempotencyKey" WHERE key = 'key-3';""").scalar(), results[0][1]['id'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest, os, datetime, threading, time
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+from utilities.logger import get_logger
+from order_app.order_changes import OrderChanges, OrderChangeNotifier, decode_change_cursor
+from order_app.models import create_db_if_not_exists, db_connect, create_tables
+
+logger = get_logger('test')
+
+class OrderChangesDBTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Define integration test DB connection string, and the databaes for test,
+		followed by creating the TestDB and the related tables.
+		Start all mocking necessary for testing.
+		"""
+		cls.db_test_name = 'TestDB'
+		cls.global_db_config = {
+		    'drivername': 'postgresql',
+		    'host': os.getenv('DB_HOST'),
+		    'port': os.getenv('DB_PORT'),
+		    'username': os.getenv('DB_USERNAME'),
+		    'password': os.getenv('DB_PASSWORD'),
+		    'database': cls.db_test_name
+		}
+
+		create_db_if_not_exists(db_config=cls.global_db_config)
+		cls.engine = db_connect(db_config=cls.global_db_config)
+		create_tables(cls.engine)
+
+		#Create test data
+		cls.engine.execute("""INSERT INTO "Order" (id, distance, status, updated_at) \
+			SELECT i, i * 10, 'UNASSIGNED', '2020-03-01'::timestamp + i * interval '1 minute' \
+			FROM generate_series(1, 5) AS i;""")
+
+		#start mocking get_session and the LISTEN connection to connect to TestDB, without settle delay
+		cls.patchers = [
+			patch('order_app.order_changes.get_session', sessionmaker(bind=cls.engine)),
+			patch('order_app.order_changes.db_connect', return_value=cls.engine),
+			patch('order_app.order_changes.settings.ORDER_CHANGES_SETTLE', 0),
+		]
+		for patcher in cls.patchers:
+			patcher.start()
+		cls.notifier = OrderChangeNotifier(reconnect_interval=1)
+		cls.patchers.append(patch('order_app.order_changes.get_order_change_notifier', return_value=cls.notifier))
+		cls.patchers[-1].start()
+		cls.notifier.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		"""
+		Stop all mocking.
+		Tear down database after testcase finish.
+		"""
+		cls.notifier.stop()
+		for patcher in cls.patchers:
+			patcher.stop()
+
+		db_config = cls.global_db_config.copy()
+		#connect to postgres DB to drop DB TestDB.
+		db_config['database'] = 'postgres'
+		engine = db_connect(db_config=db_config)
+		conn = engine.connect()
+		#prevent fulture connection to TestDB
+		conn.execute("""REVOKE CONNECT ON DATABASE "%s" FROM public;""" % (cls.db_test_name,))
+		#terminal all connections to TestDB
+		conn.execute("""SELECT pid, pg_terminate_backend(pid) FROM pg_stat_activity \
+			WHERE datname = '%s' AND pid <> pg_backend_pid();""" % (cls.db_test_name,))
+		conn.execute("commit")
+		conn.execute("""DROP DATABASE IF EXISTS "%s";""" % (cls.db_test_name,)) #run outside of transaction block
+		conn.close()
+		engine.dispose()
+		logger.info('End of %s , database: %s has been torn down.' % (cls.__name__, cls.db_test_name))
+
+	def test_changes_cursor(self):
+		"""
+		Test if changes are read in (updated_at, id) order from the cursor on.
+		"""
+		order_items, next_cursor, err_msg = OrderChanges(after=(datetime.datetime(2020, 3, 1, 0, 2), 0), limit=2).run_order_changes()
+		self.assertEqual(err_msg, None)
+		self.assertEqual([order_item['id'] for order_item in order_items], [2, 3])
+		order_items, next_cursor, err_msg = OrderChanges(after=decode_change_cursor(next_cursor), limit=10).run_order_changes()
+		self.assertEqual([order_item['id'] for order_item in order_items], [4, 5])
+
+	def test_long_poll_notified(self):
+		"""
+		Test if a waiting long-poll returns soon after an order is taken, woken by the trigger's NOTIFY.
+		"""
+		order_items, next_cursor, err_msg = OrderChanges(after=(datetime.datetime(2020, 3, 1, 0, 5), 5)).run_order_changes()
+		self.assertEqual(order_items, [])
+		threading.Timer(0.5, self.engine.execute, ["""UPDATE "Order" SET status = 'TAKEN', updated_at = '2020-03-02' WHERE id = 1;"""]).start()
+		started = time.monotonic()
+		order_items, next_cursor, err_msg = OrderChanges(after=decode_change_cursor(next_cursor), wait=20).run_order_changes()
+		self.assertEqual([(order_item['id'], order_item['status']) for order_item in order_items], [(1, 'TAKEN')])
+		self.assertEqual(time.monotonic() - started < 5, True)
+
+	def test_slow_concurrent_insert(self):
+		"""
+		Test if an order inserted by a transaction committing after a later one is not skipped by the cursor:
+		changes stop before the start of the slow transaction until it commits.
+		"""
+		after = (datetime.datetime(2021, 1, 1), 0)
+		conn = self.engine.connect()
+		trans = conn.begin()
+		try:
+			conn.execute("""INSERT INTO "Order" (id, distance) VALUES (100, 1000);""") #updated_at is the start of this transaction
+			time.sleep(0.2)
+			self.engine.execute("""INSERT INTO "Order" (id, distance) VALUES (101, 1000);""") #later, committed first
+			order_items, next_cursor, err_msg = OrderChanges(after=after).run_order_changes()
+			self.assertEqual(order_items, [])
+			trans.commit()
+		finally:
+			conn.close()
+		order_items, next_cursor, err_msg = OrderChanges(after=decode_change_cursor(next_cursor)).run_order_changes()
+		self.assertEqual([order_item['id'] for order_item in order_items], [100, 101])
+
+	def test_other_writers_ignored(self):
+		"""
+		Test if a long transaction of another client of the database does not hold the feed back.
+		"""
+		conn = self.engine.connect()
+		trans = conn.begin()
+		try:
+			conn.execute("""SET LOCAL application_name = 'other_client';""")
+			conn.execute("""SELECT txid_current();""") #holds an xid like a writer
+			time.sleep(0.2)
+			self.engine.execute("""INSERT INTO "Order" (id, distance) VALUES (200, 1000);""")
+			order_items, next_cursor, err_msg = OrderChanges(after=(datetime.datetime(2021, 1, 1), 101)).run_order_changes()
+			self.assertEqual([order_item['id'] for order_item in order_items if order_item['id'] == 200], [200])
+		finally:
+			trans.rollback()
+			conn.close()
+
+	def test_no_notify_without_change(self):
+		"""
+		Test if an update changing no order sends no notification.
+		"""
+		self.notifier.wait(self.notifier.generation, 1) #notifications of earlier tests
+		generation = self.notifier.generation
+		self.engine.execute("""UPDATE "Order" SET status = 'TAKEN' WHERE id = -1;""")
+		self.assertEqual(self.notifier.wait(generation, 1), False)
+		self.engine.execute("""UPDATE "Order" SET status = 'TAKEN' WHERE id = 2;""")
+		self.assertEqual(self.notifier.wait(generation, 5), True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest, os, json, datetime
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+from utilities.logger import get_logger
+from order_app.order_export import OrderExport
+from order_app.models import create_db_if_not_exists, db_connect, create_tables
+
+logger = get_logger('test')
+
+class OrderExportDBTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Define integration test DB connection string, and the databaes for test,
+		followed by creating the TestDB and the related tables.
+		Start all mocking necessary for testing.
+		"""
+		cls.db_test_name = 'TestDB'
+		cls.global_db_config = {
+		    'drivername': 'postgresql',
+		    'host': os.getenv('DB_HOST'),
+		    'port': os.getenv('DB_PORT'),
+		    'username': os.getenv('DB_USERNAME'),
+		    'password': os.getenv('DB_PASSWORD'),
+		    'database': cls.db_test_name
+		}
+
+		create_db_if_not_exists(db_config=cls.global_db_config)
+		cls.engine = db_connect(db_config=cls.global_db_config)
+		create_tables(cls.engine)
+
+		#Create test data, more orders than one chunk
+		cls.engine.execute("""INSERT INTO "Order" (id, distance, status, updated_at) \
+			SELECT i, i * 10, CASE WHEN mod(i, 2) = 0 THEN 'TAKEN' ELSE 'UNASSIGNED' END, '2020-03-01'::timestamp + i * interval '1 minute' \
+			FROM generate_series(1, 2500) AS i;""")
+
+		#start mocking get_session bahavior to connect to TestDB
+		cls.mock_get_session_patcher = patch('order_app.order_export.get_session', sessionmaker(bind=cls.engine))
+		cls.mock_get_session_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		"""
+		Stop all mocking.
+		Tear down database after testcase finish.
+		"""
+		cls.mock_get_session_patcher.stop()
+
+		db_config = cls.global_db_config.copy()
+		#connect to postgres DB to drop DB TestDB.
+		db_config['database'] = 'postgres'
+		engine = db_connect(db_config=db_config)
+		conn = engine.connect()
+		#prevent fulture connection to TestDB
+		conn.execute("""REVOKE CONNECT ON DATABASE "%s" FROM public;""" % (cls.db_test_name,))
+		#terminal all connections to TestDB
+		conn.execute("""SELECT pid, pg_terminate_backend(pid) FROM pg_stat_activity \
+			WHERE datname = '%s' AND pid <> pg_backend_pid();""" % (cls.db_test_name,))
+		conn.execute("commit")
+		conn.execute("""DROP DATABASE IF EXISTS "%s";""" % (cls.db_test_name,)) #run outside of transaction block
+		conn.close()
+		engine.dispose()
+		logger.info('End of %s , database: %s has been torn down.' % (cls.__name__, cls.db_test_name))
+
+	def export(self, **kwargs):
+		export, session, err_msg = OrderExport(**kwargs).run_order_export()
+		self.assertEqual(err_msg, None)
+		try:
+			return b''.join(export).decode('utf-8').splitlines()
+		finally:
+			session.close()
+
+	def test_export_ndjson(self):
+		"""
+		Test if all orders are exported in id order, across chunks of the server-side cursor.
+		"""
+		lines = self.export(export_format='ndjson')
+		self.assertEqual([json.loads(line)['id'] for line in lines], list(range(1, 2501)))
+
+	def test_export_csv_filtered(self):
+		"""
+		Test if status and since filter the export, ordered by updated_at.
+		"""
+		lines = self.export(export_format='csv', status='TAKEN', since=datetime.datetime(2020, 3, 1, 1, 0))
+		self.assertEqual(lines[0], 'id,distance,status,created_at,updated_at')
+		self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], list(range(60, 2501, 2)))
+
+if __name__ == '__main__':
+    unittest.main()
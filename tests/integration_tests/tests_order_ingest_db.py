@@ -0,0 +1,129 @@
+import unittest, os
+from unittest.mock import Mock, patch
+from sqlalchemy.orm import sessionmaker
+from utilities.logger import get_logger
+from order_app.place_order import PlaceOrder
+from order_app.order_ingest import OrderIngestWorker
+from order_app.order_detail import OrderDetail
+from order_app.models import create_db_if_not_exists, db_connect, create_tables
+
+logger = get_logger('test')
+
+class OrderIngestDBTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Define integration test DB connection string, and the databaes for test,
+		followed by creating the TestDB and the related tables.
+		Start all mocking necessary for testing.
+		"""
+		cls.db_test_name = 'TestDB'
+		cls.global_db_config = {
+		    'drivername': 'postgresql',
+		    'host': os.getenv('DB_HOST'),
+		    'port': os.getenv('DB_PORT'),
+		    'username': os.getenv('DB_USERNAME'),
+		    'password': os.getenv('DB_PASSWORD'),
+		    'database': cls.db_test_name
+		}
+
+		create_db_if_not_exists(db_config=cls.global_db_config)
+		cls.engine = db_connect(db_config=cls.global_db_config)
+		create_tables(cls.engine)
+
+		#start mocking get_session bahavior to connect to TestDB
+		cls.patchers = [patch('order_app.%s.get_session' % (module,), sessionmaker(bind=cls.engine))
+			for module in ('place_order', 'order_ingest', 'order_detail')]
+		#queue orders with ORDER_INGEST_MODE 'async', and mock the batched distance lookups
+		cls.patchers.append(patch('order_app.place_order.ORDER_INGEST_MODE', 'async'))
+		cls.mock_get_distances_patcher = patch('order_app.order_ingest.PlaceBulkOrders.get_distances')
+		for patcher in cls.patchers:
+			patcher.start()
+		cls.mock_get_distances = cls.mock_get_distances_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		"""
+		Stop all mocking.
+		Tear down database after testcase finish.
+		"""
+		for patcher in cls.patchers:
+			patcher.stop()
+		cls.mock_get_distances_patcher.stop()
+
+		db_config = cls.global_db_config.copy()
+		#connect to postgres DB to drop DB TestDB.
+		db_config['database'] = 'postgres'
+		engine = db_connect(db_config=db_config)
+		conn = engine.connect()
+		#prevent fulture connection to TestDB
+		conn.execute("""REVOKE CONNECT ON DATABASE "%s" FROM public;""" % (cls.db_test_name,))
+		#terminal all connections to TestDB
+		conn.execute("""SELECT pid, pg_terminate_backend(pid) FROM pg_stat_activity \
+			WHERE datname = '%s' AND pid <> pg_backend_pid();""" % (cls.db_test_name,))
+		conn.execute("commit")
+		conn.execute("""DROP DATABASE IF EXISTS "%s";""" % (cls.db_test_name,)) #run outside of transaction block
+		conn.close()
+		engine.dispose()
+		logger.info('End of %s , database: %s has been torn down.' % (cls.__name__, cls.db_test_name))
+
+	def place_order(self, origin, destination):
+		request = Mock()
+		request.json = {'origin': origin, 'destination': destination}
+		return PlaceOrder(request=request).run_place_order()
+
+	def test_ingest_orders(self):
+		"""
+		Test if queued orders are PENDING until ingested, then inserted into Order with their reserved ids,
+		and if orders without distance become FAILED after max_attempts.
+		"""
+		new_order_item, err_msg = self.place_order(['22.3', '114.1'], ['22.4', '114.2'])
+		self.assertEqual(err_msg, None)
+		self.assertEqual(new_order_item['status'], 'PENDING')
+		order_id = new_order_item['id']
+		failing_order_item, err_msg = self.place_order(['22.3', '114.1'], ['22.5', '114.3'])
+		self.assertEqual(failing_order_item['id'], order_id + 1)
+		self.assertEqual(OrderDetail(order_id=order_id).run_order_detail(), ({'id': order_id, 'distance': None, 'status': 'PENDING'}, None))
+
+		self.mock_get_distances.return_value = {((22.3, 114.1), (22.4, 114.2)): 1000}
+		worker = OrderIngestWorker(batch_size=10, poll_interval=0, max_attempts=2)
+		self.assertEqual(worker.process_batch(), 1)
+		self.assertEqual(OrderDetail(order_id=order_id).run_order_detail(), ({'id': order_id, 'distance': 1000, 'status': 'UNASSIGNED'}, None))
+		self.assertEqual(OrderDetail(order_id=order_id + 1).run_order_detail()[0]['status'], 'PENDING')
+
+		self.assertEqual(worker.process_batch(), 0)
+		failed_order_item, err_msg = OrderDetail(order_id=order_id + 1).run_order_detail()
+		self.assertEqual(failed_order_item['status'], 'FAILED')
+		self.assertEqual(failed_order_item['error'] is not None, True)
+		self.assertEqual(worker.process_batch(), 0) #FAILED orders are not retried
+
+	def test_ingest_orders_lease(self):
+		"""
+		Test if orders claimed by a worker that died are claimed again once their lease expired,
+		PENDING to GET /orders/:id meanwhile, and FAILED when batches keep failing after max_attempts.
+		"""
+		new_order_item, err_msg = self.place_order(['22.3', '114.1'], ['22.6', '114.4'])
+		order_id = new_order_item['id']
+		worker = OrderIngestWorker(batch_size=10, poll_interval=0, max_attempts=2, lease=0)
+		self.assertEqual([row[0] for row in worker.claim_batch()], [order_id]) #and dies
+		self.assertEqual(OrderDetail(order_id=order_id).query_order(), ({'id': order_id, 'distance': None, 'status': 'PENDING'}, None))
+		self.assertEqual(OrderIngestWorker(lease=3600).claim_batch(), []) #lease not expired
+
+		self.mock_get_distances.side_effect = ValueError('unexpected response')
+		try:
+			self.assertEqual(worker.process_batch(), 0)
+		finally:
+			self.mock_get_distances.side_effect = None
+		failed_order_item, err_msg = OrderDetail(order_id=order_id).query_order()
+		self.assertEqual(failed_order_item['status'], 'FAILED')
+		self.assertIn('unexpected response', failed_order_item['error'])
+
+	def test_order_detail_not_found(self):
+		"""
+		Test if OrderDetail returns None for orders neither inserted nor queued.
+		"""
+		self.assertEqual(OrderDetail(order_id=999999).run_order_detail(), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
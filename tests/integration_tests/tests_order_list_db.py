@@ -1,10 +1,10 @@
-import unittest, os
+import unittest, os, time
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from unittest.mock import Mock, patch
 from sqlalchemy.orm import sessionmaker
 from utilities.logger import get_logger
-from order_app.order_list import OrderList
+from order_app.order_list import OrderList, order_count_cache
 from order_app.models import create_db_if_not_exists, db_connect, create_tables
 
 logger = get_logger('test')
@@ -81,6 +81,52 @@ class PlaceOrderDBTestCase(unittest.TestCase):
 		self.assertEqual(order_items is not None, True)
 		self.assertEqual(err_msg is not None, False)
 
+	def tests_order_list_keyset(self):
+		order_list = OrderList(limit=1)
+		order_items, next_cursor, err_msg = order_list.query_keyset_orders()
+		self.assertEqual(order_items, [{'id': 100, 'distance': 111, 'status': 'UNASSIGNED'}])
+		self.assertEqual(next_cursor, None)
+		self.assertEqual(err_msg, None)
+		order_list = OrderList(limit=1, after_id=100)
+		order_items, next_cursor, err_msg = order_list.query_keyset_orders()
+		self.assertEqual(order_items, [])
+
+	def tests_order_list_status(self):
+		order_items, err_msg = OrderList(page=1, limit=10, status='UNASSIGNED').query_paginated_orders()
+		self.assertEqual(order_items, [{'id': 100, 'distance': 111, 'status': 'UNASSIGNED'}])
+		order_items, next_cursor, err_msg = OrderList(limit=10, status='TAKEN').query_keyset_orders()
+		self.assertEqual(order_items, [])
+		self.assertEqual(err_msg, None)
+
+	def tests_order_list_count_validators(self):
+		order_count_cache.clear()
+		self.assertEqual(OrderList(page=1, limit=10, status='UNASSIGNED').total_count(), (1, None))
+		self.assertEqual(OrderList(page=1, limit=10, status='TAKEN').total_count(), (0, None))
+		with patch('order_app.order_list.ORDER_CHANGES_SETTLE', 0):
+			etag, last_modified, err_msg = OrderList(limit=10).list_validators()
+		self.assertEqual(etag.startswith('64-'), True) #max id 100
+		self.assertEqual(last_modified is not None, True)
+		self.assertEqual(err_msg, None)
+	def tests_order_list_validators_slow_take(self):
+		"""
+		Test if no validators are returned while a take started before the last change is still running,
+		so clients do not keep a 304 of a listing it changes when it commits.
+		"""
+		self.engine.execute("""INSERT INTO "Order" (id, distance, status) VALUES (101, 222, 'UNASSIGNED');""")
+		conn = self.engine.connect()
+		trans = conn.begin()
+		try:
+			conn.execute("""UPDATE "Order" SET status = 'TAKEN', updated_at = TIMEZONE('utc', CURRENT_TIMESTAMP) WHERE id = 101;""")
+			time.sleep(0.2)
+			self.engine.execute("""INSERT INTO "Order" (id, distance, status) VALUES (102, 333, 'UNASSIGNED');""") #later, committed first
+			with patch('order_app.order_list.ORDER_CHANGES_SETTLE', 0):
+				self.assertEqual(OrderList(limit=10).list_validators(), (None, None, None))
+				trans.commit()
+				etag, last_modified, err_msg = OrderList(limit=10).list_validators()
+			self.assertEqual(etag.startswith('66-'), True) #max id 102
+		finally:
+			conn.close()
+
 if __name__ == '__main__':
     unittest.main()
 
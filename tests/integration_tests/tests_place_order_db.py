@@ -4,6 +4,7 @@ from order_app.settings import TEST_DIR
 from sqlalchemy.orm import sessionmaker
 from utilities.logger import get_logger
 from order_app.place_order import PlaceOrder
+from order_app.gmap_client import DistanceMatrixClient
 from order_app.models import create_db_if_not_exists, db_connect, create_tables
 
 logger = get_logger('test')
@@ -38,18 +39,20 @@ class PlaceOrderDBTestCase(unittest.TestCase):
 		cls.destinations = cls.predefined_gmap_resp['success']['request_body']['destinations']
 		cls.distance = cls.predefined_gmap_resp['success']['response_body']['rows'][0]['elements'][0]['distance']['value']
 
-		#start mocking db_connect bahavior to connect to TestDB in order_app.place_order
-		cls.mock_db_connect_patcher = patch('order_app.place_order.db_connect')
-		cls.mock_db_connect = cls.mock_db_connect_patcher.start()
-		cls.mock_db_connect.return_value = cls.engine
+		#start mocking get_session bahavior to connect to TestDB in order_app.place_order
+		cls.mock_get_session_patcher = patch('order_app.place_order.get_session', sessionmaker(bind=cls.engine))
+		cls.mock_get_session = cls.mock_get_session_patcher.start()
 
 		#start mocking the request object of PlceOrder
 		cls.mock_request_patcher = patch('order_app.place_order.request')
 		cls.mock_request = cls.mock_request_patcher.start()
 
-		#start mocking requests.get behavior in app.place_order
-		cls.mock_get_patcher = patch('order_app.place_order.requests.get')
-		cls.mock_get = cls.mock_get_patcher.start()
+		#start mocking the Distance Matrix client in app.place_order, with mock http session.get
+		cls.client = DistanceMatrixClient(url='https://gmap.test/distancematrix/json', key='test', max_retries=0)
+		cls.client.session = Mock()
+		cls.mock_get = cls.client.session.get
+		cls.mock_client_patcher = patch('order_app.place_order.get_distance_matrix_client', return_value=cls.client)
+		cls.mock_client_patcher.start()
 
 	@classmethod
 	def tearDownClass(cls):
@@ -58,9 +61,9 @@ class PlaceOrderDBTestCase(unittest.TestCase):
 		Tear down database after testcase finish.
 		"""
 		#stop mocking
-		cls.mock_db_connect_patcher.stop()
+		cls.mock_get_session_patcher.stop()
 		cls.mock_request_patcher.stop()
-		cls.mock_get_patcher.stop()
+		cls.mock_client_patcher.stop()
 
 		db_config = cls.global_db_config.copy()
 		#connect to postgres DB to drop DB TestDB.
@@ -92,9 +95,6 @@ class PlaceOrderDBTestCase(unittest.TestCase):
 		}
 
 		order = PlaceOrder(request=self.mock_request)
-		#reinitiate PlceOrder class object with the TestDB Engine and Session
-		order.engine = self.engine
-		order.Session = sessionmaker(bind=self.engine)
 
 		new_order_item, err_msg = order.insert_new_order(self.distance)
 		self.assertEqual(new_order_item, test_new_order_item)
@@ -132,7 +132,7 @@ class PlaceOrderDBTestCase(unittest.TestCase):
 
 		order = PlaceOrder(request=self.mock_request)
 
-		self.mock_get.return_value = Mock()
+		self.mock_get.return_value = Mock(status_code=200)
 		self.mock_get.return_value.json.return_value = self.predefined_gmap_resp['success']['response_body']
 		new_order_item, err_msg = order.run_place_order()
 		self.assertEqual(new_order_item, test_new_order_item)
@@ -155,7 +155,7 @@ class PlaceOrderDBTestCase(unittest.TestCase):
 
 		order = PlaceOrder(request=self.mock_request)
 
-		self.mock_get.return_value = Mock()
+		self.mock_get.return_value = Mock(status_code=200)
 		self.mock_get.return_value.json.return_value = self.predefined_gmap_resp['fail']['response_body']
 		new_order_item, err_msg = order.run_place_order()
 		self.assertEqual(new_order_item, test_new_order_item)
@@ -31,10 +31,9 @@ class TakeOrderDBTestCase(unittest.TestCase):
 		cls.engine = db_connect(db_config=cls.global_db_config)
 		create_tables(cls.engine)
 
-		#start mocking db_connect bahavior to connect to TestDB in order_app.take_order
-		cls.mock_db_connect_patcher = patch('order_app.take_order.db_connect')
-		cls.mock_db_connect = cls.mock_db_connect_patcher.start()
-		cls.mock_db_connect.return_value = cls.engine
+		#start mocking get_session bahavior to connect to TestDB in order_app.take_order
+		cls.mock_get_session_patcher = patch('order_app.take_order.get_session', sessionmaker(bind=cls.engine))
+		cls.mock_get_session = cls.mock_get_session_patcher.start()
 
 		#start mocking the request object of PlceOrder
 		cls.mock_request_patcher = patch('order_app.take_order.request')
@@ -47,7 +46,7 @@ class TakeOrderDBTestCase(unittest.TestCase):
 		Tear down database after testcase finish.
 		"""
 		#stop mocking
-		cls.mock_db_connect_patcher.stop()
+		cls.mock_get_session_patcher.stop()
 		cls.mock_request_patcher.stop()
 
 		db_config = cls.global_db_config.copy()
@@ -121,7 +120,20 @@ class TakeOrderDBTestCase(unittest.TestCase):
 		order = TakeOrder(order_id=new_order_id, request=self.mock_request)
 		success, err_msg = order.update_order_status()
 		self.assertEqual(success, False)
-		self.assertEqual(err_msg is None, False)
+		self.assertEqual(err_msg, "Order is already taken.")
+
+	def tests_update_order_status_not_exist(self):
+		"""
+		Test if error message is thrown if trying to update an order that does not exist.
+		"""
+		self.mock_request.return_value = Mock()
+		self.mock_request.json = {
+			'status': 'TAKEN'
+		}
+		order = TakeOrder(order_id=999999, request=self.mock_request)
+		success, err_msg = order.update_order_status()
+		self.assertEqual(success, False)
+		self.assertEqual(err_msg, "Order does not exist.")
 
 if __name__ == '__main__':
     unittest.main()
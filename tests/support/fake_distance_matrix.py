@@ -0,0 +1,240 @@
+import argparse, json, math, os, random, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from utilities.geo import haversine_distance
+
+#Stand-in for Google Map Distance Matrix API, for load tests without the real API.
+#Answers GET /maps/api/distancematrix/json like tests/support/gmap_distance_matrix_api_resp.json,
+#with the haversine distance, and injects latency, errors and rate limiting (see Faults).
+#GET /faults returns the fault configuration and counters, PUT /faults with a json body changes it.
+#   python tests/support/fake_distance_matrix.py --latency lognormal:0.2,0.5 --error-rate 0.01 --rate-limit 50
+
+ROAD_FACTOR = 1.3 #road distance over great-circle distance
+SPEED = 8.33 #meters per second, for the duration
+MAX_ELEMENTS = 100 #origins * destinations per request
+MAX_LOCATIONS = 25 #origins or destinations per request
+matrix_path = '/maps/api/distancematrix/json'
+
+
+def parse_latency(spec):
+	"""
+	Return function of a random.Random returning seconds, for latency distribution spec:
+	constant:SECONDS, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or exponential:MEAN.
+	Raise ValueError if invalid.
+	"""
+	name, _, values = spec.partition(':')
+	try:
+		values = [float(value) for value in values.split(',') if value]
+		if any(value < 0 for value in values) or name in ('lognormal', 'exponential') and not values[0] > 0:
+			raise ValueError
+		if name == 'constant' and len(values) == 1:
+			return lambda rng: values[0]
+		if name == 'uniform' and len(values) == 2:
+			return lambda rng: rng.uniform(values[0], values[1])
+		if name == 'lognormal' and len(values) == 2:
+			return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+		if name == 'exponential' and len(values) == 1:
+			return lambda rng: rng.expovariate(1.0 / values[0])
+	except (IndexError, ValueError):
+		pass
+	raise ValueError("Invalid latency: %s." % (spec,))
+
+
+class Faults():
+	"""
+	Faults injected into every response, shared by the request threads:
+	latency drawn from the latency distribution, plus tail_latency seconds for a tail_rate share of requests,
+	error_rate share of HTTP 500, unknown_error_rate share of status UNKNOWN_ERROR,
+	and status OVER_QUERY_LIMIT beyond rate_limit requests per second (0 for no limit).
+	"""
+	options = ('latency', 'tail_rate', 'tail_latency', 'error_rate', 'unknown_error_rate', 'rate_limit', 'seed')
+
+	def __init__(self, latency='constant:0', tail_rate=0, tail_latency=0, error_rate=0, unknown_error_rate=0, rate_limit=0, seed=None):
+		self._lock = threading.Lock()
+		self.counts = {'requests': 0, 'ok': 0, 'http_500': 0, 'unknown_error': 0, 'over_query_limit': 0}
+		self.config = {}
+		self.update(latency=latency, tail_rate=tail_rate, tail_latency=tail_latency, error_rate=error_rate,
+			unknown_error_rate=unknown_error_rate, rate_limit=rate_limit, seed=seed)
+
+	def update(self, **config):
+		"""
+		Change some options. Raise ValueError if invalid, the configuration is then unchanged.
+		"""
+		unknown = set(config) - set(self.options)
+		if unknown:
+			raise ValueError("Unknown options: %s." % (', '.join(sorted(unknown)),))
+		config = dict(self.config, **config)
+		latency = parse_latency(config['latency'])
+		for option in ('tail_rate', 'error_rate', 'unknown_error_rate'):
+			config[option] = float(config[option])
+			if not 0 <= config[option] <= 1:
+				raise ValueError("%s must be from 0 to 1." % (option,))
+		config['tail_latency'] = float(config['tail_latency'])
+		config['rate_limit'] = float(config['rate_limit'])
+		with self._lock:
+			self.config = config
+			self.latency = latency
+			self.rng = random.Random(config['seed'])
+			self.tokens = config['rate_limit']
+			self.refilled_at = time.monotonic()
+
+	def take_token(self):
+		"""
+		Token bucket of rate_limit requests per second, holding one second of burst.
+		"""
+		now = time.monotonic()
+		rate_limit = self.config['rate_limit']
+		self.tokens = min(rate_limit, self.tokens + (now - self.refilled_at) * rate_limit)
+		self.refilled_at = now
+		if self.tokens < 1:
+			return False
+		self.tokens -= 1
+		return True
+
+	def sample(self):
+		"""
+		Return seconds to wait and the fault of one request: None, 'http_500', 'unknown_error' or 'over_query_limit'.
+		"""
+		with self._lock:
+			self.counts['requests'] += 1
+			latency = max(self.latency(self.rng), 0)
+			if self.rng.random() < self.config['tail_rate']:
+				latency += self.config['tail_latency']
+			if self.config['rate_limit'] and not self.take_token():
+				fault = 'over_query_limit'
+			elif self.rng.random() < self.config['error_rate']:
+				fault = 'http_500'
+			elif self.rng.random() < self.config['unknown_error_rate']:
+				fault = 'unknown_error'
+			else:
+				fault = None
+			self.counts[fault or 'ok'] += 1
+		return latency, fault
+
+	def report(self):
+		with self._lock:
+			return {'config': dict(self.config), 'counts': dict(self.counts)}
+
+
+def parse_locations(locations):
+	"""
+	Parse 'lat, lng|lat, lng' into list of (lat, lng). Raise ValueError if invalid.
+	"""
+	parsed = []
+	for location in locations.split('|'):
+		lat, lng = location.split(',')
+		parsed.append((float(lat), float(lng)))
+	return parsed
+
+def distance_matrix(origins, destinations):
+	"""
+	Return response body of the Distance Matrix API between origins and destinations, lists of (lat, lng).
+	"""
+	rows = []
+	for origin in origins:
+		elements = []
+		for destination in destinations:
+			distance = int(round(haversine_distance(origin[0], origin[1], destination[0], destination[1]) * ROAD_FACTOR))
+			duration = int(round(distance / SPEED))
+			elements.append({
+				'distance': {'text': '%.1f km' % (distance / 1000.0,), 'value': distance},
+				'duration': {'text': '%s mins' % (max(int(round(duration / 60.0)), 1),), 'value': duration},
+				'status': 'OK'
+			})
+		rows.append({'elements': elements})
+	return {
+		'destination_addresses': ['%s,%s' % destination for destination in destinations],
+		'origin_addresses': ['%s,%s' % origin for origin in origins],
+		'rows': rows,
+		'status': 'OK'
+	}
+
+
+class FakeDistanceMatrixHandler(BaseHTTPRequestHandler):
+	faults = Faults()
+	protocol_version = 'HTTP/1.1' #keep-alive, like the real API
+
+	def send_json(self, status_code, body):
+		data = json.dumps(body).encode('utf-8')
+		self.send_response(status_code)
+		self.send_header('Content-Type', 'application/json; charset=UTF-8')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		if url.path == '/faults':
+			return self.send_json(200, self.faults.report())
+		if url.path != matrix_path:
+			return self.send_json(404, {'error': 'Not found.'})
+		latency, fault = self.faults.sample()
+		time.sleep(latency)
+		if fault == 'http_500':
+			return self.send_json(500, {'error': 'Injected server error.'})
+		if fault == 'unknown_error':
+			return self.send_json(200, {'status': 'UNKNOWN_ERROR', 'rows': []})
+		if fault == 'over_query_limit':
+			return self.send_json(200, {'status': 'OVER_QUERY_LIMIT', 'error_message': 'Injected rate limit.', 'rows': []})
+		params = dict((name, values[0]) for name, values in parse_qs(url.query).items())
+		if not params.get('key'):
+			return self.send_json(200, {'status': 'REQUEST_DENIED', 'error_message': 'The provided API key is invalid.', 'rows': []})
+		try:
+			origins = parse_locations(params['origins'])
+			destinations = parse_locations(params['destinations'])
+		except (KeyError, ValueError):
+			return self.send_json(200, {'status': 'INVALID_REQUEST', 'rows': []})
+		if len(origins) > MAX_LOCATIONS or len(destinations) > MAX_LOCATIONS or len(origins) * len(destinations) > MAX_ELEMENTS:
+			return self.send_json(200, {'status': 'MAX_ELEMENTS_EXCEEDED', 'rows': []})
+		self.send_json(200, distance_matrix(origins, destinations))
+
+	def do_PUT(self):
+		if urlparse(self.path).path != '/faults':
+			return self.send_json(404, {'error': 'Not found.'})
+		try:
+			self.faults.update(**json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')))
+		except (TypeError, ValueError) as e:
+			return self.send_json(400, {'error': str(e)})
+		self.send_json(200, self.faults.report())
+
+	def log_message(self, format, *args):
+		pass
+
+
+def make_server(host='127.0.0.1', port=0, faults=None):
+	"""
+	Return the HTTP server of the fake (port 0 for any free port), serve it with serve_forever().
+	"""
+	handler = type('Handler', (FakeDistanceMatrixHandler,), {'faults': faults or Faults()})
+	server = ThreadingHTTPServer((host, port), handler)
+	server.daemon_threads = True
+	return server
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--host', default=os.getenv('FAKE_GMAP_HOST', '0.0.0.0'))
+	parser.add_argument('--port', type=int, default=int(os.getenv('FAKE_GMAP_PORT', 8000)))
+	parser.add_argument('--latency', default=os.getenv('FAKE_GMAP_LATENCY', 'constant:0'),
+		help='constant:SECONDS, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or exponential:MEAN')
+	parser.add_argument('--tail-rate', type=float, default=float(os.getenv('FAKE_GMAP_TAIL_RATE', 0)), help='share of requests with tail latency')
+	parser.add_argument('--tail-latency', type=float, default=float(os.getenv('FAKE_GMAP_TAIL_LATENCY', 0)), help='seconds added to tail requests')
+	parser.add_argument('--error-rate', type=float, default=float(os.getenv('FAKE_GMAP_ERROR_RATE', 0)), help='share of HTTP 500')
+	parser.add_argument('--unknown-error-rate', type=float, default=float(os.getenv('FAKE_GMAP_UNKNOWN_ERROR_RATE', 0)), help='share of status UNKNOWN_ERROR')
+	parser.add_argument('--rate-limit', type=float, default=float(os.getenv('FAKE_GMAP_RATE_LIMIT', 0)), help='requests per second before OVER_QUERY_LIMIT, 0 for no limit')
+	parser.add_argument('--seed', type=int, default=os.getenv('FAKE_GMAP_SEED'))
+	args = parser.parse_args()
+	try:
+		faults = Faults(latency=args.latency, tail_rate=args.tail_rate, tail_latency=args.tail_latency, error_rate=args.error_rate,
+			unknown_error_rate=args.unknown_error_rate, rate_limit=args.rate_limit, seed=args.seed)
+	except ValueError as e:
+		parser.error(str(e))
+	server = make_server(args.host, args.port, faults)
+	print('Fake Distance Matrix API on http://%s:%s%s, faults: %s' % (args.host, server.server_port, matrix_path, json.dumps(faults.config)))
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import Mock, patch
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from utilities.ttl_cache import TTLCache
+from order_app.distance_cache import LocalDistanceCache, DatabaseDistanceCache, distance_cache_key
+
+logger = get_logger('test')
+
+class DistanceCacheTestCase(unittest.TestCase):
+
+	def test_distance_cache_key(self):
+		"""
+		Test if equal coordinates in different string forms share one cache key.
+		"""
+		key = distance_cache_key("59.4564", "24.70758", "59.436487", "24.747193", 'metric')
+		self.assertEqual(key, distance_cache_key(59.456400, 24.707580, "59.436487", "24.747193", 'METRIC'))
+		self.assertNotEqual(key, distance_cache_key("59.436487", "24.747193", "59.4564", "24.70758", 'metric'))
+		self.assertNotEqual(key, distance_cache_key("59.4564", "24.70758", "59.436487", "24.747193", 'imperial'))
+
+	def test_local_distance_cache_hit_miss(self):
+		"""
+		Test if local distance cache counts hits and misses.
+		"""
+		cache = LocalDistanceCache(max_size=10, ttl=60)
+		self.assertEqual(cache.get('a'), None)
+		cache.set('a', 4105)
+		self.assertEqual(cache.get('a'), 4105)
+		self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+	def test_ttl_cache_lru_eviction(self):
+		"""
+		Test if the least recently used entry is evicted beyond max_size.
+		"""
+		cache = TTLCache(max_size=2, ttl=60)
+		cache.set('a', 1)
+		cache.set('b', 2)
+		cache.get('a')
+		cache.set('c', 3)
+		self.assertEqual(cache.get('b'), None)
+		self.assertEqual(cache.get('a'), 1)
+		self.assertEqual(cache.get('c'), 3)
+
+	def test_ttl_cache_expiry(self):
+		"""
+		Test if expired entries are missed.
+		"""
+		cache = TTLCache(max_size=2, ttl=60)
+		with patch('utilities.ttl_cache.time.monotonic', return_value=1000):
+			cache.set('a', 1)
+		with patch('utilities.ttl_cache.time.monotonic', return_value=1059):
+			self.assertEqual(cache.get('a'), 1)
+		with patch('utilities.ttl_cache.time.monotonic', return_value=1060):
+			self.assertEqual(cache.get('a'), None)
+		self.assertEqual(cache.stats()['size'], 0)
+	@patch('order_app.distance_cache.get_session')
+	def test_database_distance_cache_touch(self, mock_get_session):
+		"""
+		Test if hits on rows not used for touch_interval seconds mark them as used, for LRU eviction, and recent hits do not.
+		"""
+		session = mock_get_session.return_value
+		cache = DatabaseDistanceCache(max_size=10, ttl=60, touch_interval=30)
+		session.query.return_value.filter.return_value.all.return_value = [('key-1', 1000, False)]
+		self.assertEqual(cache.get('key-1'), 1000)
+		session.execute.assert_not_called()
+		session.query.return_value.filter.return_value.all.return_value = [('key-1', 1000, True)]
+		self.assertEqual(cache.get('key-1'), 1000)
+		touch = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+		self.assertTrue(touch.startswith('UPDATE "DistanceCache" SET updated_at=TIMEZONE(\'utc\', CURRENT_TIMESTAMP)'))
+		session.commit.assert_called_once_with()
+		session.query.return_value.filter.return_value.all.return_value = []
+		self.assertEqual(cache.get('key-2'), None)
+		self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'writes': 0})
+
+	@patch('order_app.distance_cache.get_session')
+	def test_database_distance_cache_many(self, mock_get_session):
+		"""
+		Test if get_many reads all keys with one query on one session, and set_many writes them with one upsert.
+		"""
+		session = mock_get_session.return_value
+		cache = DatabaseDistanceCache(max_size=10, ttl=60, prune_interval=3)
+		session.query.return_value.filter.return_value.all.return_value = [('key-1', 1000, False), ('key-3', 3000, False)]
+		self.assertEqual(cache.get_many(['key-1', 'key-2', 'key-3']), {'key-1': 1000, 'key-3': 3000})
+		self.assertEqual(mock_get_session.call_count, 1)
+		self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'writes': 0})
+		cache.set_many({'key-2': 2000, 'key-4': 4000})
+		upsert = session.execute.call_args_list[0][0][0].compile(dialect=postgresql.dialect())
+		self.assertTrue(str(upsert).startswith('INSERT INTO "DistanceCache"'))
+		self.assertIn('distance = excluded.distance, expires_at = excluded.expires_at', str(upsert))
+		self.assertEqual((upsert.params['key_m0'], upsert.params['key_m1']), ('key-2', 'key-4'))
+		self.assertEqual(session.execute.call_count, 1)
+		self.assertEqual(session.commit.call_count, 1)
+		cache.set_many({'key-5': 5000}) #3rd write prunes
+		self.assertEqual(session.query.return_value.filter.return_value.delete.call_count, 2)
+		self.assertEqual(cache.stats()['writes'], 3)
+		self.assertEqual(LocalDistanceCache(max_size=10, ttl=60).get_many(['key-1']), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
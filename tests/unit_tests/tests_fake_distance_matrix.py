@@ -0,0 +1,131 @@
+import unittest, json, os, threading
+import urllib.request
+from utilities.logger import get_logger
+from order_app.settings import TEST_DIR
+from order_app.gmap_client import DistanceMatrixClient, DistanceMatrixError, DistanceMatrixUnavailable, CircuitBreaker
+from tests.support.fake_distance_matrix import Faults, parse_latency, parse_locations, distance_matrix, make_server, matrix_path
+
+logger = get_logger('test')
+
+class FakeDistanceMatrixTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Load predefined Google Map Distance Matrix API responses from json file, and serve the fake on a free port.
+		"""
+		with open(os.path.join(TEST_DIR, 'support', 'gmap_distance_matrix_api_resp.json')) as f:
+			cls.predefined_gmap_resp = json.loads(f.read())
+		cls.faults = Faults()
+		cls.server = make_server(faults=cls.faults)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+		cls.base_url = 'http://127.0.0.1:%s' % (cls.server.server_port,)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+
+	def setUp(self):
+		self.faults.update(latency='constant:0', tail_rate=0, tail_latency=0, error_rate=0, unknown_error_rate=0, rate_limit=0, seed=1)
+		self.client = DistanceMatrixClient(url=self.base_url + matrix_path, key='test', max_retries=0,
+			breaker=CircuitBreaker(failure_threshold=100, reset_timeout=30))
+
+	def test_parse_latency(self):
+		"""
+		Test if latency distributions are parsed, and invalid ones raise ValueError.
+		"""
+		faults = Faults(seed=1)
+		self.assertEqual(parse_latency('constant:0.5')(faults.rng), 0.5)
+		self.assertTrue(0.1 <= parse_latency('uniform:0.1,0.2')(faults.rng) <= 0.2)
+		self.assertGreater(parse_latency('lognormal:0.2,0.5')(faults.rng), 0)
+		self.assertGreater(parse_latency('exponential:0.2')(faults.rng), 0)
+		for spec in ('constant', 'uniform:0.1', 'normal:0.1,0.2', 'exponential:0', 'uniform:-1,1', 'constant:fast'):
+			with self.assertRaises(ValueError):
+				parse_latency(spec)
+
+	def test_update_invalid(self):
+		"""
+		Test if invalid options raise ValueError and leave the configuration unchanged.
+		"""
+		faults = Faults(error_rate=0.1)
+		for config in ({'error_rate': 2}, {'latency': 'normal:1'}, {'timeout': 1}):
+			with self.assertRaises(ValueError):
+				faults.update(**config)
+		self.assertEqual(faults.config['error_rate'], 0.1)
+		self.assertEqual(faults.config['latency'], 'constant:0')
+
+	def test_distance_matrix_shape(self):
+		"""
+		Test if the response has the shape of the Distance Matrix API response.
+		"""
+		expected = self.predefined_gmap_resp['success']['response_body']
+		origin = parse_locations('22.3, 114.1')
+		destinations = parse_locations('22.35, 114.15|22.4, 114.2')
+		resp = distance_matrix(origin, destinations)
+		self.assertEqual(set(resp), set(expected) - {'mock'})
+		self.assertEqual(len(resp['rows']), 1)
+		self.assertEqual(len(resp['rows'][0]['elements']), 2)
+		element = resp['rows'][0]['elements'][0]
+		self.assertEqual(set(element), set(expected['rows'][0]['elements'][0]))
+		self.assertEqual(element['status'], 'OK')
+		self.assertLess(element['distance']['value'], resp['rows'][0]['elements'][1]['distance']['value'])
+
+	def test_sample_rates(self):
+		"""
+		Test if the seeded fault rates are close to the configured ones.
+		"""
+		faults = Faults(error_rate=0.2, unknown_error_rate=0.25, tail_rate=0.1, tail_latency=5, seed=1)
+		samples = [faults.sample() for i in range(10000)]
+		self.assertAlmostEqual(faults.counts['http_500'] / 10000.0, 0.2, delta=0.02)
+		self.assertAlmostEqual(faults.counts['unknown_error'] / 10000.0, 0.8 * 0.25, delta=0.02)
+		self.assertAlmostEqual(len([latency for latency, fault in samples if latency >= 5]) / 10000.0, 0.1, delta=0.02)
+		self.assertEqual(faults.counts['requests'], 10000)
+
+	def test_rate_limit(self):
+		"""
+		Test if requests beyond rate_limit per second are answered OVER_QUERY_LIMIT.
+		"""
+		faults = Faults(rate_limit=5)
+		faults_of_burst = [faults.sample()[1] for i in range(8)]
+		self.assertEqual(faults_of_burst[:5], [None] * 5)
+		self.assertEqual(faults_of_burst[5:], ['over_query_limit'] * 3)
+
+	def test_client_get_distance(self):
+		"""
+		Test if DistanceMatrixClient gets the distance from the fake.
+		"""
+		origin, destination = ('22.3', '114.1'), ('22.35', '114.15')
+		expected = distance_matrix(parse_locations('22.3, 114.1'), parse_locations('22.35, 114.15'))
+		self.assertEqual(self.client.get_distance(origin, destination), expected['rows'][0]['elements'][0]['distance']['value'])
+
+	def test_client_faults(self):
+		"""
+		Test if injected faults are seen by DistanceMatrixClient as the upstream being unavailable,
+		and requests without key as an error.
+		"""
+		origin, destination = ('22.3', '114.1'), ('22.35', '114.15')
+		for config in ({'error_rate': 1}, {'unknown_error_rate': 1}, {'rate_limit': 0.5}):
+			self.faults.update(error_rate=0, unknown_error_rate=0, rate_limit=0)
+			self.faults.update(**config)
+			if 'rate_limit' in config:
+				self.faults.sample() #uses the only token
+			with self.assertRaises(DistanceMatrixUnavailable):
+				self.client.get_distance(origin, destination)
+		self.faults.update(error_rate=0, unknown_error_rate=0, rate_limit=0)
+		self.client.key = ''
+		with self.assertRaises(DistanceMatrixError):
+			self.client.get_distance(origin, destination)
+
+	def test_put_faults(self):
+		"""
+		Test if PUT /faults changes the faults, and GET /faults returns them with the counters.
+		"""
+		request = urllib.request.Request(self.base_url + '/faults', data=json.dumps({'error_rate': 0.5}).encode('utf-8'), method='PUT')
+		self.assertEqual(json.loads(urllib.request.urlopen(request).read().decode('utf-8'))['config']['error_rate'], 0.5)
+		report = json.loads(urllib.request.urlopen(self.base_url + '/faults').read().decode('utf-8'))
+		self.assertEqual(report['config']['error_rate'], 0.5)
+		self.assertIn('over_query_limit', report['counts'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest, json, os
+import requests
+from unittest.mock import Mock, patch
+from utilities.logger import get_logger
+from order_app.settings import TEST_DIR
+from order_app.gmap_client import DistanceMatrixClient, DistanceMatrixError, DistanceMatrixUnavailable, CircuitBreaker
+
+logger = get_logger('test')
+
+class DistanceMatrixClientTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Load predefined Google Map Distance Matrix API responses from json file,
+		and mock time.sleep of the retry backoff.
+		"""
+		with open(os.path.join(TEST_DIR, 'support', 'gmap_distance_matrix_api_resp.json')) as f:
+			cls.predefined_gmap_resp = json.loads(f.read())
+		cls.distance = cls.predefined_gmap_resp['success']['response_body']['rows'][0]['elements'][0]['distance']['value']
+		cls.origin = tuple(cls.predefined_gmap_resp['success']['request_body']['origins'])
+		cls.destination = tuple(cls.predefined_gmap_resp['success']['request_body']['destinations'])
+
+		cls.mock_sleep_patcher = patch('order_app.gmap_client.time.sleep')
+		cls.mock_sleep = cls.mock_sleep_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.mock_sleep_patcher.stop()
+
+	def setUp(self):
+		"""
+		Initialize client with mock http session.
+		"""
+		self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+		self.client = DistanceMatrixClient(url='https://gmap.test/distancematrix/json', key='test',
+			max_retries=2, breaker=self.breaker)
+		self.client.session = Mock()
+		self.success_resp = Mock(status_code=200)
+		self.success_resp.json.return_value = self.predefined_gmap_resp['success']['response_body']
+
+	def test_get_distance(self):
+		"""
+		Test if get_distance returns the distance, with the configured timeouts.
+		"""
+		self.client.session.get.return_value = self.success_resp
+		self.assertEqual(self.client.get_distance(self.origin, self.destination), self.distance)
+		args, kwargs = self.client.session.get.call_args
+		self.assertEqual(kwargs['timeout'], self.client.timeout)
+		self.assertEqual(kwargs['params']['origins'], '%s, %s' % self.origin)
+
+	def test_get_distance_not_found(self):
+		"""
+		Test if an element without distance raises DistanceMatrixError without retry.
+		"""
+		resp = Mock(status_code=200)
+		resp.json.return_value = self.predefined_gmap_resp['fail']['response_body']
+		self.client.session.get.return_value = resp
+		with self.assertRaises(DistanceMatrixError):
+			self.client.get_distance(self.origin, self.destination)
+		self.assertEqual(self.client.session.get.call_count, 1)
+		self.assertEqual(self.breaker.state, 'closed')
+
+	def test_retry_timeout(self):
+		"""
+		Test if timeouts are retried, and succeed once the upstream answers.
+		"""
+		self.client.session.get.side_effect = [requests.Timeout(), Mock(status_code=503), self.success_resp]
+		self.assertEqual(self.client.get_distance(self.origin, self.destination), self.distance)
+		self.assertEqual(self.client.session.get.call_count, 3)
+
+	def test_circuit_breaker(self):
+		"""
+		Test if the breaker opens after consecutive failures, and fails fast while open.
+		"""
+		self.client.session.get.side_effect = requests.Timeout()
+		for i in range(2):
+			with self.assertRaises(DistanceMatrixUnavailable):
+				self.client.get_distance(self.origin, self.destination)
+		self.assertEqual(self.client.session.get.call_count, 6) #2 calls, 1 attempt + 2 retries each
+		self.assertEqual(self.breaker.state, 'open')
+		with self.assertRaises(DistanceMatrixUnavailable):
+			self.client.get_distance(self.origin, self.destination)
+		self.assertEqual(self.client.session.get.call_count, 6)
+
+	def test_circuit_breaker_half_open(self):
+		"""
+		Test if a successful trial request closes the breaker after reset_timeout.
+		"""
+		self.breaker.opened_at = 0
+		self.breaker.failures = 2
+		with patch('order_app.gmap_client.time.monotonic', return_value=30):
+			self.assertEqual(self.breaker.state, 'half_open')
+			self.client.session.get.return_value = self.success_resp
+			self.assertEqual(self.client.get_distance(self.origin, self.destination), self.distance)
+		self.assertEqual(self.breaker.state, 'closed')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import Mock, patch
+from psycopg2 import extensions, OperationalError
+from utilities.logger import get_logger
+from utilities import green
+
+logger = get_logger('test')
+
+class GreenTestCase(unittest.TestCase):
+
+	@patch('utilities.green.wait_write')
+	@patch('utilities.green.wait_read')
+	def test_gevent_wait_callback(self, mock_wait_read, mock_wait_write):
+		"""
+		Test if the callback waits in the hub for the socket until the connection is ready.
+		"""
+		conn = Mock()
+		conn.fileno.return_value = 7
+		conn.poll.side_effect = [extensions.POLL_WRITE, extensions.POLL_READ, extensions.POLL_READ, extensions.POLL_OK]
+		green.gevent_wait_callback(conn)
+		mock_wait_write.assert_called_once_with(7, timeout=None)
+		self.assertEqual(mock_wait_read.call_count, 2)
+
+		conn.poll.side_effect = [-1]
+		with self.assertRaises(OperationalError):
+			green.gevent_wait_callback(conn)
+
+	def test_make_psycopg_green(self):
+		"""
+		Test if the callback is installed, and missing gevent raises ImportError.
+		"""
+		with patch('utilities.green.extensions') as mock_extensions, patch('utilities.green.wait_read', Mock()):
+			green.make_psycopg_green()
+			mock_extensions.set_wait_callback.assert_called_with(green.gevent_wait_callback)
+		with patch('utilities.green.wait_read', None):
+			with self.assertRaises(ImportError):
+				green.make_psycopg_green()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+from utilities.logger import get_logger
+from order_app.views import app
+from order_app import health
+
+logger = get_logger('test')
+
+
+class ReadinessTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Mock the pooled engine of order_app.health.
+		"""
+		cls.client = app.test_client()
+		cls.mock_get_engine_patcher = patch('order_app.health.get_engine')
+		cls.mock_get_engine = cls.mock_get_engine_patcher.start()
+		cls.mock_engine = cls.mock_get_engine.return_value
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.mock_get_engine_patcher.stop()
+
+	def setUp(self):
+		health.probe_cache.clear()
+		self.mock_engine.reset_mock()
+		self.mock_engine.connect.side_effect = None
+		self.mock_engine.pool.checkedout.return_value = 3
+
+	def test_liveness(self):
+		resp = self.client.get('/healthcheck/live')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.get_json(), {'status': 'alive'})
+
+	def test_ready(self):
+		"""
+		Test if readiness runs SELECT 1 and reports pool saturation and breaker state.
+		"""
+		resp = self.client.get('/healthcheck/ready')
+		self.assertEqual(resp.status_code, 200)
+		checks = resp.get_json()['checks']
+		self.assertEqual(checks['database']['ok'], True)
+		self.assertEqual(checks['database']['cached'], False)
+		self.assertEqual(checks['db_pool']['checked_out'], 3)
+		self.assertEqual(checks['distance_matrix']['breaker'], 'closed')
+		conn = self.mock_engine.connect.return_value.__enter__.return_value
+		conn.execute.assert_called_once_with("SELECT 1")
+
+	def test_ready_cached(self):
+		"""
+		Test if the database probe is cached, so polling does not query the database every time.
+		"""
+		for i in range(3):
+			resp = self.client.get('/healthcheck/ready')
+		self.assertEqual(resp.get_json()['checks']['database']['cached'], True)
+		self.assertEqual(self.mock_engine.connect.call_count, 1)
+
+	def test_unready_database(self):
+		"""
+		Test if the worker is unready with HTTP 503 when the database cannot be reached.
+		"""
+		self.mock_engine.connect.side_effect = Exception('connection refused')
+		resp = self.client.get('/healthcheck/ready')
+		self.assertEqual(resp.status_code, 503)
+		self.assertEqual(resp.get_json()['status'], 'unready')
+		self.assertEqual(resp.get_json()['checks']['database']['ok'], False)
+
+	def test_unready_pool_exhausted(self):
+		"""
+		Test if the worker is unready without probing when the pool is exhausted.
+		"""
+		self.mock_engine.pool.checkedout.return_value = health.DB_POOL['pool_size'] + health.DB_POOL['max_overflow']
+		resp = self.client.get('/healthcheck/ready')
+		self.assertEqual(resp.status_code, 503)
+		self.assertEqual(resp.get_json()['checks']['db_pool']['saturation'], 1)
+		self.mock_engine.connect.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
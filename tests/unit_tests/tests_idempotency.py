@@ -0,0 +1,165 @@
+import unittest
+from unittest.mock import Mock, patch
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from order_app.settings import app
+from order_app import idempotency
+from order_app.idempotency import IdempotencyClaim, request_hash, key_mismatch_err_msg, key_in_progress_err_msg, key_unavailable_err_msg
+from order_app.place_order import PlaceOrder
+import order_app.views
+
+logger = get_logger('test')
+
+body = {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']}
+
+class IdempotencyTestCase(unittest.TestCase):
+
+	def setUp(self):
+		"""
+		Mock sessions of order_app.idempotency, without purging expired keys.
+		"""
+		self.mock_get_session_patcher = patch('order_app.idempotency.get_session')
+		self.mock_get_session = self.mock_get_session_patcher.start()
+		self.mock_purge_patcher = patch('order_app.idempotency.purge_expired_keys')
+		self.mock_purge_patcher.start()
+		self.session = self.mock_get_session.return_value
+
+	def tearDown(self):
+		self.mock_get_session_patcher.stop()
+		self.mock_purge_patcher.stop()
+
+	def test_request_hash(self):
+		"""
+		Test if the hash ignores key order, but not values.
+		"""
+		self.assertEqual(request_hash(body), request_hash({'destination': ['22.4', '114.2'], 'origin': ['22.3', '114.1']}))
+		self.assertNotEqual(request_hash(body), request_hash({'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.3']}))
+
+	def test_claim(self):
+		"""
+		Test if a new key is committed PENDING at once, without keeping a session open, and deleted by release.
+		"""
+		self.session.execute.return_value.fetchone.return_value = ('key-1',)
+		claim = IdempotencyClaim('key-1', body)
+		self.assertEqual(claim.claim(), (None, None, None))
+		self.session.commit.assert_called_once_with()
+		self.session.close.assert_called_once_with()
+		claim.release()
+		delete = str(self.session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+		self.assertTrue(delete.startswith('DELETE FROM "IdempotencyKey"'))
+		self.assertIn('response_status IS NULL', delete)
+		self.assertEqual(self.session.commit.call_count, 2)
+		claim.release()
+		self.assertEqual(self.session.commit.call_count, 2) #released once
+
+	def test_claim_repeat(self):
+		"""
+		Test if a repeat gets the stored response, unless its request body differs, and releases nothing.
+		"""
+		self.session.execute.return_value.fetchone.side_effect = [None, (request_hash(body), 200, {'id': 1}, False)]
+		claim = IdempotencyClaim('key-1', body)
+		self.assertEqual(claim.claim(), (200, {'id': 1}, None))
+		claim.release()
+		self.assertEqual(self.session.execute.call_count, 2)
+		self.session.execute.return_value.fetchone.side_effect = [None, ('other hash', 200, {'id': 1}, False)]
+		self.assertEqual(IdempotencyClaim('key-1', body).claim(), (None, None, (key_mismatch_err_msg, 422)))
+
+	@patch('order_app.idempotency.time.sleep')
+	def test_claim_wait(self, mock_sleep):
+		"""
+		Test if a repeat polls a key in progress until its response is stored, or 409 after IDEMPOTENCY_LOCK_TIMEOUT.
+		"""
+		pending = (request_hash(body), None, None, False)
+		self.session.execute.return_value.fetchone.side_effect = [None, pending, None, pending, None, (request_hash(body), 200, {'id': 1}, False)]
+		self.assertEqual(IdempotencyClaim('key-1', body).claim(), (200, {'id': 1}, None))
+		self.assertEqual(mock_sleep.call_count, 2)
+		self.session.execute.return_value.fetchone.side_effect = [None, pending]
+		with patch.object(idempotency, 'IDEMPOTENCY_LOCK_TIMEOUT', 0):
+			self.assertEqual(IdempotencyClaim('key-1', body).claim(), (None, None, (key_in_progress_err_msg, 409)))
+
+	def test_claim_take_over(self):
+		"""
+		Test if a key left PENDING by a request that died is taken over.
+		"""
+		self.session.execute.return_value.fetchone.side_effect = [None, (request_hash(body), None, None, True), ('key-1',)]
+		claim = IdempotencyClaim('key-1', body)
+		self.assertEqual(claim.claim(), (None, None, None))
+		self.assertEqual(claim.claimed, True)
+
+	def test_claim_errors(self):
+		"""
+		Test if database errors are a 503, to be retried.
+		"""
+		self.session.execute.side_effect = Exception('connection refused')
+		self.assertEqual(IdempotencyClaim('key-1', body).claim()[2], (key_unavailable_err_msg, 503))
+		self.session.close.assert_called_with()
+
+	def test_complete(self):
+		"""
+		Test if complete stores the response in the session of the order, and raises if the key is no longer claimed.
+		"""
+		session = Mock()
+		session.execute.return_value.rowcount = 1
+		IdempotencyClaim('key-1', body).complete(session, 200, {'id': 1}, 1)
+		update = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+		self.assertIn('response_status IS NULL', update)
+		session.execute.return_value.rowcount = 0
+		with self.assertRaises(RuntimeError):
+			IdempotencyClaim('key-1', body).complete(session, 200, {'id': 1}, 1)
+
+	def test_purge_interval(self):
+		"""
+		Test if expired keys are purged at most once per IDEMPOTENCY_PURGE_INTERVAL.
+		"""
+		self.mock_purge_patcher.stop()
+		try:
+			with patch.object(idempotency, '_next_purge', 0):
+				idempotency.purge_expired_keys()
+				idempotency.purge_expired_keys()
+			self.assertEqual(self.session.commit.call_count, 1)
+		finally:
+			self.mock_purge_patcher.start()
+
+	@patch('order_app.place_order.get_session')
+	def test_place_order_with_claim(self, mock_get_session):
+		"""
+		Test if the response is stored in the key in the transaction of the order.
+		"""
+		claim = IdempotencyClaim('key-1', body)
+		claim.complete = Mock()
+		request = Mock()
+		request.json = body
+		order = PlaceOrder(request=request, idempotency=claim)
+		new_order_item, err_msg = order.insert_new_order(1000)
+		session = mock_get_session.return_value
+		claim.complete.assert_called_with(session, 200, new_order_item, new_order_item['id'])
+		session.commit.assert_called_with()
+
+	def test_place_order_view(self):
+		"""
+		Test if a repeat is replayed without placing the order, and a claimed key is released after placing it.
+		"""
+		client = app.test_client()
+		headers = {'Idempotency-Key': 'key-1'}
+		self.assertEqual(client.post('/orders', json=body, headers={'Idempotency-Key': 'bad key'}).status_code, 400)
+		with patch.object(order_app.views.IdempotencyClaim, 'claim', return_value=(None, None, (key_unavailable_err_msg, 503))):
+			response = client.post('/orders', json=body, headers=headers)
+			self.assertEqual(response.status_code, 503)
+			self.assertEqual(response.headers['Retry-After'], '1')
+		with patch.object(order_app.views.IdempotencyClaim, 'claim', return_value=(200, {'id': 1, 'distance': 1000, 'status': 'UNASSIGNED'}, None)), \
+			patch.object(order_app.views.PlaceOrder, 'run_place_order') as run_place_order:
+			response = client.post('/orders', json=body, headers=headers)
+			self.assertEqual(response.get_json(), {'id': 1, 'distance': 1000, 'status': 'UNASSIGNED'})
+			self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+			self.assertEqual(run_place_order.call_count, 0)
+		with patch.object(order_app.views.IdempotencyClaim, 'claim', return_value=(None, None, None)), \
+			patch.object(order_app.views.IdempotencyClaim, 'release') as release, \
+			patch.object(order_app.views.PlaceOrder, 'run_place_order', return_value=({'id': 2, 'distance': 1000, 'status': 'UNASSIGNED'}, None)):
+			response = client.post('/orders', json=body, headers=headers)
+			self.assertEqual(response.get_json()['id'], 2)
+			self.assertEqual(release.call_count, 1)
+		with patch.object(order_app.views.IdempotencyClaim, 'claim', return_value=(None, None, (key_mismatch_err_msg, 422))):
+			self.assertEqual(client.post('/orders', json=body, headers=headers).status_code, 422)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest, json, datetime
+from unittest.mock import patch
+from utilities.logger import get_logger
+from order_app.settings import app
+from order_app import json_response
+from order_app.json_response import jsonify, jsonify_list, get_dumps, stdlib_dumps, orjson_dumps
+
+logger = get_logger('test')
+
+class JsonResponseTestCase(unittest.TestCase):
+
+	orders = [{'id': order_id, 'distance': order_id * 10, 'status': 'UNASSIGNED'} for order_id in range(250, 0, -1)]
+
+	def test_compact_and_pretty(self):
+		"""
+		Test if responses are compact by default, and indented with sorted keys with ?pretty=1.
+		"""
+		with app.test_request_context('/orders'):
+			response = jsonify({'status': 'SUCCESS', 'id': 1})
+			self.assertEqual(response.mimetype, 'application/json')
+			self.assertEqual(json.loads(response.data), {'status': 'SUCCESS', 'id': 1})
+			self.assertEqual(b' ' in response.data or b'\n' in response.data, False)
+		with app.test_request_context('/orders?pretty=1'):
+			response = jsonify(status='SUCCESS', id=1)
+			self.assertEqual(response.data, b'{\n  "id": 1, \n  "status": "SUCCESS"\n}\n')
+
+	def test_encoders(self):
+		"""
+		Test if stdlib is the fallback, and every encoder converts types unknown to JSON like flask.jsonify.
+		"""
+		self.assertEqual(get_dumps('json')[0], 'json')
+		with patch.object(json_response, 'orjson', None):
+			self.assertEqual(get_dumps('auto')[0], 'json')
+			self.assertEqual(get_dumps('orjson')[0], 'json')
+		data = {'id': 1, 'created_at': datetime.datetime(2020, 1, 1)}
+		for encoder in ('auto', 'json'):
+			name, dumps = get_dumps(encoder)
+			self.assertEqual(json.loads(dumps(data)), json.loads(stdlib_dumps(data)))
+
+	@unittest.skipIf(json_response.orjson is None, 'orjson is not installed')
+	def test_orjson_dumps_datetime(self):
+		"""
+		Test if orjson_dumps encodes datetimes as ISO 8601 like stdlib_dumps, with the options of the pinned orjson.
+		"""
+		data = {'id': 1, 'created_at': datetime.datetime(2020, 1, 1, 12, 30, 0, 123456), 'day': datetime.date(2020, 1, 2)}
+		expected = {'id': 1, 'created_at': '2020-01-01T12:30:00.123456', 'day': '2020-01-02'}
+		self.assertEqual(json.loads(orjson_dumps(data)), expected)
+		self.assertEqual(json.loads(stdlib_dumps(data)), expected)
+
+	def test_jsonify_list_stream(self):
+		"""
+		Test if chunks of items are streamed as they come, as one JSON array, and ?pretty=1 is not streamed.
+		"""
+		chunks = [self.orders[start:start + 40] for start in range(0, len(self.orders), 40)]
+		with app.test_request_context('/orders'):
+			response = jsonify_list(iter(chunks))
+			self.assertEqual(response.is_streamed, True)
+			self.assertEqual(json.loads(response.get_data()), self.orders)
+			self.assertEqual(json.loads(jsonify_list(iter([[], self.orders[:1], []])).get_data()), self.orders[:1])
+			self.assertEqual(json.loads(jsonify_list(iter([])).get_data()), [])
+		with app.test_request_context('/orders?pretty=1'):
+			response = jsonify_list(iter(chunks))
+			self.assertEqual(response.is_streamed, False)
+			self.assertEqual(json.loads(response.get_data()), self.orders)
+
+if __name__ == '__main__':
+    unittest.main()
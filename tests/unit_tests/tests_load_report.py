@@ -0,0 +1,102 @@
+import unittest, os, shutil, tempfile, io
+from contextlib import redirect_stdout
+from utilities.logger import get_logger
+from tests.integration_tests.load_tests.load_report import read_locust_csv, summarize, compare, main
+
+logger = get_logger('test')
+
+#files of locust 0.14 --csv
+stats_csv = '''"Method","Name","# requests","# failures","Median response time","Average response time","Min response time","Max response time","Average Content Size","Requests/s"
+"GET","/orders/[id]",400,0,12,15,3,210,120,6.67
+"POST","/orders",200,4,95,110,40,900,110,3.33
+"None","Total",600,4,20,46,3,900,117,10.00
+'''
+distribution_csv = '''"Name","# requests","50%","66%","75%","80%","90%","95%","98%","99%","99.9%","99.99%","100%"
+"GET /orders/[id]",400,12,14,16,18,25,40,80,120,210,210,210
+"POST /orders",200,95,110,120,130,200,300,600,800,900,900,900
+"Total",600,20,40,60,80,100,250,500,700,900,900,900
+'''
+
+class LoadReportTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.prefix = os.path.join(self.directory, 'orders')
+		with open(self.prefix + '_stats.csv', 'w') as f:
+			f.write(stats_csv)
+		with open(self.prefix + '_distribution.csv', 'w') as f:
+			f.write(distribution_csv)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_read_locust_csv(self):
+		"""
+		Test if rows of the stats and distribution files are merged by endpoint.
+		"""
+		stats = read_locust_csv(self.prefix)
+		self.assertEqual(set(stats), {'GET /orders/[id]', 'POST /orders', 'Total'})
+		self.assertEqual(stats['POST /orders']['# failures'], '4')
+		self.assertEqual(stats['POST /orders']['95%'], '300')
+
+	def test_read_locust_csv_missing(self):
+		"""
+		Test if a prefix without locust files raises ValueError.
+		"""
+		with self.assertRaises(ValueError):
+			read_locust_csv(os.path.join(self.directory, 'missing'))
+
+	def test_summarize(self):
+		"""
+		Test if the summary has throughput, failure ratio and percentiles in total and per endpoint.
+		"""
+		summary = summarize(self.prefix, {'LOAD_USERS': '50'})
+		self.assertEqual(summary['total'], {'requests': 600, 'failures': 4, 'failure_ratio': 4 / 600.0,
+			'throughput': 10.0, 'p50': 20.0, 'p95': 250.0, 'p99': 700.0})
+		self.assertEqual(summary['endpoints']['GET /orders/[id]']['p99'], 120.0)
+		self.assertEqual(summary['workload'], {'LOAD_USERS': '50'})
+
+	def test_compare_no_regression(self):
+		"""
+		Test if a run within tolerance of the baseline has no regression.
+		"""
+		baseline = summarize(self.prefix)
+		summary = summarize(self.prefix)
+		summary['total']['p95'] *= 1.1
+		summary['total']['throughput'] *= 0.9
+		self.assertEqual(compare(summary, baseline), [])
+
+	def test_compare_regressions(self):
+		"""
+		Test if slower percentiles, lower throughput and more failures are regressions,
+		and endpoints missing from the baseline are not compared.
+		"""
+		baseline = summarize(self.prefix)
+		del baseline['endpoints']['GET /orders/[id]']
+		summary = summarize(self.prefix)
+		summary['endpoints']['POST /orders']['p99'] = 1200.0
+		summary['endpoints']['GET /orders/[id]']['p99'] = 5000.0
+		summary['total']['throughput'] = 5.0
+		summary['total']['failure_ratio'] = 0.05
+		regressions = compare(summary, baseline)
+		self.assertEqual(len(regressions), 3)
+		self.assertIn('POST /orders p99', regressions[1])
+		self.assertIn('throughput', regressions[2])
+
+	def test_main_baseline(self):
+		"""
+		Test if a run fails without a baseline, passes once the baseline is stored with --update-baseline,
+		and fails when it regressed from it.
+		"""
+		baseline = os.path.join(self.directory, 'baseline.json')
+		with redirect_stdout(io.StringIO()):
+			self.assertEqual(main([self.prefix, '--baseline', baseline]), 1)
+			self.assertEqual(main([self.prefix, '--baseline', baseline, '--update-baseline']), 0)
+			self.assertEqual(main([self.prefix, '--baseline', baseline]), 0)
+			self.assertEqual(main([self.prefix]), 0) #summary only
+			with open(self.prefix + '_distribution.csv', 'w') as f:
+				f.write(distribution_csv.replace('"Total",600,20,40,60,80,100,250', '"Total",600,20,40,60,80,100,900'))
+			self.assertEqual(main([self.prefix, '--baseline', baseline]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest, logging, queue, importlib, os
+from unittest.mock import patch
+from utilities import logger as logger_module
+from utilities.logger import get_logger, DroppingQueueHandler, RoutingQueueListener, dropped_log_records, level_overrides
+
+logger = get_logger('test')
+
+
+class RecordingHandler(logging.Handler):
+
+	def __init__(self, level=logging.NOTSET):
+		super().__init__(level)
+		self.records = []
+
+	def emit(self, record):
+		self.records.append(record)
+
+
+class QueueLoggingTestCase(unittest.TestCase):
+
+	def setUp(self):
+		"""
+		Route logger 'queue_test' through a small queue to a recording handler.
+		"""
+		self.log_queue = queue.Queue(2)
+		self.handler = RecordingHandler()
+		self.error_handler = RecordingHandler(logging.ERROR)
+		self.listener = RoutingQueueListener(self.log_queue, {'queue_test': [self.handler, self.error_handler]})
+		self.logger = logging.getLogger('queue_test')
+		self.logger.propagate = False
+		self.logger.setLevel(logging.DEBUG)
+		self.logger.handlers = [DroppingQueueHandler(self.log_queue, 'queue_test')]
+
+	def tearDown(self):
+		self.logger.handlers = []
+
+	def test_queue_logging(self):
+		"""
+		Test if records are handled by the listener thread, per handler level, once stopped (flushed).
+		"""
+		self.listener.start()
+		self.logger.info('info %s', 1)
+		self.logger.error('error')
+		self.listener.stop()
+		self.assertEqual([record.getMessage() for record in self.handler.records], ['info 1', 'error'])
+		self.assertEqual([record.getMessage() for record in self.error_handler.records], ['error'])
+		self.assertEqual(self.handler.records[0].funcName, 'test_queue_logging')
+
+	def test_queue_full(self):
+		"""
+		Test if records are dropped and counted without blocking while the queue is full,
+		and the listener reports the dropped records.
+		"""
+		dropped = dropped_log_records()
+		for i in range(5):
+			self.logger.info('info %s', i)
+		self.assertEqual(dropped_log_records() - dropped, 3)
+		self.listener.start()
+		self.listener.stop()
+		self.assertEqual([record.getMessage() for record in self.handler.records],
+			['Log queue full, dropped 3 log records.', 'info 0', 'info 1'])
+
+	def test_get_logger(self):
+		"""
+		Test if configured loggers only keep the queue handler, and the listener runs.
+		"""
+		test_logger = get_logger('test')
+		self.assertEqual([type(handler) for handler in test_logger.handlers], [DroppingQueueHandler])
+		self.assertIsNotNone(logger_module._listener)
+		self.assertEqual(len(logger_module._listener.routes['test']), 3)
+
+	def test_get_logger_configures_once(self):
+		"""
+		Test if get_logger and a reload of utilities.logger keep the same handlers and listener.
+		"""
+		handlers = list(get_logger('flask_order_app').handlers)
+		listener = logger_module._listener
+		importlib.reload(logger_module)
+		self.assertEqual(logger_module.get_logger('flask_order_app').handlers, handlers)
+		self.assertIs(logger_module._listener, listener)
+
+	def test_level_overrides(self):
+		"""
+		Test if LOG_LEVEL applies to every logger, and LOG_LEVEL_<LOGGER NAME> to one logger.
+		"""
+		with patch.dict(os.environ, {'LOG_LEVEL': 'warning', 'LOG_LEVEL_FLASK_ORDER_APP': 'error'}):
+			self.assertEqual(level_overrides(['flask_order_app', 'database']),
+				{'flask_order_app': 'ERROR', 'database': 'WARNING'})
+		with patch.dict(os.environ, {}, clear=True):
+			self.assertEqual(level_overrides(['flask_order_app']), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from prometheus_client import REGISTRY
+from utilities.logger import get_logger
+from order_app.views import app
+from order_app.metrics import track_pool, observe_request
+
+logger = get_logger('test')
+
+
+class MetricsTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.client = app.test_client()
+
+	def test_metrics_view(self):
+		"""
+		Test if /metrics exposes request counts and latency per route, in Prometheus text format.
+		"""
+		before = REGISTRY.get_sample_value('order_api_requests_total',
+			{'route': 'healthcheck', 'method': 'GET', 'status': '200'}) or 0
+		self.client.get('/healthcheck')
+		resp = self.client.get('/metrics')
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.content_type.startswith('text/plain'))
+		body = resp.get_data(as_text=True)
+		self.assertIn('order_api_requests_total{method="GET",route="healthcheck",status="200"} %s' % (before + 1,), body)
+		self.assertIn('order_api_request_duration_seconds_count{route="healthcheck"}', body)
+
+	def test_observe_request_not_found(self):
+		"""
+		Test if requests without endpoint are counted under route not_found.
+		"""
+		observe_request(None, 'GET', 404, 0.001)
+		self.assertTrue(REGISTRY.get_sample_value('order_api_requests_total',
+			{'route': 'not_found', 'method': 'GET', 'status': '404'}) >= 1)
+
+	def test_track_pool(self):
+		"""
+		Test if the pool gauges follow connection checkouts and checkins, overflow beyond pool_size.
+		"""
+		engine = track_pool(create_engine('sqlite://', poolclass=QueuePool, pool_size=1, max_overflow=2))
+		first = engine.connect()
+		second = engine.connect()
+		self.assertEqual(REGISTRY.get_sample_value('order_api_db_pool_checked_out'), 2)
+		self.assertEqual(REGISTRY.get_sample_value('order_api_db_pool_overflow'), 1)
+		second.close()
+		first.close()
+		self.assertEqual(REGISTRY.get_sample_value('order_api_db_pool_checked_out'), 0)
+		self.assertEqual(REGISTRY.get_sample_value('order_api_db_pool_overflow'), 0)
+		engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
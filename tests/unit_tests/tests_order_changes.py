@@ -0,0 +1,94 @@
+import unittest, datetime, threading, time
+from unittest.mock import patch
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from order_app.settings import app
+from order_app.order_list import encode_cursor
+from order_app.order_changes import OrderChanges, OrderChangeNotifier, encode_change_cursor, decode_change_cursor
+import order_app.views
+
+logger = get_logger('test')
+
+updated_at = datetime.datetime(2020, 3, 1, 12, 0, 0, 250000)
+
+class OrderChangesTestCase(unittest.TestCase):
+
+	def test_change_cursor(self):
+		"""
+		Test if change cursors decode to (updated_at, id), and invalid cursors raise ValueError.
+		"""
+		self.assertEqual(decode_change_cursor(encode_change_cursor(updated_at, 7)), (updated_at, 7))
+		self.assertEqual(decode_change_cursor(encode_change_cursor(updated_at.replace(microsecond=0), 7))[0], updated_at.replace(microsecond=0))
+		for token in ('not a cursor', encode_cursor({'id': 7}), encode_cursor({'updated_at': 1, 'id': 7})):
+			with self.assertRaises(ValueError):
+				decode_change_cursor(token)
+
+	@patch('order_app.order_changes.get_session')
+	def test_query_changes(self, mock_get_session):
+		"""
+		Test if changes are sought after the cursor in (updated_at, id) order, leaving unsettled changes,
+		and the next cursor points at the last change, or stays when there is none.
+		"""
+		session = mock_get_session.return_value
+		session.execute.return_value.fetchall.return_value = [(3, 30, 'TAKEN', updated_at), (9, 90, 'UNASSIGNED', updated_at)]
+		order_items, next_cursor, err_msg = OrderChanges(after=(updated_at, 2), limit=2).query_changes()
+		sql = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+		self.assertEqual('("Order".updated_at, "Order".id) > (%(param_2)s, %(param_3)s)' in sql, True)
+		self.assertEqual("\"Order\".updated_at < TIMEZONE('utc', CURRENT_TIMESTAMP) - %(param_1)s" in sql, True)
+		self.assertEqual(sql.endswith('ORDER BY "Order".updated_at, "Order".id \n LIMIT %(param_4)s'), True)
+		self.assertEqual('"Order".updated_at < coalesce((SELECT min(timezone(%(timezone_1)s, pg_stat_activity.xact_start))' in sql, True)
+		self.assertEqual('pg_stat_activity.backend_xid IS NOT NULL' in sql, True)
+		self.assertEqual('pg_stat_activity.backend_type = %(backend_type_1)s AND pg_stat_activity.application_name = %(application_name_1)s' in sql, True)
+		self.assertEqual(order_items[0], {'id': 3, 'distance': 30, 'status': 'TAKEN', 'updated_at': '2020-03-01T12:00:00.250000'})
+		self.assertEqual(decode_change_cursor(next_cursor), (updated_at, 9))
+		session.close.assert_called_with()
+
+		session.execute.return_value.fetchall.return_value = []
+		self.assertEqual(OrderChanges(after=(updated_at, 2)).query_changes(), ([], encode_change_cursor(updated_at, 2), None))
+		self.assertEqual(OrderChanges().query_changes(), ([], None, None))
+
+	def test_notifier_wait(self):
+		"""
+		Test if waiting returns on a newer notification, or False once timed out.
+		"""
+		notifier = OrderChangeNotifier()
+		generation = notifier.generation
+		self.assertEqual(notifier.wait(generation, 0.01), False)
+		threading.Timer(0.05, notifier.notify_all).start()
+		self.assertEqual(notifier.wait(generation, 5), True)
+		self.assertEqual(notifier.wait(generation, 0), True) #notified before waiting
+
+	@patch('order_app.order_changes.settings.ORDER_CHANGES_SETTLE', 0)
+	def test_long_poll(self):
+		"""
+		Test if a long-poll without changes queries again once notified, and returns right away
+		without waiting when too many requests wait already.
+		"""
+		notifier = OrderChangeNotifier(max_waiters=1)
+		change = {'id': 3, 'distance': 30, 'status': 'TAKEN', 'updated_at': updated_at.isoformat()}
+		with patch('order_app.order_changes.get_order_change_notifier', return_value=notifier), \
+			patch.object(OrderChanges, 'query_changes', side_effect=[([], None, None), ([change], 'next', None)]) as query_changes:
+			threading.Timer(0.05, notifier.notify_all).start()
+			started = time.monotonic()
+			self.assertEqual(OrderChanges(wait=10).run_order_changes(), ([change], 'next', None))
+			self.assertEqual(time.monotonic() - started < 5, True)
+			self.assertEqual(query_changes.call_count, 2)
+
+			notifier.waiters.acquire()
+			query_changes.side_effect = [([], None, None)]
+			self.assertEqual(OrderChanges(wait=10).run_order_changes(), ([], None, None))
+			notifier.waiters.release()
+
+	def test_order_changes_view(self):
+		"""
+		Test if invalid arguments are answered with 400.
+		"""
+		client = app.test_client()
+		for query_string in ('cursor=abc', 'since=yesterday', 'limit=0', 'limit=100000', 'wait=-1', 'wait=3600'):
+			self.assertEqual(client.get('/orders/changes?%s' % (query_string,)).status_code, 400)
+		with patch.object(OrderChanges, 'run_order_changes', return_value=([], 'next', None)) as run_order_changes:
+			response = client.get('/orders/changes?since=2020-03-01&wait=1')
+			self.assertEqual(response.get_json(), {'orders': [], 'next_cursor': 'next'})
+
+if __name__ == '__main__':
+    unittest.main()
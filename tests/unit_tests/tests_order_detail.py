@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import Mock, patch
+from prometheus_client import REGISTRY
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from order_app.order_detail import OrderDetail, order_cache
+from order_app.take_order import TakeOrder
+
+logger = get_logger('test')
+
+
+class OrderDetailTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Mock the database sessions of order_app.order_detail and order_app.take_order.
+		"""
+		cls.mock_get_session_patcher = patch('order_app.order_detail.get_session')
+		cls.mock_get_session = cls.mock_get_session_patcher.start()
+		cls.mock_take_get_session_patcher = patch('order_app.take_order.get_session')
+		cls.mock_take_get_session = cls.mock_take_get_session_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.mock_get_session_patcher.stop()
+		cls.mock_take_get_session_patcher.stop()
+
+	def setUp(self):
+		order_cache.clear()
+		self.session = Mock()
+		self.session.execute.return_value.fetchone.return_value = (7, 1000, 'UNASSIGNED', None)
+		self.mock_get_session.return_value = self.session
+
+	def cache_requests(self, result):
+		return REGISTRY.get_sample_value('order_api_order_cache_requests_total', {'result': result}) or 0
+
+	def test_read_through(self):
+		"""
+		Test if the order is queried once, then served from the cache, and hits are counted.
+		"""
+		hits = self.cache_requests('hit')
+		for i in range(3):
+			order_item, err_msg = OrderDetail(order_id=7).run_order_detail()
+			self.assertEqual(order_item, {'id': 7, 'distance': 1000, 'status': 'UNASSIGNED'})
+			self.assertIsNone(err_msg)
+		self.assertEqual(self.session.execute.call_count, 1)
+		self.assertEqual(self.cache_requests('hit') - hits, 2)
+
+	def test_not_found_not_cached(self):
+		"""
+		Test if orders that do not exist are queried every time.
+		"""
+		self.session.execute.return_value.fetchone.return_value = None
+		for i in range(2):
+			self.assertEqual(OrderDetail(order_id=8).run_order_detail(), (None, None))
+		self.assertEqual(order_cache.get(8), None)
+
+	def test_queued_order(self):
+		"""
+		Test if queued orders are returned with distance None, and the error of FAILED ones.
+		"""
+		self.session.execute.return_value.fetchone.return_value = (9, None, 'FAILED', 'Distance cannot be retrieved.')
+		order_item, err_msg = OrderDetail(order_id=9).query_order()
+		self.assertEqual(order_item, {'id': 9, 'distance': None, 'status': 'FAILED', 'error': 'Distance cannot be retrieved.'})
+
+	def test_order_query_one_statement(self):
+		"""
+		Test if Order and OrderIngestQueue are read in one statement, Order first.
+		"""
+		sql = str(OrderDetail(order_id=7).order_query().compile(dialect=postgresql.dialect()))
+		self.assertIn('UNION ALL', sql)
+		self.assertLess(sql.index('FROM "Order"'), sql.index('FROM "OrderIngestQueue"'))
+		self.assertIn('ORDER BY found.source', sql)
+		self.session.execute.return_value.fetchone.return_value = (7, 1000, 'UNASSIGNED', None)
+		OrderDetail(order_id=7).query_order()
+		self.assertEqual(self.session.execute.call_count, 1)
+
+	def test_take_order_invalidates(self):
+		"""
+		Test if taking the order drops it from the cache.
+		"""
+		OrderDetail(order_id=7).run_order_detail()
+		take_session = Mock()
+		take_session.execute.return_value.fetchone.return_value = (7, 'TAKEN')
+		self.mock_take_get_session.return_value = take_session
+		request = Mock()
+		request.json = {'status': 'TAKEN'}
+		success, err_msg = TakeOrder(order_id=7, request=request).run_take_order()
+		self.assertEqual(success, True)
+		self.assertEqual(order_cache.get(7), None)
+
+if __name__ == '__main__':
+    unittest.main()
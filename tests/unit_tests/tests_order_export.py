@@ -0,0 +1,98 @@
+import unittest, datetime, json
+from unittest.mock import Mock, patch
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from order_app.settings import app
+from order_app.order_export import OrderExport, parse_since
+import order_app.views
+
+logger = get_logger('test')
+
+created_at = datetime.datetime(2020, 3, 1, 12, 0, 0)
+
+class OrderExportTestCase(unittest.TestCase):
+
+	rows = [(order_id, order_id * 10, 'UNASSIGNED', created_at, created_at) for order_id in range(1, 6)]
+
+	def fake_result(self):
+		"""
+		Result of a server-side cursor, fetched 2 rows at a time.
+		"""
+		result = Mock()
+		result.fetchmany.side_effect = [self.rows[0:2], self.rows[2:4], self.rows[4:], []]
+		return result
+
+	def test_parse_since(self):
+		"""
+		Test if dates and datetimes are parsed, and anything else raises ValueError.
+		"""
+		self.assertEqual(parse_since('2020-03-01'), datetime.datetime(2020, 3, 1))
+		self.assertEqual(parse_since('2020-03-01T12:30:00Z'), datetime.datetime(2020, 3, 1, 12, 30))
+		self.assertEqual(parse_since('2020-03-01T12:30:00.5'), datetime.datetime(2020, 3, 1, 12, 30, 0, 500000))
+		with self.assertRaises(ValueError):
+			parse_since('yesterday')
+
+	def test_export_query(self):
+		"""
+		Test if filters apply only when given, ordered by (updated_at, id) with since.
+		"""
+		sql = str(OrderExport().export_query().compile(dialect=postgresql.dialect()))
+		self.assertEqual('WHERE' in sql, False)
+		self.assertEqual(sql.endswith('ORDER BY "Order".id'), True)
+		sql = str(OrderExport(status='TAKEN', since=created_at).export_query().compile(dialect=postgresql.dialect()))
+		self.assertEqual('"Order".status = %(status_1)s AND "Order".updated_at >= %(updated_at_1)s' in sql, True)
+		self.assertEqual(sql.endswith('ORDER BY "Order".updated_at, "Order".id'), True)
+
+	def test_generate(self):
+		"""
+		Test if every fetched chunk is encoded into one ndjson or csv chunk.
+		"""
+		chunks = list(OrderExport(export_format='ndjson').generate(self.fake_result()))
+		self.assertEqual(len(chunks), 3)
+		lines = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+		self.assertEqual([line['id'] for line in lines], [1, 2, 3, 4, 5])
+		self.assertEqual(lines[0], {'id': 1, 'distance': 10, 'status': 'UNASSIGNED',
+			'created_at': '2020-03-01T12:00:00', 'updated_at': '2020-03-01T12:00:00'})
+
+		chunks = list(OrderExport(export_format='csv').generate(self.fake_result()))
+		lines = b''.join(chunks).decode('utf-8').splitlines()
+		self.assertEqual(lines[0], 'id,distance,status,created_at,updated_at')
+		self.assertEqual(lines[1], '1,10,UNASSIGNED,2020-03-01T12:00:00,2020-03-01T12:00:00')
+		self.assertEqual(len(lines), 6)
+
+	@patch('order_app.order_export.get_session')
+	def test_run_order_export(self, mock_get_session):
+		"""
+		Test if the query runs on a server-side cursor, and the session is closed if it fails.
+		"""
+		session = mock_get_session.return_value
+		session.connection.return_value.execute.return_value = self.fake_result()
+		export, export_session, err_msg = OrderExport().run_order_export()
+		session.connection.assert_called_with(execution_options={'stream_results': True})
+		self.assertEqual((export_session, err_msg), (session, None))
+		self.assertEqual(len(list(export)), 3)
+
+		session.connection.return_value.execute.side_effect = Exception('connection refused')
+		self.assertEqual(OrderExport().run_order_export(), (None, None, "Orders cannot be exported."))
+		session.close.assert_called_with()
+
+	def test_order_export_view(self):
+		"""
+		Test if the export is streamed unbuffered by nginx, and the session is closed once sent.
+		"""
+		session = Mock()
+		client = app.test_client()
+		with patch.object(order_app.views.OrderExport, 'run_order_export',
+			return_value=(OrderExport(export_format='csv').generate(self.fake_result()), session, None)):
+			response = client.get('/orders/export?format=csv&status=UNASSIGNED&since=2020-03-01')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response.mimetype, 'text/csv')
+			self.assertEqual(response.headers['X-Accel-Buffering'], 'no')
+			self.assertEqual(len(response.get_data().splitlines()), 6)
+			response.close()
+			session.close.assert_called_with()
+		for query_string in ('format=xml', 'status=PENDING', 'since=yesterday'):
+			self.assertEqual(client.get('/orders/export?%s' % (query_string,)).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from unittest.mock import Mock, patch
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from order_app.order_ingest import OrderIngestWorker
+from order_app.place_order import PlaceOrder
+
+logger = get_logger('test')
+
+
+class OrderIngestTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Mock the database sessions of order_app.order_ingest and order_app.place_order,
+		and the batched distance lookups.
+		"""
+		cls.mock_get_session_patcher = patch('order_app.order_ingest.get_session')
+		cls.mock_get_session = cls.mock_get_session_patcher.start()
+		cls.mock_place_get_session_patcher = patch('order_app.place_order.get_session')
+		cls.mock_place_get_session = cls.mock_place_get_session_patcher.start()
+		cls.mock_get_distances_patcher = patch('order_app.order_ingest.PlaceBulkOrders.get_distances')
+		cls.mock_get_distances = cls.mock_get_distances_patcher.start()
+		cls.mock_mode_patcher = patch('order_app.place_order.ORDER_INGEST_MODE', 'async')
+		cls.mock_mode_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.mock_get_session_patcher.stop()
+		cls.mock_place_get_session_patcher.stop()
+		cls.mock_get_distances_patcher.stop()
+		cls.mock_mode_patcher.stop()
+
+	def setUp(self):
+		self.session = Mock()
+		self.mock_get_session.return_value = self.session
+		self.worker = OrderIngestWorker(batch_size=10, poll_interval=0, max_attempts=3)
+		self.origin = (22.3, 114.1)
+		self.destination = (22.4, 114.2)
+		self.other_destination = (22.5, 114.3)
+
+	def test_run_place_order_async(self):
+		"""
+		Test if the order is queued with an id reserved from the Order sequence, and returned PENDING.
+		"""
+		session = Mock()
+		session.execute.return_value.scalar.return_value = 42
+		self.mock_place_get_session.return_value = session
+		request = Mock()
+		request.json = {'origin': ['22.3', '114.1'], 'destination': ['22.4', '114.2']}
+		new_order_item, err_msg = PlaceOrder(request=request).run_place_order()
+		self.assertEqual(new_order_item, {'id': 42, 'distance': None, 'status': 'PENDING'})
+		self.assertIsNone(err_msg)
+		queued = session.add.call_args[0][0]
+		self.assertEqual(queued.id, 42)
+		self.assertEqual(queued.payload, {'origin': [22.3, 114.1], 'destination': [22.4, 114.2]})
+		session.commit.assert_called_once_with()
+
+	def test_process_batch(self):
+		"""
+		Test if queued orders are claimed in a short transaction committed before the distance lookups,
+		then orders with distances are inserted and dequeued, and the others released, with one lookup per distinct pair.
+		"""
+		self.session.execute.return_value.fetchall.return_value = [
+			(3, {'origin': list(self.origin), 'destination': list(self.other_destination)}),
+			(1, {'origin': list(self.origin), 'destination': list(self.destination)}),
+			(2, {'origin': list(self.origin), 'destination': list(self.destination)}),
+		]
+		commits_before_lookup = []
+		def get_distances(pairs):
+			commits_before_lookup.append(self.session.commit.call_count)
+			return {(self.origin, self.destination): 1000}
+		self.mock_get_distances.side_effect = get_distances
+		try:
+			self.assertEqual(self.worker.process_batch(), 2)
+		finally:
+			self.mock_get_distances.side_effect = None
+		self.mock_get_distances.assert_called_once_with([(self.origin, self.destination), (self.origin, self.other_destination)])
+		self.assertEqual(commits_before_lookup, [1])
+		statements = [str(call[0][0].compile(dialect=postgresql.dialect())) for call in self.session.execute.call_args_list]
+		self.assertTrue(statements[0].startswith('UPDATE "OrderIngestQueue"')) #expired claims out of attempts
+		self.assertIn('FOR UPDATE SKIP LOCKED', statements[1])
+		self.assertIn('attempts=("OrderIngestQueue".attempts +', statements[1])
+		self.assertTrue(statements[2].startswith('INSERT INTO "Order"'))
+		self.assertIn('ON CONFLICT (id) DO NOTHING', statements[2])
+		self.assertTrue(statements[3].startswith('DELETE FROM "OrderIngestQueue"'))
+		self.assertTrue(statements[4].startswith('UPDATE "OrderIngestQueue"'))
+		self.assertIn('CASE WHEN ("OrderIngestQueue".attempts >=', statements[4])
+		self.assertEqual(self.session.commit.call_count, 2)
+
+	def test_process_batch_empty(self):
+		"""
+		Test if an empty queue inserts nothing, without distance lookups.
+		"""
+		self.mock_get_distances.reset_mock()
+		self.session.execute.return_value.fetchall.return_value = []
+		self.assertEqual(self.worker.process_batch(), 0)
+		self.mock_get_distances.assert_not_called()
+
+	def test_process_batch_claim_fails(self):
+		"""
+		Test if the claim is rolled back and the orders stay queued on database errors.
+		"""
+		self.session.execute.side_effect = Exception('database is down')
+		self.assertEqual(self.worker.process_batch(), 0)
+		self.session.rollback.assert_called_once_with()
+		self.session.close.assert_called_once_with()
+
+	def test_process_batch_release(self):
+		"""
+		Test if claimed orders are released with the error when the batch fails for any other reason than a missing distance,
+		so they are not retried forever.
+		"""
+		self.session.execute.return_value.fetchall.return_value = [(1, {'origin': list(self.origin), 'destination': list(self.destination)})]
+		self.mock_get_distances.side_effect = ValueError('unexpected response')
+		try:
+			self.assertEqual(self.worker.process_batch(), 0)
+		finally:
+			self.mock_get_distances.side_effect = None
+		release = self.session.execute.call_args_list[-1][0][0]
+		sql = str(release.compile(dialect=postgresql.dialect()))
+		self.assertTrue(sql.startswith('UPDATE "OrderIngestQueue"'))
+		self.assertIn('CASE WHEN ("OrderIngestQueue".attempts >=', sql)
+		self.assertIn('unexpected response', release.compile(dialect=postgresql.dialect()).params['last_error'])
+		self.assertEqual(self.session.commit.call_count, 2) #claim, release
+
+if __name__ == '__main__':
+    unittest.main()
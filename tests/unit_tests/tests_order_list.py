@@ -0,0 +1,207 @@
+import unittest, datetime
+from unittest.mock import Mock, patch
+from sqlalchemy.dialects import postgresql
+from utilities.logger import get_logger
+from order_app.settings import app
+from order_app.order_list import OrderList, encode_cursor, decode_cursor, order_count_cache
+import order_app.views
+
+logger = get_logger('test')
+
+class OrderListTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Start all mocking necessary for testing.
+		"""
+		#start mocking the Order model (flask-sqlalchemy query) in order_app.order_list
+		cls.mock_order_patcher = patch('order_app.order_list.Order')
+		cls.mock_order = cls.mock_order_patcher.start()
+		cls.mock_order.id.__lt__.return_value = Mock() #filter criterion Order.id < after_id
+		#start mocking flask-sqlalchemy db (count estimate, validators) in order_app.order_list
+		cls.mock_db_patcher = patch('order_app.order_list.db')
+		cls.mock_db = cls.mock_db_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		"""
+		Terminal all mocking.
+		"""
+		cls.mock_order_patcher.stop()
+		cls.mock_db_patcher.stop()
+
+	def test_cursor(self):
+		"""
+		Test if cursor tokens decode to the encoded values, and invalid tokens raise ValueError.
+		"""
+		token = encode_cursor({'id': 123})
+		self.assertEqual('=' in token, False)
+		self.assertEqual(decode_cursor(token), {'id': 123})
+		with self.assertRaises(ValueError):
+			decode_cursor('not a cursor')
+		with self.assertRaises(ValueError):
+			decode_cursor(encode_cursor([1]))
+
+	def test_query_keyset_orders(self):
+		"""
+		Test if the next cursor is returned only when there are more orders than limit.
+		"""
+		orders = [(5, 100, 'UNASSIGNED'), (4, 200, 'TAKEN'), (3, 300, 'UNASSIGNED')]
+		order_query = self.mock_order.query.with_entities.return_value.filter.return_value
+		order_query.order_by.return_value.limit.return_value.all.return_value = orders
+		order_items, next_cursor, err_msg = OrderList(limit=2, after_id=6).query_keyset_orders()
+		self.assertEqual(err_msg, None)
+		self.assertEqual(order_items, [{'id': 5, 'distance': 100, 'status': 'UNASSIGNED'}, {'id': 4, 'distance': 200, 'status': 'TAKEN'}])
+		self.assertEqual(decode_cursor(next_cursor), {'id': 4})
+		order_query.order_by.return_value.limit.assert_called_with(3)
+
+		order_query.order_by.return_value.limit.return_value.all.return_value = orders[2:]
+		order_items, next_cursor, err_msg = OrderList(limit=2, after_id=4).query_keyset_orders()
+		self.assertEqual(len(order_items), 1)
+		self.assertEqual(next_cursor, None)
+
+	def test_order_query_status(self):
+		"""
+		Test if orders are filtered only when status is given.
+		"""
+		self.mock_order.query.with_entities.return_value.filter.reset_mock()
+		OrderList(limit=2).order_query()
+		self.assertEqual(self.mock_order.query.with_entities.return_value.filter.call_count, 0)
+		OrderList(limit=2, status='UNASSIGNED').order_query()
+		self.assertEqual(self.mock_order.query.with_entities.return_value.filter.call_count, 1)
+
+	def test_query_paginated_orders(self):
+		"""
+		Test if a page is fetched with limit + 1 and offset, without counting orders.
+		"""
+		orders = [(5, 100, 'UNASSIGNED'), (4, 200, 'TAKEN'), (3, 300, 'UNASSIGNED')]
+		order_query = self.mock_order.query.with_entities.return_value.order_by.return_value
+		order_query.limit.return_value.offset.return_value.all.return_value = orders
+		order_items, err_msg = OrderList(page=3, limit=2).query_paginated_orders()
+		self.assertEqual(err_msg, None)
+		self.assertEqual(order_items, [{'id': 5, 'distance': 100, 'status': 'UNASSIGNED'}, {'id': 4, 'distance': 200, 'status': 'TAKEN'}])
+		order_query.limit.assert_called_with(3)
+		order_query.limit.return_value.offset.assert_called_with(4)
+		self.assertEqual(order_query.count.call_count, 0)
+		self.assertEqual(OrderList(page=0, limit=2).query_paginated_orders(), ([], None))
+
+	@patch('order_app.order_list.JSON_STREAM_CHUNK', 2)
+	@patch('order_app.order_list.get_session')
+	def test_stream_paginated_orders(self, mock_get_session):
+		"""
+		Test if a large page is read from a server-side cursor of its own session, JSON_STREAM_CHUNK rows at a time.
+		"""
+		session = mock_get_session.return_value
+		connection = session.connection.return_value
+		connection.execute.return_value.fetchmany.side_effect = [[(5, 100, 'UNASSIGNED'), (4, 200, 'TAKEN')], [(3, 300, 'UNASSIGNED')], []]
+		order_items, stream_session, err_msg = OrderList(page=3, limit=3).stream_paginated_orders()
+		self.assertEqual((stream_session, err_msg), (session, None))
+		session.connection.assert_called_with(execution_options={'stream_results': True})
+		order_query = self.mock_order.query.with_entities.return_value.with_session.return_value.order_by.return_value
+		order_query.limit.assert_called_with(3)
+		order_query.limit.return_value.offset.assert_called_with(6)
+		self.assertEqual(list(order_items), [
+			[{'id': 5, 'distance': 100, 'status': 'UNASSIGNED'}, {'id': 4, 'distance': 200, 'status': 'TAKEN'}],
+			[{'id': 3, 'distance': 300, 'status': 'UNASSIGNED'}]
+		])
+		connection.execute.return_value.fetchmany.assert_called_with(2)
+		session.close.assert_not_called() #closed by the response once sent
+		self.assertEqual(OrderList(page=0, limit=3).stream_paginated_orders(), ([], None, None))
+		connection.execute.side_effect = Exception('connection refused')
+		try:
+			self.assertEqual(OrderList(page=1, limit=3).stream_paginated_orders(), (None, None, "Orders cannot be queried."))
+		finally:
+			connection.execute.side_effect = None
+		session.close.assert_called_once_with()
+
+	@patch('order_app.views.JSON_STREAM_MIN_ITEMS', 3)
+	def test_order_list_view_stream(self):
+		"""
+		Test if GET /orders streams pages of at least JSON_STREAM_MIN_ITEMS orders, and closes their session once sent.
+		"""
+		session = Mock()
+		chunks = iter([[{'id': 5, 'distance': 100, 'status': 'UNASSIGNED'}], [{'id': 4, 'distance': 200, 'status': 'TAKEN'}]])
+		with patch.object(order_app.views.OrderList, 'list_validators', return_value=('a-1', None, None)), \
+			patch.object(order_app.views.OrderList, 'stream_paginated_orders', return_value=(chunks, session, None)), \
+			patch.object(order_app.views.OrderList, 'total_count', return_value=(2, None)):
+			response = app.test_client().get('/orders?page=1&limit=3')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response.is_streamed, True)
+			self.assertEqual(response.get_json(), [{'id': 5, 'distance': 100, 'status': 'UNASSIGNED'}, {'id': 4, 'distance': 200, 'status': 'TAKEN'}])
+			self.assertEqual((response.headers['ETag'], response.headers['X-Total-Count']), ('"a-1"', '2'))
+			response.close()
+		session.close.assert_called_once_with()
+
+	def test_total_count(self):
+		"""
+		Test if the estimate is used for large unfiltered tables, exact count otherwise, and counts are cached.
+		"""
+		order_count_cache.clear()
+		self.mock_db.session.execute.return_value.scalar.return_value = 10 ** 7
+		self.assertEqual(OrderList(page=1, limit=2).total_count(), (10 ** 7, None))
+
+		order_count_cache.clear()
+		self.mock_db.session.execute.return_value.scalar.return_value = 10
+		exact_count = self.mock_order.query.with_entities.return_value.order_by.return_value.count
+		exact_count.return_value = 12
+		self.assertEqual(OrderList(page=1, limit=2).total_count(), (12, None))
+
+		count = self.mock_order.query.with_entities.return_value.filter.return_value.order_by.return_value.count
+		count.reset_mock()
+		count.return_value = 7
+		self.assertEqual(OrderList(page=1, limit=2, status='TAKEN').total_count(), (7, None))
+		self.assertEqual(OrderList(page=2, limit=2, status='TAKEN').total_count(), (7, None))
+		self.assertEqual(count.call_count, 1)
+
+	def test_list_validators(self):
+		"""
+		Test if the ETag changes with max(id) and max(updated_at), and an empty table has an ETag too.
+		No validators are returned while a transaction started before max(updated_at) may still commit orders.
+		"""
+		updated_at = datetime.datetime(2020, 1, 1, 12, 0, 0, 123456)
+		self.mock_db.session.query.return_value.one.return_value = (updated_at, 10, True)
+		etag, last_modified, err_msg = OrderList(limit=2).list_validators()
+		self.assertEqual((last_modified, err_msg), (updated_at, None))
+		self.mock_db.session.query.return_value.one.return_value = (updated_at, 11, True)
+		self.assertNotEqual(OrderList(limit=2).list_validators()[0], etag)
+		self.mock_db.session.query.return_value.one.return_value = (updated_at + datetime.timedelta(microseconds=1), 10, True)
+		self.assertNotEqual(OrderList(limit=2).list_validators()[0], etag)
+		self.mock_db.session.query.return_value.one.return_value = (None, None, None)
+		self.assertEqual(OrderList(limit=2).list_validators(), ('empty', None, None))
+		self.mock_db.session.query.return_value.one.return_value = (updated_at, 10, False)
+		self.assertEqual(OrderList(limit=2).list_validators(), (None, None, None))
+		settled = self.mock_db.session.query.call_args[0][2].compile(dialect=postgresql.dialect())
+		self.assertIn(") < least(TIMEZONE('utc', CURRENT_TIMESTAMP) - ", str(settled))
+		self.assertIn('pg_stat_activity.backend_xid IS NOT NULL', str(settled))
+
+	def test_conditional_list_response(self):
+		"""
+		Test if GET /orders answers 304 without querying orders when the ETag or Last-Modified matches.
+		"""
+		updated_at = datetime.datetime(2020, 1, 1, 12, 0, 0, 123456)
+		with patch.object(order_app.views.OrderList, 'list_validators', return_value=('a-1', updated_at, None)), \
+			patch.object(order_app.views.OrderList, 'query_paginated_orders', return_value=([], None)) as query_orders, \
+			patch.object(order_app.views.OrderList, 'total_count', return_value=(0, None)):
+			client = app.test_client()
+			response = client.get('/orders?page=1&limit=2')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response.headers['ETag'], '"a-1"')
+			self.assertEqual(response.headers['X-Total-Count'], '0')
+			response = client.get('/orders?page=1&limit=2', headers={'If-None-Match': '"a-1"'})
+			self.assertEqual(response.status_code, 304)
+			self.assertEqual(response.data, b'')
+			response = client.get('/orders?page=1&limit=2', headers={'If-Modified-Since': 'Wed, 01 Jan 2020 12:00:00 GMT'})
+			self.assertEqual(response.status_code, 304)
+			self.assertEqual(query_orders.call_count, 1)
+			response = client.get('/orders?page=1&limit=2', headers={'If-None-Match': '"a-0"'})
+			self.assertEqual(response.status_code, 200)
+		with patch.object(order_app.views.OrderList, 'list_validators', return_value=(None, None, None)), \
+			patch.object(order_app.views.OrderList, 'query_paginated_orders', return_value=([], None)), \
+			patch.object(order_app.views.OrderList, 'total_count', return_value=(0, None)):
+			response = app.test_client().get('/orders?page=1&limit=2', headers={'If-None-Match': '"a-1"'})
+			self.assertEqual(response.status_code, 200) #orders being changed
+			self.assertEqual('ETag' in response.headers, False)
+
+if __name__ == '__main__':
+    unittest.main()
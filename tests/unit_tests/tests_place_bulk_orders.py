@@ -0,0 +1,111 @@
+import unittest, json, os
+from unittest.mock import Mock, patch
+from utilities.logger import get_logger
+from order_app.settings import TEST_DIR
+from order_app.place_bulk_orders import PlaceBulkOrders, plan_matrix_requests
+from order_app.distance_cache import LocalDistanceCache
+
+logger = get_logger('test')
+
+class PlaceBulkOrdersTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Initialize args for PlaceBulkOrders, with predefinitions in json file.
+		Start all mocking necessary for testing.
+		"""
+		with open(os.path.join(TEST_DIR, 'support', 'gmap_distance_matrix_api_resp.json')) as f:
+			cls.predefined_gmap_resp = json.loads(f.read())
+		cls.origins = cls.predefined_gmap_resp['success']['request_body']['origins']
+		cls.destinations = cls.predefined_gmap_resp['success']['request_body']['destinations']
+		cls.distance = cls.predefined_gmap_resp['success']['response_body']['rows'][0]['elements'][0]['distance']['value']
+
+		#start mocking the Distance Matrix client in order_app.place_bulk_orders
+		cls.mock_client_patcher = patch('order_app.place_bulk_orders.get_distance_matrix_client')
+		cls.mock_client = cls.mock_client_patcher.start()
+
+		#start mocking the distance cache in order_app.place_bulk_orders
+		cls.mock_cache_patcher = patch('order_app.place_bulk_orders.get_distance_cache')
+		cls.mock_cache = cls.mock_cache_patcher.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		"""
+		Terminal all mocking.
+		"""
+		cls.mock_client_patcher.stop()
+		cls.mock_cache_patcher.stop()
+
+	def setUp(self):
+		self.mock_cache.return_value = LocalDistanceCache(max_size=100, ttl=60)
+		self.mock_client.return_value = Mock()
+		self.mock_client.return_value.get_matrix.return_value = self.predefined_gmap_resp['success']['response_body']
+
+	def test_plan_matrix_requests(self):
+		"""
+		Test if pairs are grouped into few requests within the API limits, covering all pairs.
+		"""
+		pairs = [((i, 0), (j, 1)) for i in range(30) for j in range(3)] + [((0, 0), (99, 1))]
+		plan = plan_matrix_requests(pairs)
+		covered = set()
+		for origins, destinations in plan:
+			self.assertTrue(len(origins) <= 25 and len(destinations) <= 25)
+			self.assertTrue(len(origins) * len(destinations) <= 100)
+			covered.update((origin, destination) for origin in origins for destination in destinations)
+		self.assertTrue(set(pairs) <= covered)
+		self.assertEqual(len(plan), 2) #30 origins need 2 requests of at most 25 origins
+		self.assertEqual(len(plan_matrix_requests([(('1', '1'), ('2', '2'))] * 3)), 1)
+		self.assertEqual(plan_matrix_requests([]), [])
+
+	def test_run_place_bulk_orders(self):
+		"""
+		Test if each order gets its own result, duplicated pairs are requested once,
+		and valid orders are inserted together.
+		"""
+		mock_request = Mock()
+		mock_request.json = [
+			{'origin': self.origins, 'destination': self.destinations},
+			{'origin': ["1", "1", "1"], 'destination': ["1", "1"]},
+			{'origin': ["91", "1"], 'destination': ["1", "1"]},
+			{'origin': self.origins, 'destination': self.destinations}
+		]
+		orders = PlaceBulkOrders(request=mock_request)
+		new_order_items = [{'id': 1, 'distance': self.distance, 'status': 'UNASSIGNED'},
+			{'id': 2, 'distance': self.distance, 'status': 'UNASSIGNED'}]
+		with patch.object(orders, 'insert_new_orders', return_value=(new_order_items, None)) as mock_insert:
+			results, err_msg = orders.run_place_bulk_orders()
+		self.assertEqual(err_msg, None)
+		self.assertEqual(results[0], new_order_items[0])
+		self.assertEqual(results[3], new_order_items[1])
+		self.assertEqual(list(results[1]), ['error'])
+		self.assertEqual(list(results[2]), ['error'])
+		mock_insert.assert_called_once_with([self.distance, self.distance])
+		self.assertEqual(self.mock_client.return_value.get_matrix.call_count, 1)
+
+	def test_run_place_bulk_orders_invalid(self):
+		"""
+		Test if a request body that is not a list of orders is rejected.
+		"""
+		mock_request = Mock()
+		mock_request.json = {'origin': self.origins, 'destination': self.destinations}
+		results, err_msg = PlaceBulkOrders(request=mock_request).run_place_bulk_orders()
+		self.assertEqual(results, None)
+		self.assertEqual(err_msg is not None, True)
+	def test_get_distances_batched_cache(self):
+		"""
+		Test if the cache is read with one get_many and written with one set_many, not once per pair.
+		"""
+		cache = Mock(wraps=LocalDistanceCache(max_size=100, ttl=60))
+		self.mock_cache.return_value = cache
+		pairs = [(tuple(self.origins), tuple(self.destinations))]
+		orders = PlaceBulkOrders(request=None)
+		distances = orders.get_distances(pairs)
+		self.assertEqual(distances[pairs[0]], self.distance)
+		self.assertEqual((cache.get_many.call_count, cache.set_many.call_count, cache.get.call_count, cache.set.call_count), (1, 1, 0, 0))
+		orders.get_distances(pairs) #cached
+		self.assertEqual(cache.get_many.call_count, 2)
+		self.assertEqual(self.mock_client.return_value.get_matrix.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
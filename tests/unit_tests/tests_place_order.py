@@ -1,9 +1,12 @@
 import unittest, json, os
+import requests
 from unittest.mock import Mock, patch
 from utilities.logger import get_logger
 from order_app.settings import TEST_DIR
 from order_app.place_order import PlaceOrder
+from order_app.gmap_client import DistanceMatrixClient
 from order_app import place_order
+from order_app.distance_cache import LocalDistanceCache
 
 logger = get_logger('test')
 
@@ -23,22 +26,20 @@ class PlaceOrderTestCase(unittest.TestCase):
 		cls.origins = cls.predefined_gmap_resp['success']['request_body']['origins']
 		cls.destinations = cls.predefined_gmap_resp['success']['request_body']['destinations']
 
-		#mock orm db_connect before any reference to order_app.place_order
-		#start mocking create_engine behavior in order_app.place_order.engine
-		cls.mock_engine_patcher = patch('order_app.place_order.db_connect')
-		cls.mock_engine = cls.mock_engine_patcher.start()
-
-		#start mocking sessionmaker behavior in apps.place_order
-		cls.mock_sessionmaker_patcher = patch('order_app.place_order.sessionmaker')
-		cls.mock_sessionmaker = cls.mock_sessionmaker_patcher.start()
+		#start mocking get_session behavior (pooled engine session) in order_app.place_order
+		cls.mock_get_session_patcher = patch('order_app.place_order.get_session')
+		cls.mock_get_session = cls.mock_get_session_patcher.start()
 
 		#start mocking the request object of PlceOrder
 		cls.mock_request_patcher = patch('order_app.place_order.request')
 		cls.mock_request = cls.mock_request_patcher.start()
 
-		#start mocking requests.get behavior in app.place_order
-		cls.mock_get_patcher = patch('order_app.place_order.requests.get')
-		cls.mock_get = cls.mock_get_patcher.start()
+		#start mocking the Distance Matrix client in app.place_order, with mock http session.get
+		cls.client = DistanceMatrixClient(url='https://gmap.test/distancematrix/json', key='test', max_retries=0)
+		cls.client.session = Mock()
+		cls.mock_get = cls.client.session.get
+		cls.mock_client_patcher = patch('order_app.place_order.get_distance_matrix_client', return_value=cls.client)
+		cls.mock_client_patcher.start()
 
 
 	@classmethod
@@ -46,19 +47,17 @@ class PlaceOrderTestCase(unittest.TestCase):
 		"""
 		Terminal all mocking.
 		"""
-		cls.mock_engine.stop()
-		cls.mock_sessionmaker.stop()
-		cls.mock_request.stop()
-		cls.mock_get.stop()
+		cls.mock_get_session_patcher.stop()
+		cls.mock_request_patcher.stop()
+		cls.mock_client_patcher.stop()
 
 	def setUp(self):
 		"""
 		Initialize PlaceOrder class object with valid args for success cases,
 		with invalid args for fail cases,
-		and mock engine and Session.
+		and mock session.
 		"""
-		self.mock_engine.return_value = Mock()
-		self.mock_sessionmaker.return_value = Mock()
+		self.mock_get_session.return_value = Mock()
 
 	def test_place_order_input_validation(self):
 		"""
@@ -199,7 +198,7 @@ class PlaceOrderTestCase(unittest.TestCase):
 		}
 		order = PlaceOrder(request=self.mock_request)
 		test_distance = self.predefined_gmap_resp['success']['response_body']['rows'][0]['elements'][0]['distance']['value']
-		self.mock_get.return_value = Mock()
+		self.mock_get.return_value = Mock(status_code=200)
 		self.mock_get.return_value.json.return_value = self.predefined_gmap_resp['success']['response_body']
 		order.origin_lat, order.origin_lng = float(self.origins[0]), float(self.origins[1])
 		order.destination_lat, order.destination_lng = float(self.destinations[0]), float(self.destinations[1])
@@ -222,6 +221,83 @@ class PlaceOrderTestCase(unittest.TestCase):
 		self.assertEqual(distance, None)
 		self.assertEqual(err_msg is not None, True)
 
+	def test_get_distance_cached(self):
+		"""
+		Test if get_distance requests Google Map Distance Matrix API only once for the same origin and destination.
+		"""
+		self.mock_request.json = {
+			'origin': self.origins,
+			'destination': self.destinations
+		}
+		test_distance = self.predefined_gmap_resp['success']['response_body']['rows'][0]['elements'][0]['distance']['value']
+		self.mock_get.reset_mock()
+		self.mock_get.return_value = Mock(status_code=200)
+		self.mock_get.return_value.json.return_value = self.predefined_gmap_resp['success']['response_body']
+		with patch('order_app.place_order.get_distance_cache', return_value=LocalDistanceCache(max_size=10, ttl=60)):
+			for i in range(2):
+				order = PlaceOrder(request=self.mock_request)
+				order.origin_lat, order.origin_lng = float(self.origins[0]), float(self.origins[1])
+				order.destination_lat, order.destination_lng = float(self.destinations[0]), float(self.destinations[1])
+				distance, err_msg = order.get_distance()
+				self.assertEqual(distance, test_distance)
+				self.assertEqual(err_msg, None)
+		self.assertEqual(self.mock_get.call_count, 1)
+
+	def test_get_distance_haversine(self):
+		"""
+		Test if get_distance estimates the distance locally with DISTANCE_STRATEGY 'haversine'.
+		"""
+		self.mock_request.json = {
+			'origin': self.origins,
+			'destination': self.destinations
+		}
+		self.mock_get.reset_mock()
+		order = PlaceOrder(request=self.mock_request)
+		order.origin_lat, order.origin_lng = float(self.origins[0]), float(self.origins[1])
+		order.destination_lat, order.destination_lng = float(self.destinations[0]), float(self.destinations[1])
+		with patch('order_app.place_order.DISTANCE_STRATEGY', 'haversine'):
+			distance, err_msg = order.get_distance()
+		self.assertEqual(err_msg, None)
+		self.assertEqual(distance, 3149) #great-circle, shorter than the road distance 4105
+		self.assertEqual(self.mock_get.call_count, 0)
+
+	def test_get_distance_fallback(self):
+		"""
+		Test if get_distance falls back to the local estimate only with DISTANCE_STRATEGY 'gmap_with_fallback'
+		when Google Map Distance Matrix API times out.
+		"""
+		self.mock_request.json = {
+			'origin': self.origins,
+			'destination': self.destinations
+		}
+		order = PlaceOrder(request=self.mock_request)
+		order.origin_lat, order.origin_lng = float(self.origins[0]), float(self.origins[1])
+		order.destination_lat, order.destination_lng = float(self.destinations[0]), float(self.destinations[1])
+		self.mock_get.side_effect = requests.Timeout()
+		try:
+			with patch('order_app.place_order.get_distance_cache', return_value=LocalDistanceCache(max_size=10, ttl=60)):
+				distance, err_msg = order.get_distance()
+				self.assertEqual(distance, None)
+				self.assertEqual(err_msg is not None, True)
+				with patch('order_app.place_order.DISTANCE_STRATEGY', 'gmap_with_fallback'):
+					distance, err_msg = order.get_distance()
+				self.assertEqual(err_msg, None)
+				self.assertEqual(distance, 3149)
+		finally:
+			self.mock_get.side_effect = None
+			self.client.breaker.record_success()
+
+	def test_run_place_order_zero_distance(self):
+		"""
+		Test if an order with origin equal to destination, 0 meters apart, is placed.
+		"""
+		self.mock_request.json = {'origin': self.origins, 'destination': self.origins}
+		order = PlaceOrder(request=self.mock_request)
+		with patch('order_app.place_order.DISTANCE_STRATEGY', 'haversine'), \
+			patch.object(PlaceOrder, 'insert_new_order', return_value=({'id': 1, 'distance': 0, 'status': 'UNASSIGNED'}, None)) as insert_new_order:
+			self.assertEqual(order.run_place_order(), ({'id': 1, 'distance': 0, 'status': 'UNASSIGNED'}, None))
+		insert_new_order.assert_called_once_with(0)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
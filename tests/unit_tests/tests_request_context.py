@@ -0,0 +1,56 @@
+import unittest, json
+from unittest.mock import patch
+from utilities.logger import get_logger
+from order_app.views import app
+from order_app.request_context import phase_timer, request_log_line, start_request
+
+logger = get_logger('test')
+
+
+class RequestContextTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.client = app.test_client()
+
+	def test_request_id_propagated(self):
+		"""
+		Test if X-Request-ID from nginx is echoed, and logged in the json line of the request.
+		"""
+		with patch('order_app.views.access_logger') as mock_access_logger:
+			resp = self.client.get('/healthcheck', headers={'X-Request-ID': 'abc-123'})
+		self.assertEqual(resp.headers['X-Request-ID'], 'abc-123')
+		line = json.loads(mock_access_logger.info.call_args[0][0])
+		self.assertEqual(line['request_id'], 'abc-123')
+		self.assertEqual(line['path'], '/healthcheck')
+		self.assertEqual(line['status'], 200)
+		self.assertTrue(line['duration_ms'] >= 0)
+
+	def test_request_id_generated(self):
+		"""
+		Test if a request id is generated when X-Request-ID is missing or malformed.
+		"""
+		for headers in ({}, {'X-Request-ID': 'bad id'}, {'X-Request-ID': 'x' * 200}):
+			resp = self.client.get('/healthcheck', headers=headers)
+			self.assertEqual(len(resp.headers['X-Request-ID']), 32)
+
+	def test_phase_timer(self):
+		"""
+		Test if phase timings add up per phase within a request, and are only measured outside of one.
+		"""
+		with app.test_request_context('/orders'):
+			start_request()
+			for i in range(2):
+				with phase_timer('db'):
+					pass
+			with phase_timer('validate'):
+				pass
+			line = json.loads(request_log_line(app.response_class(status=201)))
+			self.assertEqual(sorted(line['timings_ms']), ['db', 'validate'])
+			self.assertEqual(line['status'], 201)
+		with phase_timer('db') as timer:
+			pass
+		self.assertTrue(timer.elapsed_ms >= 0)
+
+if __name__ == '__main__':
+    unittest.main()
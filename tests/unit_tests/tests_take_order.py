@@ -12,14 +12,9 @@ class TakeOrderTestCase(unittest.TestCase):
 		"""
 		Start all mocking necessary for testing.
 		"""
-		#mock orm db_connect before any reference to order_app.place_order
-		#start mocking create_engine behavior in order_app.place_order.engine
-		cls.mock_engine_patcher = patch('order_app.take_order.db_connect')
-		cls.mock_engine = cls.mock_engine_patcher.start()
-
-		#start mocking sessionmaker behavior in order_app.place_order
-		cls.mock_sessionmaker_patcher = patch('order_app.take_order.sessionmaker')
-		cls.mock_sessionmaker = cls.mock_sessionmaker_patcher.start()
+		#start mocking get_session behavior (pooled engine session) in order_app.take_order
+		cls.mock_get_session_patcher = patch('order_app.take_order.get_session')
+		cls.mock_get_session = cls.mock_get_session_patcher.start()
 
 		#start mocking the request object of PlceOrder
 		cls.mock_request_patcher = patch('order_app.take_order.request')
@@ -30,9 +25,8 @@ class TakeOrderTestCase(unittest.TestCase):
 		"""
 		Terminal all mocking.
 		"""
-		cls.mock_engine.stop()
-		cls.mock_sessionmaker.stop()
-		cls.mock_request.stop()
+		cls.mock_get_session_patcher.stop()
+		cls.mock_request_patcher.stop()
 
 	def test_take_order_input_validation(self):
 		"""
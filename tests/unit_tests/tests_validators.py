@@ -0,0 +1,108 @@
+import unittest, itertools
+import jsonschema
+from utilities.logger import get_logger
+from order_app.place_order import coorindate_schema
+from order_app.take_order import status_schema
+from order_app.validators import validate_coordinates, validate_status, latlng_range_error, FastInputs
+
+logger = get_logger('test')
+
+
+def jsonschema_error(data, schema):
+	"""
+	Error message of the former Flask-Inputs JsonSchema validator, None if valid.
+	"""
+	try:
+		jsonschema.validate(data, schema)
+	except jsonschema.ValidationError as e:
+		return e.message
+	return None
+
+
+class ValidatorsTestCase(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		"""
+		Build request bodies covering every keyword of coorindate_schema.
+		"""
+		values = ['22.3', '114', '-22.3', '22.3.1', 'a', '', 22.3, None, []]
+		coordinates = [list(pair) for pair in itertools.product(values, repeat=2)]
+		coordinates += [[], ['22.3'], ['22.3', '114', '1'], ['22.3', '114', '1', '2'], '22.3, 114', None]
+		cls.bodies = [None, [], '', {}, {'origin': ['22.3', '114']}, {'destination': ['22.3', '114']}]
+		for coordinate in coordinates:
+			cls.bodies.append({'origin': coordinate, 'destination': ['22.3', '114']})
+			cls.bodies.append({'origin': ['22.3', '114'], 'destination': coordinate})
+			cls.bodies.append({'origin': coordinate, 'destination': coordinate})
+		cls.bodies.append({'origin': ['22.3', '114'], 'destination': ['22.3', '114'], 'extra': 1})
+		cls.bodies.append({'origin': ['22.3'], 'destination': ['22.3', '114'], 'extra': 1})
+
+	def test_validate_coordinates_messages(self):
+		"""
+		Test if validate_coordinates returns the same error message as jsonschema, then as the lat/lng
+		range check, for each request body.
+		"""
+		for body in self.bodies:
+			expected = jsonschema_error(body, coorindate_schema)
+			if expected is None:
+				expected = latlng_range_error(*(float(value) for value in body['origin'] + body['destination']))
+			coordinates, err_msg = validate_coordinates(body)
+			if expected is None:
+				self.assertEqual(coordinates, tuple(float(value) for value in body['origin'] + body['destination']))
+				self.assertIsNone(err_msg)
+			else:
+				self.assertIsNone(coordinates)
+				self.assertEqual(err_msg, expected, body)
+
+	def test_validate_coordinates_additional_properties(self):
+		"""
+		Test if every unexpected property is listed.
+		"""
+		body = {'origin': ['22.3', '114'], 'destination': ['22.3', '114'], 'a': 1, 'b': 2}
+		coordinates, err_msg = validate_coordinates(body)
+		self.assertTrue(err_msg.startswith('Additional properties are not allowed ('))
+		self.assertTrue(err_msg.endswith(' were unexpected)'))
+		self.assertIn("'a'", err_msg)
+		self.assertIn("'b'", err_msg)
+
+	def test_validate_coordinates_range(self):
+		"""
+		Test if coordinates out of range fail with the lat/lng range error message.
+		"""
+		coordinates, err_msg = validate_coordinates({'origin': ['95', '114'], 'destination': ['22.3', '200']})
+		self.assertIsNone(coordinates)
+		self.assertEqual(err_msg, "Wrong input, origin latitude: 95.0, destination longitude: 200.0 must be within range. "
+			"-90<=latitude<=90, -180<=longitude<= 180.")
+
+	def test_validate_status_messages(self):
+		"""
+		Test if validate_status returns the same error message as jsonschema for each request body.
+		"""
+		bodies = [{'status': 'TAKEN'}, {'status': 'taken'}, {'status': 'TAKEN '}, {'status': 1}, {'status': None},
+			{}, {'state': 'TAKEN'}, {'status': 'TAKEN', 'id': 1}, None, [], 'TAKEN']
+		for body in bodies:
+			status, err_msg = validate_status(body)
+			self.assertEqual(err_msg, jsonschema_error(body, status_schema), body)
+			self.assertEqual(status, 'TAKEN' if err_msg is None else None)
+
+	def test_fast_inputs(self):
+		"""
+		Test if FastInputs collects the error message, and keeps the parsed value.
+		"""
+		class Request():
+			json = {'status': 'TAKEN'}
+
+		class Inputs(FastInputs):
+			validator = staticmethod(validate_status)
+
+		inputs = Inputs(Request())
+		self.assertEqual(inputs.validate(), True)
+		self.assertEqual(inputs.value, 'TAKEN')
+		self.assertEqual(inputs.errors, [])
+		Request.json = {}
+		inputs = Inputs(Request())
+		self.assertEqual(inputs.validate(), False)
+		self.assertEqual(inputs.errors, ["'status' is a required property"])
+
+if __name__ == '__main__':
+    unittest.main()
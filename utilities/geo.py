@@ -0,0 +1,15 @@
+import math
+
+EARTH_RADIUS = 6371008.8 #meters, mean earth radius
+
+
+def haversine_distance(origin_lat, origin_lng, destination_lat, destination_lng):
+	"""
+	Great-circle distance in meters between origin and destination (lat, lng in degrees).
+	"""
+	origin_lat, origin_lng, destination_lat, destination_lng = map(
+		math.radians, (float(origin_lat), float(origin_lng), float(destination_lat), float(destination_lng))
+	)
+	a = math.sin((destination_lat - origin_lat) / 2) ** 2 + \
+		math.cos(origin_lat) * math.cos(destination_lat) * math.sin((destination_lng - origin_lng) / 2) ** 2
+	return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(a)))
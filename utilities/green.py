@@ -0,0 +1,32 @@
+from psycopg2 import extensions, OperationalError
+
+try: #only installed for the gevent loop of uWSGI (uwsgi-gevent.ini)
+	from gevent.socket import wait_read, wait_write
+except ImportError:
+	wait_read = wait_write = None
+
+
+def gevent_wait_callback(conn, timeout=None):
+	"""
+	Wait callback of psycopg2: wait for the socket of conn in the gevent hub,
+	so a query blocks its own greenlet instead of the whole worker.
+	"""
+	while True:
+		state = conn.poll()
+		if state == extensions.POLL_OK:
+			break
+		elif state == extensions.POLL_READ:
+			wait_read(conn.fileno(), timeout=timeout)
+		elif state == extensions.POLL_WRITE:
+			wait_write(conn.fileno(), timeout=timeout)
+		else:
+			raise OperationalError("Bad result from poll: %r" % (state,))
+
+def make_psycopg_green():
+	"""
+	Make psycopg2 cooperative with gevent, for the whole process.
+	Raise ImportError if gevent is not installed.
+	"""
+	if wait_read is None:
+		raise ImportError("gevent is required for CONCURRENCY 'gevent'.")
+	extensions.set_wait_callback(gevent_wait_callback)
@@ -1,10 +1,175 @@
 import logging.config
-import logging, json, os
+import logging.handlers
+import logging, json, os, queue, atexit, threading
+from utilities.postfork import register_postfork
 
+try: #only importable when running under uWSGI
+	import uwsgi
+except ImportError:
+	uwsgi = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+	"""
+	Put records of one logger into the bounded log queue without blocking.
+	While the queue is full, records are dropped and counted in dropped.
+	"""
+	dropped = 0
+	_dropped_lock = threading.Lock()
+
+	def __init__(self, log_queue, route):
+		super().__init__(log_queue)
+		self.route = route #name of the logger whose handlers the record goes to
+
+	def prepare(self, record):
+		record = super().prepare(record)
+		record.queue_route = self.route
+		return record
+
+	def enqueue(self, record):
+		try:
+			self.queue.put_nowait(record)
+		except queue.Full:
+			with DroppingQueueHandler._dropped_lock:
+				DroppingQueueHandler.dropped += 1
+
+
+class RoutingQueueListener(logging.handlers.QueueListener):
+	"""
+	Background thread handing queued records to the handlers configured for the logger
+	they came from (routes: logger name -> handlers), so disk I/O never runs on the request thread.
+	"""
+
+	def __init__(self, log_queue, routes):
+		super().__init__(log_queue)
+		self.routes = routes
+		self.reported_dropped = DroppingQueueHandler.dropped
+
+	def handle(self, record):
+		handlers = self.routes.get(record.queue_route, ())
+		if DroppingQueueHandler.dropped > self.reported_dropped:
+			dropped = DroppingQueueHandler.dropped
+			self.dispatch(handlers, logging.makeLogRecord({
+				'name': record.queue_route, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+				'funcName': 'handle', 'request_id': '-', 'msg': "Log queue full, dropped %s log records." % (dropped - self.reported_dropped,)
+			}))
+			self.reported_dropped = dropped
+		self.dispatch(handlers, self.prepare(record))
+
+	def dispatch(self, handlers, record):
+		for handler in handlers:
+			if record.levelno >= handler.level:
+				handler.handle(record)
+
+	def enqueue_sentinel(self):
+		self.queue.put(self._sentinel) #wait for room, the listener is draining the queue
+
+
+#kept across importlib.reload() of this module, so a reload neither forgets the running
+#listener nor configures logging twice
+_log_queue = globals().get('_log_queue')
+_listener = globals().get('_listener')
+_configured = globals().get('_configured', False)
+_configure_lock = globals().get('_configure_lock') or threading.Lock()
+
+def start_queue_logging(logger_names, max_size):
+	"""
+	Move the handlers configured for logger_names behind one bounded queue of max_size records,
+	drained by a RoutingQueueListener thread.
+	"""
+	global _log_queue, _listener
+	if _log_queue is None:
+		_log_queue = queue.Queue(max_size)
+	routes = {}
+	for name in logger_names:
+		logger = logging.getLogger(name)
+		routes[name] = list(logger.handlers)
+		for handler in routes[name]:
+			logger.removeHandler(handler)
+		logger.addHandler(DroppingQueueHandler(_log_queue, name))
+	_listener = RoutingQueueListener(_log_queue, routes)
+	_listener.start()
+
+def stop_queue_logging():
+	"""
+	Flush: stop the listener thread once every queued record is handled.
+	"""
+	global _listener
+	if _listener is not None:
+		_listener.stop()
+		_listener = None
+
+def restart_queue_logging():
+	"""
+	The listener thread does not survive fork, start one in the worker with a new queue.
+	Records still queued in the parent process are left to its own listener.
+	"""
+	global _log_queue, _listener
+	if _listener is None:
+		return
+	routes = _listener.routes
+	_log_queue = queue.Queue(_log_queue.maxsize)
+	for name in routes:
+		for handler in logging.getLogger(name).handlers:
+			if isinstance(handler, logging.handlers.QueueHandler):
+				handler.queue = _log_queue
+	_listener = RoutingQueueListener(_log_queue, routes)
+	_listener.start()
+
+def dropped_log_records():
+	"""
+	Return number of log records dropped because the log queue was full.
+	"""
+	return DroppingQueueHandler.dropped
+
+def level_overrides(logger_names):
+	"""
+	Return dict of logger name -> level set with environment variables:
+	LOG_LEVEL for every logger, LOG_LEVEL_<LOGGER NAME> (e.g. LOG_LEVEL_FLASK_ORDER_APP) for one logger.
+	"""
+	levels = {}
+	for name in logger_names:
+		level = os.getenv('LOG_LEVEL_%s' % (name.upper().replace('.', '_'),)) or os.getenv('LOG_LEVEL')
+		if level:
+			levels[name] = level.upper()
+	return levels
+
+def configure_logging():
+	"""
+	Configure logging of this process with logger.json, once: later calls return immediately.
+	File handlers are created with delay, so log files are only opened on the first record written.
+	"""
+	global _configured
+	if _configured:
+		return
+	with _configure_lock:
+		if _configured:
+			return
+		with open(os.path.join(os.path.abspath(os.path.dirname(__file__)), 'logger.json')) as log_json:
+			logging_config = json.load(log_json)
+		for name, level in level_overrides(logging_config['loggers']).items():
+			logging_config['loggers'][name]['level'] = level
+		logging.config.dictConfig(logging_config)
+		start_queue_logging(logging_config['loggers'], logging_config['queue']['max_size'])
+		_configured = True
 
 def get_logger(name):
-	# get logging config file
-	with open(os.path.join(os.path.abspath(os.path.dirname(__file__)), 'logger.json')) as log_json:
-	    logging_config = json.load(log_json)
-	logging.config.dictConfig(logging_config)
-	return logging.getLogger(name)
\ No newline at end of file
+	configure_logging()
+	return logging.getLogger(name)
+
+
+#registered once, the lambdas look the functions up again in case this module was reloaded
+if not globals().get('_exit_hooks_registered'):
+	_exit_hooks_registered = True
+	#flush queued records at exit, before logging.shutdown() closes the handlers (atexit runs last in first)
+	atexit.register(lambda: stop_queue_logging())
+	if uwsgi: #uWSGI workers run uwsgi.atexit at graceful shutdown
+		_uwsgi_atexit = getattr(uwsgi, 'atexit', None)
+
+		def _flush_at_uwsgi_exit():
+			stop_queue_logging()
+			if _uwsgi_atexit:
+				_uwsgi_atexit()
+
+		uwsgi.atexit = _flush_at_uwsgi_exit
+	register_postfork(lambda: restart_queue_logging())
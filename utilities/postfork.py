@@ -0,0 +1,19 @@
+import os
+
+try: #only importable when running under uWSGI
+	from uwsgidecorators import postfork as uwsgi_postfork
+except ImportError:
+	uwsgi_postfork = None
+
+
+def register_postfork(func):
+	"""
+	Register func to run in every worker process right after it is forked.
+	uWSGI (master = true) forks workers itself without running Python's at-fork hooks,
+	so use uwsgidecorators.postfork when available, otherwise os.register_at_fork.
+	"""
+	if uwsgi_postfork:
+		uwsgi_postfork(func)
+	else:
+		os.register_at_fork(after_in_child=func)
+	return func
@@ -0,0 +1,60 @@
+import threading, time
+from collections import OrderedDict
+
+
+class TTLCache():
+	"""
+	Thread-safe in-process cache with time-to-live expiry and LRU eviction.
+	Counts hits and misses, expired entries count as misses.
+	"""
+
+	def __init__(self, max_size, ttl):
+		self.max_size = max_size
+		self.ttl = ttl #seconds
+		self.hits = 0
+		self.misses = 0
+		self._items = OrderedDict() #key -> (expires_at, value), least recently used first
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		"""
+		Return the cached value of key, or None if missing or expired.
+		"""
+		now = time.monotonic()
+		with self._lock:
+			item = self._items.get(key)
+			if item is None or item[0] <= now:
+				if item is not None:
+					del self._items[key]
+				self.misses += 1
+				return None
+			self._items.move_to_end(key)
+			self.hits += 1
+			return item[1]
+
+	def set(self, key, value):
+		"""
+		Cache value under key, evict the least recently used entries beyond max_size.
+		"""
+		with self._lock:
+			self._items[key] = (time.monotonic() + self.ttl, value)
+			self._items.move_to_end(key)
+			while len(self._items) > self.max_size:
+				self._items.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._items.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._items.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def stats(self):
+		"""
+		Return dict of size, hits and misses of the cache.
+		"""
+		with self._lock:
+			return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
@@ -1,4 +1,10 @@
+from order_app.settings import CONCURRENCY
+
+if CONCURRENCY == 'gevent': #uwsgi-gevent.ini, uWSGI monkey patches the standard library before loading this module
+	from utilities.green import make_psycopg_green
+	make_psycopg_green()
+
 from order_app.views import app
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()